@@ -1,10 +1,11 @@
 # app/__init__.py
 
-from flask import Flask, render_template
+from flask import Flask, Response, render_template
 from app.config import Config
 from flask_login import LoginManager
 from app.models import User, SurferFrame, UserProfile, SurfVideo
 from app.database import SessionLocal
+from app.media import static_relpath
 import os
 import click
 
@@ -17,10 +18,15 @@ def create_app():
     login_manager.login_view = "auth.login"
     login_manager.init_app(app)
 
+    # Request-scoped sessions (app.database.db_session) are removed on app context teardown
+    from app import database
+    database.init_app(app)
+
     @login_manager.user_loader
     def load_user(user_id):
-        session = SessionLocal()
-        return session.query(User).get(int(user_id))
+        # Cached per process for USER_CACHE_TTL seconds (see app/auth/user_cache.py)
+        from app.auth.user_cache import load_user as load_cached_user
+        return load_cached_user(user_id)
 
     # Register blueprints
     from app.auth import auth_bp
@@ -33,44 +39,90 @@ def create_app():
     def landing():
         return render_template("landing.html")
 
+    # Media files with caching headers / proxy offload (see app/media.py)
+    from app import media
+    media.init_app(app)
+
+    # Prometheus scrape endpoint (this process's registry; workers dump theirs, see app/metrics.py)
+    @app.route("/metrics")
+    def metrics():
+        from app.metrics import render
+        return Response(render(), mimetype="text/plain; version=0.0.4")
+
     # Maintenance CLI: clean-missing
     @app.cli.command("clean-missing")
     @click.option("--dry-run", is_flag=True, help="Scan and report without modifying the database.")
-    def clean_missing(dry_run):
+    @click.option("--mark-only", is_flag=True,
+                  help="Set SurferFrame.file_status to 'missing' instead of deleting the rows (e.g. flaky network storage).")
+    @click.option("--batch-size", type=int, default=None, help="Frames per batch and transaction (default CLEAN_MISSING_BATCH).")
+    @click.option("--workers", type=int, default=None, help="Threads for directory listings (default CLEAN_MISSING_WORKERS).")
+    @click.option("--after-id", type=int, default=None, help="Resume the frame scan after this SurferFrame id.")
+    @click.option("--cursor-file", default=None,
+                  help="Save the last committed frame id here after each batch and resume from it; removed when the scan finishes.")
+    def clean_missing(dry_run, mark_only, batch_size, workers, after_id, cursor_file):
         """
         Delete SurferFrame rows whose files are missing on disk; clean or delete broken UserProfile/SurfVideo refs.
+        Also keeps SurferFrame.file_status in sync, which the gallery and profile views filter on.
+        Frames are streamed and committed in batches (see app/tasks/cleanup.py), so an interrupted
+        run can be resumed with --after-id or --cursor-file.
         """
+        import time
+        from app.tasks.cleanup import clean_missing_frames, frame_count_after, CLEAN_MISSING_BATCH, CLEAN_MISSING_WORKERS
         base_static = os.path.join("app", "static")
-        session = SessionLocal()
 
-        def _norm(p):
-            p = (p or "").replace("\\", "/").lstrip("/")
-            if p.startswith("app/static/"):
-                p = p[len("app/static/"):]
-            elif p.startswith("static/"):
-                p = p[len("static/"):]
-            return p
+        if after_id is None and cursor_file and os.path.exists(cursor_file):
+            with open(cursor_file) as fh:
+                after_id = int(fh.read().strip() or 0)
+            click.echo(f"Resuming frame scan after id {after_id} (from {cursor_file})")
+        after_id = after_id or 0
+        total = frame_count_after(after_id)
+        last_report, committed = [0.0], [after_id]
 
-        removed_frames = 0
+        def _progress(stats):
+            committed[0] = stats["cursor"]
+            if cursor_file and not dry_run:
+                tmp = f"{cursor_file}.tmp"
+                with open(tmp, "w") as fh:
+                    fh.write(str(stats["cursor"]))
+                os.replace(tmp, cursor_file)
+            now = time.time()
+            if now - last_report[0] >= 2 or stats["scanned"] >= total:
+                last_report[0] = now
+                rate = stats["scanned"] / max(now - stats["started_at"], 1e-6)
+                pct = 100.0 * stats["scanned"] / total if total else 100.0
+                click.echo(f"[clean-missing] frames {stats['scanned']}/{total} ({pct:.1f}%), "
+                           f"missing {stats['removed'] + stats['marked_missing']}, back {stats['marked_ok']}, "
+                           f"{rate:.0f} rows/s, cursor id {stats['cursor']}")
+
+        try:
+            frame_stats = clean_missing_frames(
+                dry_run=dry_run, mark_only=mark_only, after_id=after_id,
+                batch_size=batch_size or CLEAN_MISSING_BATCH, workers=workers or CLEAN_MISSING_WORKERS,
+                on_batch=_progress,
+            )
+        except (Exception, KeyboardInterrupt) as e:
+            done = "scanned" if dry_run else "committed"
+            click.echo(f"Frame scan stopped ({e.__class__.__name__}: {e}). Frames up to id {committed[0]} are {done}; "
+                       f"rerun with --after-id {committed[0]} (or the same --cursor-file) to resume.")
+            raise SystemExit(1)  # scripts and cron must see that the scan did not finish
+        if cursor_file and not dry_run and os.path.exists(cursor_file):
+            os.remove(cursor_file)
+
+        removed_frames = frame_stats["removed"]
+        marked_missing = frame_stats["marked_missing"]
+        marked_ok = frame_stats["marked_ok"]
         removed_profiles = 0
         cleared_profile_side = 0
         removed_videos = 0
         cleared_thumbnails = 0
 
+        session = SessionLocal()
         try:
-            # SurferFrame cleanup
-            for f in session.query(SurferFrame).all():
-                rel = _norm(f.frame_path)
-                disk = os.path.join(base_static, rel)
-                if not os.path.exists(disk):
-                    session.delete(f)
-                    removed_frames += 1
-
             # UserProfile cleanup
             for p in session.query(UserProfile).all():
-                face_rel = _norm(p.face_image_path)
+                face_rel = static_relpath(p.face_image_path)
                 face_disk = os.path.join(base_static, face_rel) if face_rel else ""
-                side_rel = _norm(p.face_side_image_path) if getattr(p, "face_side_image_path", None) else ""
+                side_rel = static_relpath(p.face_side_image_path) if getattr(p, "face_side_image_path", None) else ""
                 side_disk = os.path.join(base_static, side_rel) if side_rel else ""
 
                 missing_face = not face_rel or not os.path.exists(face_disk)
@@ -86,9 +138,9 @@ def create_app():
 
             # SurfVideo cleanup
             for v in session.query(SurfVideo).all():
-                video_rel = _norm(v.video_path)
+                video_rel = static_relpath(v.video_path)
                 video_disk = os.path.join(base_static, video_rel) if video_rel else ""
-                thumb_rel = _norm(v.thumbnail_path) if getattr(v, "thumbnail_path", None) else ""
+                thumb_rel = static_relpath(v.thumbnail_path) if getattr(v, "thumbnail_path", None) else ""
                 thumb_disk = os.path.join(base_static, thumb_rel) if thumb_rel else ""
 
                 if not video_rel or not os.path.exists(video_disk):
@@ -105,6 +157,8 @@ def create_app():
                 session.commit()
 
             click.echo(f"Removed SurferFrame rows: {removed_frames}")
+            click.echo(f"Marked SurferFrame files missing: {marked_missing}")
+            click.echo(f"Marked SurferFrame files present again: {marked_ok}")
             click.echo(f"Removed UserProfile rows (missing face): {removed_profiles}")
             click.echo(f"Cleared UserProfile side images: {cleared_profile_side}")
             click.echo(f"Removed SurfVideo rows (missing video): {removed_videos}")
@@ -127,20 +181,12 @@ def create_app():
         base_static = os.path.join("app", "static")
         session = SessionLocal()
 
-        def _norm(p):
-            p = (p or "").replace("\\", "/").lstrip("/")
-            if p.startswith("app/static/"):
-                p = p[len("app/static/"):]
-            elif p.startswith("static/"):
-                p = p[len("static/"):]
-            return p
-
         try:
             f = session.query(SurferFrame).get(frame_id)
             if not f:
                 click.echo(f"No SurferFrame with id={frame_id}")
                 return
-            rel = _norm(f.frame_path)
+            rel = static_relpath(f.frame_path)
             disk = os.path.join(base_static, rel)
             # Delete file if exists
             try:
@@ -149,6 +195,9 @@ def create_app():
                     click.echo(f"Deleted file: {disk}")
             except Exception as fe:
                 click.echo(f"Warning: could not delete file {disk}: {fe}")
+            if f.derivatives:
+                from app.tasks.derivatives import remove_derivatives
+                click.echo(f"Deleted {remove_derivatives(f.derivatives)} derivative file(s)")
             session.delete(f)
             session.commit()
             click.echo(f"Deleted SurferFrame id={frame_id}")
@@ -158,4 +207,114 @@ def create_app():
         finally:
             session.close()
 
+    # Model CLI: export-detector
+    @app.cli.command("export-detector")
+    @click.option("--weights", default=None, help="YOLO .pt weights (default YOLO_WEIGHTS_PATH).")
+    @click.option("--output", default=None, help="Output .onnx path (default: weights path with .onnx suffix).")
+    @click.option("--imgsz", default=None, type=int, help="Square network input size (default DETECTOR_IMGSZ).")
+    @click.option("--int8", is_flag=True, help="Apply dynamic INT8 weight quantization with onnxruntime.")
+    @click.option("--static-shape", is_flag=True, help="Export with a fixed batch/size instead of dynamic axes.")
+    def export_detector(weights, output, imgsz, int8, static_shape):
+        """
+        Export the YOLO surfer detector to ONNX for DETECTOR_BACKEND=onnx.
+        """
+        from app.tasks.detect import WEIGHTS_PATH
+        from app.tasks.detector import export_onnx, DETECTOR_IMGSZ
+
+        weights = weights or WEIGHTS_PATH
+        if not os.path.exists(weights):
+            click.echo(f"Weights not found: {weights}")
+            return
+        try:
+            path = export_onnx(weights, output, imgsz or DETECTOR_IMGSZ, int8=int8, dynamic=not static_shape)
+            click.echo(f"Exported {'INT8 ' if int8 else ''}ONNX detector to {path}")
+            click.echo("Set DETECTOR_BACKEND=onnx (and DETECTOR_ONNX_PATH if you used --output) to use it.")
+        except Exception as e:
+            click.echo(f"Error exporting detector: {e}")
+
+    # Maintenance CLI: migrate-frame-embeddings
+    @app.cli.command("migrate-frame-embeddings")
+    @click.option("--batch-size", default=1000, type=int, help="Rows moved per commit.")
+    def migrate_frame_embeddings(batch_size):
+        """
+        Move cached frame embeddings from the frame_embeddings table into the memory-mapped frame store.
+        """
+        from app.tasks.frame_cache import migrate_db_embeddings
+        from app.tasks.frame_store import FRAME_STORE_DIR
+        session = SessionLocal()
+        try:
+            moved = migrate_db_embeddings(session, batch_size=batch_size)
+            click.echo(f"Moved {moved} frame embeddings into {FRAME_STORE_DIR}")
+        except Exception as e:
+            session.rollback()
+            click.echo(f"Error migrating frame embeddings: {e}")
+        finally:
+            session.close()
+
+    # Matching CLI: rescore-sweep
+    @app.cli.command("rescore-sweep")
+    @click.option("--grid", "grid_specs", multiple=True,
+                  help="KNOB=v1,v2,... (repeatable), e.g. --grid MATCH_THRESHOLD=0.5,0.55,0.6 --grid TOP2_GAP=0.04,0.06")
+    @click.option("--labels", "labels_path", default=None,
+                  help="CSV with frame_id,user_id of known-correct assignments (default: current assignments).")
+    @click.option("--unmatched-only", is_flag=True, help="Only sweep frames that are currently unmatched.")
+    @click.option("--json", "json_path", default=None, help="Write the results to this JSON file.")
+    def rescore_sweep(grid_specs, labels_path, unmatched_only, json_path):
+        """
+        Re-score cached frame embeddings against the gallery for a grid of matcher settings.
+        Nothing is written to the database; no face detection is run.
+        """
+        import csv
+        import json
+        import time
+        from app.tasks.match import _load_user_embeddings
+        from app.tasks.frame_cache import iter_cached_embeddings
+        from app.tasks.scoring import Gallery, MatchRules, rules_grid, sweep
+
+        grid = {}
+        for spec in grid_specs:
+            name, _, values = spec.partition("=")
+            name = name.strip().upper()
+            if name not in MatchRules._fields or not values:
+                click.echo(f"Bad --grid {spec!r}; knobs: {', '.join(MatchRules._fields)}")
+                return
+            grid[name] = [float(v) for v in values.split(",") if v.strip()]
+        rules_list = rules_grid(grid)
+
+        session = SessionLocal()
+        try:
+            t0 = time.perf_counter()
+            faces_map, colors_map = _load_user_embeddings(session)
+            gallery = Gallery(faces_map, colors_map)
+            if not len(gallery):
+                click.echo("No user embeddings in DB")
+                return
+            if labels_path:
+                with open(labels_path, newline="") as fh:
+                    labels = {int(r["frame_id"]): int(r["user_id"]) for r in csv.DictReader(fh) if r.get("user_id")}
+            else:
+                labels = {fid: uid for fid, uid in session.query(SurferFrame.id, SurferFrame.user_id)
+                          .filter(SurferFrame.user_id > 0)}
+            # sweep reads each block once, so stream them rather than holding the whole cache
+            results = sweep(iter_cached_embeddings(session, unmatched_only=unmatched_only),
+                            gallery, rules_list, labels)
+            elapsed = time.perf_counter() - t0
+        finally:
+            session.close()
+
+        n_frames = results[0]["frames"] if results else 0
+        click.echo(f"{n_frames} cached frames x {len(gallery)} users x {len(rules_list)} settings "
+                   f"in {elapsed:.2f}s (labels: {len(labels)} from {labels_path or 'current assignments'})")
+        shown = list(grid) or ["MATCH_THRESHOLD"]
+        click.echo("  ".join(f"{k:>20s}" for k in shown) + "  assigned  assign%  ambig%  precision  recall")
+        for r in results:
+            fmt = lambda v: f"{v:9.3f}" if v is not None else "        -"
+            click.echo("  ".join(f"{r[k]:20.3f}" for k in shown)
+                       + f"  {r['assigned']:8d}  {100 * r['assign_rate']:6.1f}  {100 * r['ambiguity_rate']:6.1f}"
+                       + f"  {fmt(r['precision'])}  {fmt(r['recall'])}")
+        if json_path:
+            with open(json_path, "w") as fh:
+                json.dump({"frames": n_frames, "users": len(gallery), "seconds": elapsed, "results": results}, fh, indent=2)
+            click.echo(f"Results written to {json_path}")
+
     return app
@@ -5,16 +5,16 @@ from flask_login import login_user, logout_user, login_required, current_user
 from app.auth import auth_bp
 from app.auth.forms import RegisterForm, LoginForm
 from app.models import User
-from app.database import SessionLocal
+from app.database import db_session
 from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy.exc import IntegrityError
 
 
 @auth_bp.route("/register", methods=["GET", "POST"])
 def register():
     form = RegisterForm()
     if form.validate_on_submit():
-        session = SessionLocal()
-        existing_user = session.query(User).filter_by(username=form.username.data).first()
+        existing_user = db_session.query(User).filter_by(username=form.username.data).first()
         if existing_user:
             flash("User already exists.")
         else:
@@ -22,8 +22,13 @@ def register():
                 username=form.username.data,
                 password=generate_password_hash(form.password.data)
             )
-            session.add(new_user)
-            session.commit()
+            db_session.add(new_user)
+            try:
+                db_session.commit()
+            except IntegrityError:
+                db_session.rollback()  # registered concurrently under the same name
+                flash("User already exists.")
+                return render_template("register.html", form=form)
             flash("User registered! You can now log in.")
             return redirect(url_for("auth.login"))
     return render_template("register.html", form=form)
@@ -33,8 +38,7 @@ def register():
 def login():
     form = LoginForm()
     if form.validate_on_submit():
-        session = SessionLocal()
-        user = session.query(User).filter_by(username=form.username.data).first()
+        user = db_session.query(User).filter_by(username=form.username.data).first()
         if user and check_password_hash(user.password, form.password.data):
             login_user(user)
             flash("Logged in successfully.")
@@ -0,0 +1,54 @@
+# app/auth/user_cache.py
+"""In-process cache of User rows for Flask-Login's user_loader.
+
+Every authenticated request calls load_user. A hit returns a detached User (only id,
+username and password hash; it has no relationships to lazy-load) without touching the
+database. A miss loads the row through the request's db_session and caches it for
+USER_CACHE_TTL seconds. Entries are per process, so a change made elsewhere (another
+worker, a deleted account) shows up within the TTL at most.
+
+Environment:
+  - USER_CACHE_TTL: seconds a loaded user is reused (default 30; 0 disables the cache)
+  - USER_CACHE_SIZE: maximum cached users per process (default 1024)
+"""
+import os
+import threading
+import time
+from dotenv import load_dotenv
+
+from app.database import db_session
+from app.metrics import USER_CACHE
+from app.models import User
+
+load_dotenv()
+
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "30"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "1024"))
+
+_lock = threading.Lock()
+_cache = {}  # user_id -> (expires_at, detached User)
+
+
+def load_user(user_id):
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
+    now = time.monotonic()
+    if USER_CACHE_TTL > 0:
+        with _lock:
+            entry = _cache.get(user_id)
+        if entry is not None and entry[0] > now:
+            USER_CACHE.inc(result="hit")
+            return entry[1]
+    USER_CACHE.inc(result="miss")
+    user = db_session.get(User, user_id)
+    if user is None or USER_CACHE_TTL <= 0:
+        return user
+    db_session.expunge(user)  # shared across requests and threads: keep it out of any session
+    with _lock:
+        if len(_cache) >= USER_CACHE_SIZE:
+            for uid in [k for k, (expires, _) in _cache.items() if expires <= now] or [next(iter(_cache))]:
+                _cache.pop(uid, None)
+        _cache[user_id] = (now + USER_CACHE_TTL, user)
+    return user
@@ -11,4 +11,6 @@ BASE_DIR = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
 class Config:
     SECRET_KEY = os.environ.get("FLASK_SECRET_KEY", "dev_secret")
     SQLALCHEMY_DATABASE_URI = os.environ.get("DATABASE_URL", "sqlite:///" + os.path.join(BASE_DIR, "instance", "seesea.sqlite"))
-    SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Log every SQL statement (SQL_ECHO=0 turns it off; it costs a log line per query)
+    SQLALCHEMY_ECHO = os.environ.get("SQL_ECHO", "1") not in ("0", "false", "False")
@@ -1,9 +1,67 @@
 # app/database.py
+"""Engine, session factories and declarative base.
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+  - SessionLocal: plain session factory. Celery tasks and CLI commands open one per unit of
+    work and close it themselves.
+  - db_session: a scoped_session for request handlers. Each request thread gets one session;
+    init_app removes it when the app context tears down, so its connection goes back to the
+    pool even if the view never closes it.
+
+Pool usage is exported through app.metrics (seesea_db_pool_*).
+
+Environment:
+  - SQL_ECHO: log every statement (default 1, see app.config)
+  - DB_POOL_SIZE / DB_MAX_OVERFLOW / DB_POOL_TIMEOUT: QueuePool sizing (SQLAlchemy defaults
+    5 / 10 / 30s when unset)
+  - DB_POOL_PRE_PING: test connections on checkout (default 0)
+"""
+import os
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker, declarative_base, scoped_session
 from app.config import Config
+from app.metrics import DB_POOL_CHECKED_OUT, DB_POOL_CONNECTIONS, DB_POOL_CHECKOUTS, DB_CONNECTIONS_OPENED
+
+
+def _pool_options() -> dict:
+    options = {}
+    for env, key, cast in (("DB_POOL_SIZE", "pool_size", int), ("DB_MAX_OVERFLOW", "max_overflow", int),
+                           ("DB_POOL_TIMEOUT", "pool_timeout", float)):
+        if os.getenv(env, "").strip():
+            options[key] = cast(os.getenv(env))
+    if os.getenv("DB_POOL_PRE_PING", "0") not in ("0", "false", "False"):
+        options["pool_pre_ping"] = True
+    return options
 
-engine = create_engine(Config.SQLALCHEMY_DATABASE_URI, echo=True)
+
+engine = create_engine(Config.SQLALCHEMY_DATABASE_URI, echo=Config.SQLALCHEMY_ECHO, **_pool_options())
 SessionLocal = sessionmaker(bind=engine)
+db_session = scoped_session(SessionLocal)
 Base = declarative_base()
+
+
+@event.listens_for(engine, "connect")
+def _on_connect(dbapi_connection, connection_record):
+    DB_CONNECTIONS_OPENED.inc()
+    DB_POOL_CONNECTIONS.inc()
+
+
+@event.listens_for(engine, "close")
+def _on_close(dbapi_connection, connection_record):
+    DB_POOL_CONNECTIONS.inc(-1)
+
+
+@event.listens_for(engine, "checkout")
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    DB_POOL_CHECKOUTS.inc()
+    DB_POOL_CHECKED_OUT.inc()
+
+
+@event.listens_for(engine, "checkin")
+def _on_checkin(dbapi_connection, connection_record):
+    DB_POOL_CHECKED_OUT.inc(-1)
+
+
+def init_app(app):
+    @app.teardown_appcontext
+    def _remove_db_session(exc=None):
+        db_session.remove()
@@ -0,0 +1,94 @@
+# app/media.py
+"""Serving of generated and uploaded media (frames, derivatives, thumbnails, videos).
+
+Files under app/static are served from /media/<path> with caching headers:
+  - media_url(path, version) adds ?v=<version>. A versioned URL names immutable content
+    (the version changes whenever the file does, e.g. the row's updated_at), so it is
+    served with Cache-Control: public, max-age=MEDIA_MAX_AGE, immutable.
+  - Unversioned URLs are served with no-cache; browsers revalidate with If-None-Match
+    against an ETag built from the file's size and mtime and usually get a 304.
+  - Range requests are answered with 206 partial content (video seeking).
+With MEDIA_ACCEL set, Flask only checks the path and sets headers, and the front proxy
+streams the bytes:
+  - MEDIA_ACCEL=nginx: X-Accel-Redirect to MEDIA_ACCEL_PREFIX + path (an internal location
+    aliased to app/static)
+  - MEDIA_ACCEL=sendfile: X-Sendfile with the absolute path (Apache mod_xsendfile, lighttpd)
+"""
+import mimetypes
+import os
+from flask import Response, abort, request, send_file, url_for
+from werkzeug.security import safe_join
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MEDIA_ACCEL = os.getenv("MEDIA_ACCEL", "").strip().lower()
+MEDIA_ACCEL_PREFIX = "/" + os.getenv("MEDIA_ACCEL_PREFIX", "/_protected_media/").strip("/") + "/"
+MEDIA_MAX_AGE = int(os.getenv("MEDIA_MAX_AGE", str(365 * 24 * 3600)))
+
+MEDIA_ROOT = os.path.abspath(os.path.join("app", "static"))
+
+
+def static_relpath(path: str) -> str:
+    """A stored media path ("app/static/x", "static/x", "/x" or "x", either slash) as "x",
+    relative to app/static. The one normalisation used for URLs, disk checks and cleanup."""
+    p = (path or "").replace("\\", "/").lstrip("/")
+    if p.startswith("app/static/"):
+        p = p[len("app/static/"):]
+    elif p.startswith("static/"):
+        p = p[len("static/"):]
+    return p
+
+
+def media_version(value):
+    """A cache-busting version from a datetime (e.g. a row's updated_at), int or string."""
+    if value is None:
+        return None
+    if hasattr(value, "timestamp"):
+        return str(int(value.timestamp()))
+    return str(value)
+
+
+def media_url(path: str, version=None) -> str:
+    """URL of a stored media path (with or without the app/static prefix)."""
+    version = media_version(version)
+    if version:
+        return url_for("media", filename=static_relpath(path), v=version)
+    return url_for("media", filename=static_relpath(path))
+
+
+def _cache_headers(response):
+    if request.args.get("v"):
+        response.headers["Cache-Control"] = f"public, max-age={MEDIA_MAX_AGE}, immutable"
+    else:
+        response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+def serve_media(filename: str):
+    full = safe_join(MEDIA_ROOT, filename)
+    if full is None or not os.path.isfile(full):
+        abort(404)
+    if MEDIA_ACCEL == "nginx":
+        st = os.stat(full)
+        etag = f"{int(st.st_mtime)}-{st.st_size}"
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            # nginx serves the body and Range requests from the internal location
+            response = Response(mimetype=mimetypes.guess_type(full)[0] or "application/octet-stream")
+            response.headers["X-Accel-Redirect"] = MEDIA_ACCEL_PREFIX + filename.lstrip("/")
+            response.headers.pop("Content-Length", None)
+        response.set_etag(etag)
+        return _cache_headers(response)
+    # send_file handles ETag/If-None-Match, Last-Modified and Range; with USE_X_SENDFILE
+    # (MEDIA_ACCEL=sendfile) it only sets X-Sendfile and the proxy sends the body.
+    response = send_file(full, conditional=True, etag=True, max_age=None)
+    return _cache_headers(response)
+
+
+def init_app(app):
+    if MEDIA_ACCEL == "sendfile":
+        app.config["USE_X_SENDFILE"] = True
+    app.add_url_rule("/media/<path:filename>", "media", serve_media)
+    app.add_template_global(media_url, "media_url")
@@ -0,0 +1,266 @@
+# app/metrics.py
+"""Lightweight in-process metrics with Prometheus text output.
+
+Counters, gauges and histograms live in a process-wide registry. Pipeline stages are
+timed with `timed`, which works as a decorator or a context manager and observes into
+the seesea_stage_seconds histogram:
+
+    with timed("decode"):
+        ret, frame = cap.read()
+
+    @timed("score")
+    def _decide_match(...): ...
+
+The Flask app serves its own registry at /metrics. Celery workers are separate processes,
+so after each task they dump their registry (see dump_metrics):
+  - METRICS_TEXTFILE_DIR: write <dir>/seesea_<host>_<pid>.prom for the node_exporter
+    textfile collector (written atomically). Every series carries a pid="<pid>" label,
+    since the collector merges all files of a node into one scrape and rejects duplicates.
+  - METRICS_PUSHGATEWAY_URL: PUT the registry to a Prometheus pushgateway under
+    job=METRICS_JOB, instance=<host>:<pid>
+  - METRICS_DUMP_INTERVAL: minimum seconds between dumps (default 15)
+When a worker process exits, remove_metrics deletes its file and its pushgateway group, so
+series of dead processes do not linger.
+"""
+import os
+import socket
+import threading
+import time
+import urllib.request
+from bisect import bisect_left
+from functools import wraps
+from dotenv import load_dotenv
+
+load_dotenv()
+
+METRICS_TEXTFILE_DIR = os.getenv("METRICS_TEXTFILE_DIR", "")
+METRICS_PUSHGATEWAY_URL = os.getenv("METRICS_PUSHGATEWAY_URL", "").rstrip("/")
+METRICS_JOB = os.getenv("METRICS_JOB", "seesea_worker")
+METRICS_DUMP_INTERVAL = float(os.getenv("METRICS_DUMP_INTERVAL", "15"))
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_lock = threading.Lock()
+_registry = {}
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels_text(names, values, extra=()) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + [f'{n}="{_escape(v)}"' for n, v in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _fmt(v: float) -> str:
+    return "+Inf" if v == float("inf") else repr(float(v))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        with _lock:
+            if name in _registry:
+                raise ValueError(f"Metric {name} already registered")
+            _registry[name] = self
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def _header(self) -> list:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self, const=()) -> list:
+        lines = self._header()
+        with _lock:
+            items = sorted(self._values.items())
+        for key, v in items:
+            lines.append(f"{self.name}{_labels_text(self.labelnames, key, const)} {_fmt(v)}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = float(value)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        i = bisect_left(self.buckets, value)
+        with _lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    def snapshot(self, **labels):
+        """(count, sum) for one label set, e.g. for tests and status pages."""
+        with _lock:
+            state = self._values.get(self._key(labels))
+            return (state[2], state[1]) if state else (0, 0.0)
+
+    def render(self, const=()) -> list:
+        lines = self._header()
+        with _lock:
+            items = sorted((k, ([*s[0]], s[1], s[2])) for k, s in self._values.items())
+        const = tuple(const)
+        for key, (counts, total, n) in items:
+            cumulative = 0
+            for bound, c in zip(self.buckets + (float("inf"),), counts):
+                cumulative += c
+                lines.append(f"{self.name}_bucket{_labels_text(self.labelnames, key, const + (('le', _fmt(bound)),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels_text(self.labelnames, key, const)} {_fmt(total)}")
+            lines.append(f"{self.name}_count{_labels_text(self.labelnames, key, const)} {n}")
+        return lines
+
+
+def render(const_labels: dict = None) -> str:
+    """The whole registry in Prometheus text exposition format (version 0.0.4).
+    const_labels are added to every series."""
+    with _lock:
+        metrics = [_registry[name] for name in sorted(_registry)]
+    const = tuple((const_labels or {}).items())
+    lines = []
+    for m in metrics:
+        lines.extend(m.render(const))
+    return "\n".join(lines) + "\n"
+
+
+# ------------- Pipeline metrics -------------
+
+STAGE_SECONDS = Histogram("seesea_stage_seconds", "Time spent per pipeline stage.", ["stage"])
+STAGE_ERRORS = Counter("seesea_stage_errors_total", "Exceptions raised inside a timed stage.", ["stage"])
+FRAMES = Counter("seesea_video_frames_total", "Sampled video frames by outcome (detected, skipped).", ["outcome"])
+DETECTIONS = Counter("seesea_detections_total", "Surfer detections written by process_video.")
+MATCH_RESULTS = Counter("seesea_match_results_total", "Frames scored by the matcher by outcome (assigned, rejected).", ["outcome"])
+TASK_SECONDS = Histogram("seesea_task_seconds", "Celery task run time.", ["task", "state"],
+                         buckets=(0.05, 0.25, 1.0, 5.0, 15.0, 60.0, 300.0, 900.0, 3600.0, 4 * 3600.0))
+MODEL_LOAD_SECONDS = Gauge("seesea_model_load_seconds", "Time taken to load each model in this process.", ["model"])
+DB_POOL_CHECKED_OUT = Gauge("seesea_db_pool_checked_out", "Database connections currently checked out of the pool.")
+DB_POOL_CONNECTIONS = Gauge("seesea_db_pool_connections", "Database connections currently open (idle or checked out).")
+DB_POOL_CHECKOUTS = Counter("seesea_db_pool_checkouts_total", "Connections checked out of the pool.")
+DB_CONNECTIONS_OPENED = Counter("seesea_db_connections_opened_total", "New database connections opened by the pool.")
+USER_CACHE = Counter("seesea_user_cache_total", "load_user lookups by result (hit, miss).", ["result"])
+
+
+class timed:
+    """Time a block or function into seesea_stage_seconds{stage=...}."""
+
+    __slots__ = ("stage", "_t0")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self._t0 = None
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        STAGE_SECONDS.observe(time.perf_counter() - self._t0, stage=self.stage)
+        if exc_type is not None:
+            STAGE_ERRORS.inc(stage=self.stage)
+        return False
+
+    def __call__(self, fn):
+        stage = self.stage
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timed(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+
+
+# ------------- Worker dumps -------------
+
+_last_dump = 0.0
+
+
+def _instance() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _textfile_path() -> str:
+    return os.path.join(METRICS_TEXTFILE_DIR, f"seesea_{socket.gethostname()}_{os.getpid()}.prom")
+
+
+def _pushgateway_url() -> str:
+    return f"{METRICS_PUSHGATEWAY_URL}/metrics/job/{METRICS_JOB}/instance/{_instance()}"
+
+
+def dump_metrics(force: bool = False) -> bool:
+    """Write the textfile and/or push to the gateway, at most every METRICS_DUMP_INTERVAL seconds."""
+    global _last_dump
+    if not (METRICS_TEXTFILE_DIR or METRICS_PUSHGATEWAY_URL):
+        return False
+    now = time.monotonic()
+    if not force and now - _last_dump < METRICS_DUMP_INTERVAL:
+        return False
+    _last_dump = now
+    if METRICS_TEXTFILE_DIR:
+        try:
+            os.makedirs(METRICS_TEXTFILE_DIR, exist_ok=True)
+            path = _textfile_path()
+            tmp = path + ".tmp"
+            with open(tmp, "w") as fh:
+                fh.write(render({"pid": os.getpid()}))
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"[metrics] Could not write textfile: {e}")
+    if METRICS_PUSHGATEWAY_URL:
+        # The grouping key (instance=<host>:<pid>) already tells processes apart
+        req = urllib.request.Request(_pushgateway_url(), data=render().encode(), method="PUT",
+                                     headers={"Content-Type": "text/plain; version=0.0.4"})
+        try:
+            urllib.request.urlopen(req, timeout=5).close()
+        except Exception as e:
+            print(f"[metrics] Push to {METRICS_PUSHGATEWAY_URL} failed: {e}")
+    return True
+
+
+def remove_metrics() -> None:
+    """Delete this process's textfile and pushgateway group (called when a worker process exits)."""
+    if METRICS_TEXTFILE_DIR:
+        try:
+            os.remove(_textfile_path())
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"[metrics] Could not remove textfile: {e}")
+    if METRICS_PUSHGATEWAY_URL:
+        req = urllib.request.Request(_pushgateway_url(), method="DELETE")
+        try:
+            urllib.request.urlopen(req, timeout=5).close()
+        except Exception as e:
+            print(f"[metrics] Delete from {METRICS_PUSHGATEWAY_URL} failed: {e}")
@@ -1,6 +1,6 @@
 # app/models.py
 
-from sqlalchemy import Column, Integer, Float, String, DateTime, Text, UniqueConstraint, Index
+from sqlalchemy import Column, Integer, BigInteger, Float, String, DateTime, Text, UniqueConstraint, Index
 from app.database import Base
 from flask_login import UserMixin
 from datetime import datetime
@@ -37,9 +37,39 @@ class SurferFrame(Base):
     y2 = Column(Float)
     score = Column(Float)
     video_id = Column(Integer, nullable=True)
+    frame_idx = Column(Integer, nullable=True)  # Source video frame index
+    detection_idx = Column(Integer, nullable=True)  # Detection index within that frame
+    match_attempts = Column(Integer, default=0)  # Times the matcher scored this frame
+    last_match_at = Column(DateTime, nullable=True)  # When the matcher last scored this frame
+    match_gallery_version = Column(Integer, nullable=True)  # Gallery version of the last attempt
+    embedding_ref = Column(String, nullable=True)  # Where the cached frame embedding lives (see frame_cache)
+    file_status = Column(String(16), nullable=False, default="ok")  # ok | missing; set by process_video and clean-missing
+    derivatives = Column(Text, nullable=True)  # JSON {width: static-relative path} of resized copies (see derivatives.py)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    __table_args__ = (
+        # Makes process_video writes idempotent when a frame is redone after a crash
+        UniqueConstraint('video_id', 'frame_idx', 'detection_idx', name='uq_surfer_frame_video_frame_det'),
+        # Gallery/profile listings: a user's frames with files present, newest first
+        Index('ix_surfer_frames_user_status_created', 'user_id', 'file_status', 'created_at', 'id'),
+        Index('ix_surfer_frames_user_status_score', 'user_id', 'file_status', 'score', 'id'),
+    )
+
+class FrameEmbedding(Base):
+    __tablename__ = "frame_embeddings"
+    id = Column(Integer, primary_key=True)
+    frame_id = Column(Integer, nullable=False, unique=True)
+    face = Column(Text, nullable=True)  # JSON list, L2-normalized face embedding (null if no face found)
+    color = Column(Text, nullable=True)  # JSON list, HSV outfit histogram
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class GalleryState(Base):
+    __tablename__ = "gallery_state"
+    id = Column(Integer, primary_key=True)  # Single row, id=1
+    version = Column(Integer, nullable=False, default=0)  # Bumped whenever user embeddings change
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 class UserProfile(Base):
     __tablename__ = "user_profiles"
     id = Column(Integer, primary_key=True)
@@ -62,6 +92,28 @@ class SurfVideo(Base):
     duration = Column(Float, nullable=True)  # Video duration in seconds
     frame_count = Column(Integer, nullable=True)  # Total number of frames
     processed_frames = Column(Integer, default=0)  # Number of processed frames
+    skipped_frames = Column(Integer, default=0)  # Sampled frames where the motion gate skipped detection
     status = Column(String, default="pending")  # pending, processing, completed, failed
+    checkpoint_frame = Column(Integer, nullable=True)  # Last fully committed frame index (resume point)
+    lease_owner = Column(String, nullable=True)  # host:pid of the worker processing this video
+    lease_expires_at = Column(DateTime, nullable=True)  # Lease is stale after this time
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class VideoUpload(Base):
+    __tablename__ = "video_uploads"
+    id = Column(String(32), primary_key=True)  # Random hex token, part of the upload URL
+    user_id = Column(Integer, nullable=False)
+    length = Column(BigInteger, nullable=False)  # Declared total size in bytes
+    offset = Column(BigInteger, nullable=False, default=0)  # Bytes received and flushed to disk
+    filename = Column(String, nullable=True)  # Client-side file name (informational)
+    location = Column(String, nullable=True)
+    description = Column(String, nullable=True)
+    checksum = Column(String, nullable=True)  # Expected whole-file digest, "<algo> <hex>"
+    part_path = Column(String, nullable=False)  # Partial file being written
+    status = Column(String, nullable=False, default="uploading")  # uploading, completing, complete, failed
+    video_id = Column(Integer, nullable=True)  # SurfVideo created on completion
+    complete_attempts = Column(Integer, default=0)  # complete_upload runs (see app/tasks/uploads.py)
+    error = Column(String, nullable=True)  # Why a failed upload failed
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
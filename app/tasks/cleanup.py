@@ -0,0 +1,138 @@
+# app/tasks/cleanup.py
+"""Streaming SurferFrame file check behind `flask clean-missing`.
+
+Rows are read in id order, batch_size at a time, selecting only the columns the check
+needs (keyset `id > cursor` batches rather than one long-lived cursor, so every batch can
+commit and the scan can stop and resume anywhere). For each batch the frame directories
+are listed once with os.scandir, concurrently on a thread pool, and paths are checked
+against the listings. A path missing from a listing is confirmed with os.path.exists,
+because a listing can predate a file that process_video has just written. Each batch's
+deletes or file_status updates are committed on their own, and the last committed id is
+the resume cursor.
+
+Environment:
+  - CLEAN_MISSING_BATCH: rows per batch and transaction (default 2000)
+  - CLEAN_MISSING_WORKERS: threads listing directories and confirming misses (default 8)
+"""
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+from app.database import SessionLocal
+from app.media import static_relpath
+from app.models import SurferFrame
+from app.tasks.derivatives import STATIC_ROOT, remove_derivatives
+
+load_dotenv()
+
+CLEAN_MISSING_BATCH = int(os.getenv("CLEAN_MISSING_BATCH", "2000"))
+CLEAN_MISSING_WORKERS = int(os.getenv("CLEAN_MISSING_WORKERS", "8"))
+
+
+def _list_dir(path):
+    try:
+        with os.scandir(path) as it:
+            return frozenset(entry.name for entry in it)
+    except (FileNotFoundError, NotADirectoryError):
+        return frozenset()
+    except OSError:
+        return None  # unreadable: fall back to checking each path
+
+
+class FileChecker:
+    """Existence checks for many paths, one directory listing per directory."""
+
+    def __init__(self, workers: int = CLEAN_MISSING_WORKERS, max_dirs: int = 1024):
+        self.pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="clean-missing")
+        self.max_dirs = max_dirs
+        self.listings = OrderedDict()
+
+    def exists(self, paths) -> list:
+        split = [os.path.split(p) for p in paths]
+        new_dirs = list({d for d, _ in split if d not in self.listings})
+        for d, names in zip(new_dirs, self.pool.map(_list_dir, new_dirs)):
+            self.listings[d] = names
+        while len(self.listings) > self.max_dirs:
+            self.listings.popitem(last=False)
+        found = []
+        for d, name in split:
+            names = self.listings.get(d)
+            found.append(bool(name) and names is not None and name in names)
+        unsure = [i for i, ok in enumerate(found) if not ok]
+        for i, ok in zip(unsure, self.pool.map(os.path.exists, [paths[i] for i in unsure])):
+            found[i] = ok
+        return found
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+
+
+def frame_count_after(after_id: int = 0) -> int:
+    session = SessionLocal()
+    try:
+        return session.query(SurferFrame.id).filter(SurferFrame.id > after_id).count()
+    finally:
+        session.close()
+
+
+def clean_missing_frames(dry_run=False, mark_only=False, after_id=0, batch_size=CLEAN_MISSING_BATCH,
+                         workers=CLEAN_MISSING_WORKERS, on_batch=None) -> dict:
+    """
+    Check every SurferFrame with id > after_id. Rows whose file is gone are deleted (with
+    their derivatives), or set to file_status="missing" with mark_only; rows whose file is
+    back are set to "ok". on_batch(stats) is called after each committed batch; stats["cursor"]
+    is the last id done. An exception propagates with stats["cursor"] still at the last
+    committed batch.
+    """
+    stats = {"cursor": after_id, "scanned": 0, "removed": 0, "marked_missing": 0, "marked_ok": 0,
+             "started_at": time.time()}
+    checker = FileChecker(workers)
+    session = SessionLocal()
+    try:
+        while True:
+            rows = (
+                session.query(SurferFrame.id, SurferFrame.frame_path, SurferFrame.file_status, SurferFrame.derivatives)
+                .filter(SurferFrame.id > stats["cursor"])
+                .order_by(SurferFrame.id)
+                .limit(batch_size)
+                .all()
+            )
+            if not rows:
+                break
+            present = checker.exists([os.path.join(STATIC_ROOT, static_relpath(r.frame_path)) for r in rows])
+            gone = [r for r, ok in zip(rows, present) if not ok]
+            back = [r.id for r, ok in zip(rows, present) if ok and r.file_status != "ok"]
+            if mark_only:
+                gone = [r for r in gone if r.file_status != "missing"]
+
+            if not dry_run:
+                frames = session.query(SurferFrame)
+                if gone and mark_only:
+                    frames.filter(SurferFrame.id.in_([r.id for r in gone])).update(
+                        {SurferFrame.file_status: "missing"}, synchronize_session=False)
+                elif gone:
+                    frames.filter(SurferFrame.id.in_([r.id for r in gone])).delete(synchronize_session=False)
+                if back:
+                    frames.filter(SurferFrame.id.in_(back)).update(
+                        {SurferFrame.file_status: "ok"}, synchronize_session=False)
+                session.commit()
+                if not mark_only:
+                    for r in gone:
+                        if r.derivatives:
+                            remove_derivatives(r.derivatives)
+
+            stats["cursor"] = rows[-1].id
+            stats["scanned"] += len(rows)
+            stats["marked_missing" if mark_only else "removed"] += len(gone)
+            stats["marked_ok"] += len(back)
+            if on_batch is not None:
+                on_batch(stats)
+        return stats
+    except BaseException:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+        checker.close()
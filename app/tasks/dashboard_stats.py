@@ -0,0 +1,130 @@
+# app/tasks/dashboard_stats.py
+"""Per-user dashboard statistics, aggregated in SQL and cached briefly in Redis.
+
+user_stats() runs three small GROUP BY / aggregate queries, so a dashboard view costs the
+same at 100 frames or 100k. The result is cached as JSON under
+`seesea:user:<id>:dashboard_stats` for DASHBOARD_STATS_TTL seconds. Writers that change a
+user's numbers call invalidate_user_stats: MatchResultWriter when it assigns frames, and
+process_video / the upload route when a video is added or changes status. When Redis is
+unavailable the stats are simply computed on every view (see progress._redis).
+
+The gallery's total counts (one per filter combination) are cached the same way, in a
+per-user hash that is dropped together with the stats.
+
+Environment:
+  - DASHBOARD_STATS_TTL: seconds a cached result is served (default 30; 0 disables the cache)
+  - GALLERY_COUNT_TTL: seconds a cached gallery count is served (default 60; 0 disables)
+"""
+import json
+import os
+import time
+from sqlalchemy import func, case
+from dotenv import load_dotenv
+
+from app.models import SurfVideo, SurferFrame
+from app.tasks.progress import _redis, _mark_down
+
+load_dotenv()
+
+DASHBOARD_STATS_TTL = int(os.getenv("DASHBOARD_STATS_TTL", "30"))
+GALLERY_COUNT_TTL = int(os.getenv("GALLERY_COUNT_TTL", "60"))
+HIGH_CONFIDENCE_SCORE = 0.9
+
+
+def stats_key(user_id: int) -> str:
+    return f"seesea:user:{user_id}:dashboard_stats"
+
+
+def counts_key(user_id: int) -> str:
+    return f"seesea:user:{user_id}:frame_counts"
+
+
+def compute_user_stats(session, user_id: int) -> dict:
+    """Video and frame aggregates for one user, without loading any rows."""
+    videos_by_status = dict(
+        session.query(SurfVideo.status, func.count(SurfVideo.id))
+        .filter(SurfVideo.user_id == user_id)
+        .group_by(SurfVideo.status)
+        .all()
+    )
+    n_frames, avg_score, high = session.query(
+        func.count(SurferFrame.id),
+        func.avg(SurferFrame.score),
+        func.sum(case((SurferFrame.score >= HIGH_CONFIDENCE_SCORE, 1), else_=0)),
+    ).filter(SurferFrame.user_id == user_id).one()
+    avg_detection_rate = session.query(
+        func.avg(SurfVideo.processed_frames * 1.0 / SurfVideo.frame_count)
+    ).filter(
+        SurfVideo.user_id == user_id,
+        SurfVideo.status == "completed",
+        SurfVideo.frame_count > 0,
+        SurfVideo.processed_frames > 0,
+    ).scalar()
+    return {
+        "total_videos": sum(videos_by_status.values()),
+        "total_frames": n_frames or 0,
+        "videos_by_status": {str(k): v for k, v in videos_by_status.items()},
+        "avg_score": float(avg_score or 0),
+        "high_confidence_frames": int(high or 0),
+        "avg_detection_rate": float(avg_detection_rate or 0),
+    }
+
+
+def user_stats(session, user_id: int) -> dict:
+    """Cached compute_user_stats."""
+    client = _redis() if DASHBOARD_STATS_TTL > 0 else None
+    if client is not None:
+        try:
+            cached = client.get(stats_key(user_id))
+            if cached:
+                return json.loads(cached)
+        except Exception as e:
+            _mark_down(e)
+            client = None
+    stats = compute_user_stats(session, user_id)
+    if client is not None:
+        try:
+            client.set(stats_key(user_id), json.dumps(stats), ex=DASHBOARD_STATS_TTL)
+        except Exception as e:
+            _mark_down(e)
+    return stats
+
+
+def cached_frame_count(user_id: int, signature: str, compute) -> int:
+    """compute() (a COUNT query), cached per user and filter signature for GALLERY_COUNT_TTL seconds."""
+    client = _redis() if GALLERY_COUNT_TTL > 0 else None
+    if client is not None:
+        try:
+            cached = client.hget(counts_key(user_id), signature)
+            if cached:
+                count, stamp = cached.split(":")
+                if time.time() - float(stamp) < GALLERY_COUNT_TTL:
+                    return int(count)
+        except Exception as e:
+            _mark_down(e)
+            client = None
+    count = int(compute())
+    if client is not None:
+        try:
+            key = counts_key(user_id)
+            pipe = client.pipeline(transaction=False)
+            pipe.hset(key, signature, f"{count}:{time.time()}")
+            pipe.expire(key, GALLERY_COUNT_TTL)
+            pipe.execute()
+        except Exception as e:
+            _mark_down(e)
+    return count
+
+
+def invalidate_user_stats(user_ids) -> None:
+    """Drop cached stats and gallery counts for the given users. Never raises."""
+    keys = [k for u in set(user_ids) if u for k in (stats_key(int(u)), counts_key(int(u)))]
+    if not keys:
+        return
+    client = _redis()
+    if client is None:
+        return
+    try:
+        client.delete(*keys)
+    except Exception as e:
+        _mark_down(e)
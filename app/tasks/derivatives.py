@@ -0,0 +1,122 @@
+# app/tasks/derivatives.py
+"""Sized, re-encoded copies ("derivatives") of frame crops for the gallery views.
+
+For a crop at app/static/<dir>/<name>.jpg, the derivative of width W is written to
+app/static/derivatives/<dir>/<name>_w<W>.<fmt>. process_video writes them next to the crop
+when DERIVATIVES_EAGER is on and records them in SurferFrame.derivatives ({"240": "<rel>"}).
+Frames without them (older rows, or eager mode off) get them lazily: the gallery links to
+upload.frame_derivative, which renders the missing size once and caches it on disk.
+Crops narrower than a target width are re-encoded at their own size, never upscaled.
+
+Environment:
+  - DERIVATIVE_WIDTHS: comma list of widths in pixels (default "240,480")
+  - DERIVATIVE_FORMAT: webp | jpg (default webp)
+  - DERIVATIVE_QUALITY: encoder quality 1-100 (default 80)
+  - DERIVATIVES_EAGER: write derivatives in process_video (default 1)
+
+cv2 is imported inside the functions that encode, so the web tier can import the settings
+and path helpers without loading OpenCV.
+"""
+import json
+import os
+import tempfile
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DERIVATIVE_WIDTHS = sorted({int(w) for w in os.getenv("DERIVATIVE_WIDTHS", "240,480").split(",") if w.strip()})
+DERIVATIVE_FORMAT = os.getenv("DERIVATIVE_FORMAT", "webp").strip().lower()
+DERIVATIVE_QUALITY = int(os.getenv("DERIVATIVE_QUALITY", "80"))
+DERIVATIVES_EAGER = os.getenv("DERIVATIVES_EAGER", "1") not in ("0", "false", "False")
+
+STATIC_ROOT = os.path.join("app", "static")
+DERIVATIVE_DIR = "derivatives"
+
+
+def _encode_params(fmt: str):
+    import cv2
+    if fmt == "webp":
+        return [cv2.IMWRITE_WEBP_QUALITY, DERIVATIVE_QUALITY]
+    return [cv2.IMWRITE_JPEG_QUALITY, DERIVATIVE_QUALITY]
+
+
+def derivative_relpath(src_rel: str, width: int, fmt: str = None) -> str:
+    """Static-relative path of one derivative of the static-relative source path."""
+    stem = os.path.splitext(src_rel.replace("\\", "/"))[0]
+    return f"{DERIVATIVE_DIR}/{stem}_w{width}.{fmt or DERIVATIVE_FORMAT}"
+
+
+def _write_one(img, src_rel: str, width: int):
+    import cv2
+    rel = derivative_relpath(src_rel, width)
+    h, w = img.shape[:2]
+    out = img if w <= width else cv2.resize(img, (width, max(1, round(h * width / w))), interpolation=cv2.INTER_AREA)
+    ok, buf = cv2.imencode(f".{DERIVATIVE_FORMAT}", out, _encode_params(DERIVATIVE_FORMAT))
+    if not ok:
+        return None
+    # Write a temp file and rename it into place, so a concurrent request for the same
+    # derivative (or a crash mid-write) never serves or caches a partial image
+    full = os.path.join(STATIC_ROOT, rel)
+    os.makedirs(os.path.dirname(full), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(full), prefix=".tmp-", suffix=f".{DERIVATIVE_FORMAT}")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(buf.tobytes())
+        os.chmod(tmp, 0o644)  # mkstemp creates 0600; the web server must be able to read it
+        os.replace(tmp, full)
+    except OSError:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        return None
+    return rel
+
+
+def write_derivatives(img, src_rel: str) -> dict:
+    """Write every configured width for an already decoded image. Returns {str(width): rel}."""
+    if img is None or not img.size:
+        return {}
+    out = {}
+    for width in DERIVATIVE_WIDTHS:
+        rel = _write_one(img, src_rel, width)
+        if rel:
+            out[str(width)] = rel
+    return out
+
+
+def ensure_derivative(src_rel: str, width: int):
+    """Static-relative path of one derivative, rendering it from the source if it is missing.
+    None if the width is not configured or the source cannot be read."""
+    if width not in DERIVATIVE_WIDTHS:
+        return None
+    rel = derivative_relpath(src_rel, width)
+    if os.path.exists(os.path.join(STATIC_ROOT, rel)):
+        return rel
+    import cv2
+    img = cv2.imread(os.path.join(STATIC_ROOT, src_rel))
+    if img is None:
+        return None
+    return _write_one(img, src_rel, width)
+
+
+def parse_derivatives(value) -> dict:
+    """SurferFrame.derivatives as {int(width): rel} (empty for NULL or bad JSON)."""
+    if not value:
+        return {}
+    try:
+        return {int(k): v for k, v in json.loads(value).items()}
+    except (ValueError, TypeError, AttributeError):
+        return {}
+
+
+def remove_derivatives(value) -> int:
+    """Delete the derivative files listed in a SurferFrame.derivatives value. Returns files removed."""
+    removed = 0
+    for rel in parse_derivatives(value).values():
+        try:
+            os.remove(os.path.join(STATIC_ROOT, rel))
+            removed += 1
+        except OSError:
+            pass
+    return removed
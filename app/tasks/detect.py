@@ -1,6 +1,5 @@
 import os
 import cv2
-from ultralytics import YOLO
 from datetime import datetime
 from app.database import SessionLocal
 from app.models import SurferFrame
@@ -26,7 +25,10 @@ def detect_and_capture():
     print("[✅] Directories checked/created.")
 
     print("[✅] Loading YOLO model...")
-    model = YOLO(WEIGHTS_PATH)
+    from app.tasks.detector import detect_frame, resolve_detect_config
+    from app.tasks.registry import get_detector
+    model = get_detector()
+    detect_cfg = resolve_detect_config()
 
     cap = cv2.VideoCapture(VIDEO_PATH)
     if not cap.isOpened():
@@ -46,7 +48,7 @@ def detect_and_capture():
         frame_count += 1
         print(f"[🔁] Processing frame {frame_count}...")
 
-        results = model(frame)[0]
+        results = detect_frame(model, frame, detect_cfg)
         for i, box in enumerate(results.boxes):
             conf = float(box.conf)
             if conf < CONFIDENCE_THRESHOLD:
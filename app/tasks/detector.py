@@ -0,0 +1,376 @@
+# app/tasks/detector.py
+"""Surfer detector backends.
+
+process_video only relies on the ultralytics result contract:
+
+    results = detector(frame)[0]
+    for box in results.boxes:
+        float(box.conf), box.xyxy[0], box.cls[0]
+    results.names[int(box.cls[0])]
+
+names is a ClassNames mapping: a class id the model has no name for (an ONNX export
+without "names" metadata) reads as str(id) instead of raising KeyError.
+
+Two backends satisfy it:
+  - "ultralytics": the PyTorch YOLO model (default).
+  - "onnx": an exported ONNX graph run with onnxruntime (see `flask export-detector`).
+    OpenVINO can be used through onnxruntime's OpenVINOExecutionProvider by listing it
+    in DETECTOR_ONNX_PROVIDERS.
+
+Environment:
+  - DETECTOR_BACKEND: ultralytics | onnx (default ultralytics)
+  - DETECTOR_ONNX_PATH: exported model path (default: YOLO weights path with .onnx suffix)
+  - DETECTOR_ONNX_PROVIDERS: comma list (default "CPUExecutionProvider")
+  - DETECTOR_IMGSZ: square network input size for inference and export (default 640)
+  - DETECTOR_NMS_CONF / DETECTOR_NMS_IOU: NMS pre-filter, same defaults as ultralytics predict (0.25 / 0.7)
+
+Inference resolution and tiling (see detect_frame):
+  - DETECT_TILED: 1/0 (default 0). Split large frames into overlapping tiles, run them as
+    a batch at tile resolution and merge the boxes with NMS. Better recall on small,
+    distant surfers in 4K footage at the cost of more detector work per frame.
+  - DETECT_TILE_SIZE: tile edge in source pixels (default 640)
+  - DETECT_TILE_OVERLAP: fractional overlap between neighbouring tiles (default 0.2)
+  - DETECT_TILE_BATCH: tiles per detector call (default 8)
+  - DETECT_TILE_FULL_FRAME: 1/0 (default 1). Also run a downscaled full-frame pass so
+    surfers larger than a tile are not split
+  - DETECT_MERGE_IOU: IoU used when merging tile boxes (default 0.5)
+  - DETECT_CAMERA_PROFILES: JSON object keyed by SurfVideo.location overriding any of
+    imgsz, tiled, tile_size, tile_overlap, tile_batch, tile_full_frame, merge_iou per beach camera,
+    e.g. {"Pipeline": {"tiled": true, "tile_size": 800}}
+"""
+import ast
+import json
+import os
+import cv2
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DETECTOR_BACKEND = os.getenv("DETECTOR_BACKEND", "ultralytics").strip().lower()
+DETECTOR_ONNX_PATH = os.getenv("DETECTOR_ONNX_PATH", "")
+DETECTOR_ONNX_PROVIDERS = [p.strip() for p in os.getenv("DETECTOR_ONNX_PROVIDERS", "CPUExecutionProvider").split(",") if p.strip()]
+DETECTOR_IMGSZ = int(os.getenv("DETECTOR_IMGSZ", "640"))
+DETECTOR_NMS_CONF = float(os.getenv("DETECTOR_NMS_CONF", "0.25"))
+DETECTOR_NMS_IOU = float(os.getenv("DETECTOR_NMS_IOU", "0.7"))
+DETECTOR_MAX_DET = int(os.getenv("DETECTOR_MAX_DET", "300"))
+
+DETECT_TILED = os.getenv("DETECT_TILED", "0") not in ("0", "false", "False")
+DETECT_TILE_SIZE = int(os.getenv("DETECT_TILE_SIZE", "640"))
+DETECT_TILE_OVERLAP = float(os.getenv("DETECT_TILE_OVERLAP", "0.2"))
+DETECT_TILE_BATCH = int(os.getenv("DETECT_TILE_BATCH", "8"))
+DETECT_TILE_FULL_FRAME = os.getenv("DETECT_TILE_FULL_FRAME", "1") not in ("0", "false", "False")
+DETECT_MERGE_IOU = float(os.getenv("DETECT_MERGE_IOU", "0.5"))
+DETECT_CAMERA_PROFILES = os.getenv("DETECT_CAMERA_PROFILES", "")
+
+
+def default_onnx_path(weights_path: str) -> str:
+    return os.path.splitext(weights_path)[0] + ".onnx"
+
+
+# ---------------- Result contract (mirrors ultralytics Results/Boxes) ----------------
+
+class DetectionBox:
+    """One detection. Attribute shapes follow ultralytics: conf scalar, xyxy (1, 4), cls (1,)."""
+    __slots__ = ("conf", "xyxy", "cls")
+
+    def __init__(self, xyxy, conf: float, cls: int):
+        self.conf = np.float32(conf)
+        self.xyxy = np.asarray(xyxy, dtype=np.float32).reshape(1, 4)
+        self.cls = np.asarray([cls], dtype=np.float32)
+
+
+class ClassNames(dict):
+    """Class id -> label. Ids without a name map to str(id)."""
+
+    def __missing__(self, key):
+        return str(key)
+
+
+class DetectionResult:
+    def __init__(self, boxes: list, names: dict):
+        self.boxes = boxes
+        self.names = names
+
+
+# ---------------- Shared numpy helpers ----------------
+
+def nms(boxes: np.ndarray, scores: np.ndarray, iou_thres: float) -> np.ndarray:
+    """Greedy IoU suppression. boxes: (N, 4) xyxy. Returns kept indices, highest score first."""
+    if len(boxes) == 0:
+        return np.zeros((0,), dtype=np.int64)
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = np.maximum(0.0, x2 - x1) * np.maximum(0.0, y2 - y1)
+    order = scores.argsort()[::-1]
+    keep = []
+    while order.size > 0:
+        i = order[0]
+        keep.append(i)
+        if order.size == 1:
+            break
+        rest = order[1:]
+        xx1 = np.maximum(x1[i], x1[rest])
+        yy1 = np.maximum(y1[i], y1[rest])
+        xx2 = np.minimum(x2[i], x2[rest])
+        yy2 = np.minimum(y2[i], y2[rest])
+        inter = np.maximum(0.0, xx2 - xx1) * np.maximum(0.0, yy2 - yy1)
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-9)
+        order = rest[iou <= iou_thres]
+    return np.asarray(keep, dtype=np.int64)
+
+
+def batched_nms(boxes: np.ndarray, scores: np.ndarray, classes: np.ndarray, iou_thres: float) -> np.ndarray:
+    """Class-aware NMS using the ultralytics coordinate-offset trick."""
+    if len(boxes) == 0:
+        return np.zeros((0,), dtype=np.int64)
+    offsets = classes.astype(np.float32)[:, None] * 7680.0
+    return nms(boxes + offsets, scores, iou_thres)
+
+
+def _letterbox(img: np.ndarray, size: int, color=(114, 114, 114)):
+    """Resize keeping aspect ratio and pad to size x size (ultralytics LetterBox, center=True)."""
+    h, w = img.shape[:2]
+    r = min(size / h, size / w)
+    nh, nw = int(round(h * r)), int(round(w * r))
+    if (nh, nw) != (h, w):
+        img = cv2.resize(img, (nw, nh), interpolation=cv2.INTER_LINEAR)
+    dw, dh = (size - nw) / 2, (size - nh) / 2
+    top, bottom = int(round(dh - 0.1)), int(round(dh + 0.1))
+    left, right = int(round(dw - 0.1)), int(round(dw + 0.1))
+    img = cv2.copyMakeBorder(img, top, bottom, left, right, cv2.BORDER_CONSTANT, value=color)
+    return img, r, (left, top)
+
+
+# ---------------- Backends ----------------
+
+class UltralyticsDetector:
+    """PyTorch YOLO; results are native ultralytics Results objects."""
+    backend = "ultralytics"
+
+    def __init__(self, weights_path: str):
+        from ultralytics import YOLO
+        self.model = YOLO(weights_path)
+        self.names = self.model.names
+
+    def __call__(self, source, **kwargs):
+        kwargs.setdefault("verbose", False)
+        kwargs.setdefault("imgsz", DETECTOR_IMGSZ)
+        return self.model(source, **kwargs)
+
+
+class OnnxDetector:
+    """Exported YOLOv8 graph on onnxruntime with letterbox pre- and NMS post-processing."""
+    backend = "onnx"
+
+    def __init__(self, onnx_path: str, providers=None, imgsz: int = DETECTOR_IMGSZ):
+        import onnxruntime as ort
+        if not os.path.exists(onnx_path):
+            raise FileNotFoundError(f"ONNX detector not found at {onnx_path}; run `flask export-detector` first")
+        self.session = ort.InferenceSession(onnx_path, providers=providers or DETECTOR_ONNX_PROVIDERS)
+        inp = self.session.get_inputs()[0]
+        self.input_name = inp.name
+        # Static exports fix H/W (and batch=1); dynamic ones report strings
+        h = inp.shape[2] if len(inp.shape) == 4 else None
+        self.fixed_size = isinstance(h, int)
+        self.imgsz = h if self.fixed_size else imgsz
+        self.dynamic_batch = not isinstance(inp.shape[0], int)
+        meta = self.session.get_modelmeta().custom_metadata_map or {}
+        try:
+            self.names = ClassNames({int(k): v for k, v in ast.literal_eval(meta.get("names", "{}")).items()})
+        except Exception:
+            self.names = ClassNames()
+
+    def _preprocess(self, frames, size: int):
+        blobs, metas = [], []
+        for f in frames:
+            img, r, pad = _letterbox(f, size)
+            blob = img[:, :, ::-1].transpose(2, 0, 1).astype(np.float32) / 255.0
+            blobs.append(blob)
+            metas.append((r, pad, f.shape[:2]))
+        return np.ascontiguousarray(np.stack(blobs)), metas
+
+    def _postprocess(self, pred: np.ndarray, meta, conf_thres: float, iou_thres: float) -> DetectionResult:
+        r, (padx, pady), (h, w) = meta
+        pred = pred.T  # (4 + nc, N) -> (N, 4 + nc)
+        cls_scores = pred[:, 4:]
+        cls = cls_scores.argmax(axis=1)
+        conf = cls_scores[np.arange(len(cls)), cls]
+        mask = conf >= conf_thres
+        if not mask.any():
+            return DetectionResult([], self.names)
+        xywh, conf, cls = pred[mask, :4], conf[mask], cls[mask]
+        xyxy = np.empty_like(xywh)
+        xyxy[:, 0] = xywh[:, 0] - xywh[:, 2] / 2
+        xyxy[:, 1] = xywh[:, 1] - xywh[:, 3] / 2
+        xyxy[:, 2] = xywh[:, 0] + xywh[:, 2] / 2
+        xyxy[:, 3] = xywh[:, 1] + xywh[:, 3] / 2
+        keep = batched_nms(xyxy, conf, cls, iou_thres)[:DETECTOR_MAX_DET]
+        xyxy, conf, cls = xyxy[keep], conf[keep], cls[keep]
+        # Undo letterbox
+        xyxy[:, [0, 2]] = ((xyxy[:, [0, 2]] - padx) / r).clip(0, w)
+        xyxy[:, [1, 3]] = ((xyxy[:, [1, 3]] - pady) / r).clip(0, h)
+        boxes = [DetectionBox(xyxy[i], float(conf[i]), int(cls[i])) for i in range(len(keep))]
+        return DetectionResult(boxes, self.names)
+
+    def __call__(self, source, conf: float = DETECTOR_NMS_CONF, iou: float = DETECTOR_NMS_IOU,
+                 imgsz: int = None, **kwargs):
+        frames = source if isinstance(source, (list, tuple)) else [source]
+        # Dynamic exports accept any multiple of the stride; fixed ones must use their export size
+        size = self.imgsz if (self.fixed_size or not imgsz) else int(imgsz)
+        results = []
+        step = len(frames) if self.dynamic_batch else 1
+        for i in range(0, len(frames), max(1, step)):
+            batch, metas = self._preprocess(frames[i:i + step], size)
+            preds = self.session.run(None, {self.input_name: batch})[0]
+            results.extend(self._postprocess(p, m, conf, iou) for p, m in zip(preds, metas))
+        return results
+
+
+# ---------------- Inference resolution and tiling ----------------
+
+def resolve_detect_config(location: str = None) -> dict:
+    """Detection settings from env, with an optional per-camera override keyed by location."""
+    cfg = {
+        "imgsz": DETECTOR_IMGSZ,
+        "tiled": DETECT_TILED,
+        "tile_size": DETECT_TILE_SIZE,
+        "tile_overlap": DETECT_TILE_OVERLAP,
+        "tile_batch": DETECT_TILE_BATCH,
+        "tile_full_frame": DETECT_TILE_FULL_FRAME,
+        "merge_iou": DETECT_MERGE_IOU,
+    }
+    if DETECT_CAMERA_PROFILES and location:
+        try:
+            profiles = json.loads(DETECT_CAMERA_PROFILES)
+            override = profiles.get(location) or profiles.get(location.strip().lower()) or {}
+            cfg.update({k: v for k, v in override.items() if k in cfg})
+        except Exception as e:
+            print(f"[detector] Ignoring invalid DETECT_CAMERA_PROFILES: {e}")
+    return cfg
+
+
+def _collect(result, scale: float = 1.0, offset=(0, 0)):
+    """Flatten a result into (xyxy, conf, cls) arrays in source-frame coordinates."""
+    boxes, confs, classes = [], [], []
+    for box in result.boxes:
+        boxes.append([float(v) for v in box.xyxy[0]])
+        confs.append(float(box.conf))
+        classes.append(int(box.cls[0]))
+    if not boxes:
+        return np.zeros((0, 4), np.float32), np.zeros((0,), np.float32), np.zeros((0,), np.int64)
+    xyxy = np.asarray(boxes, dtype=np.float32) / scale
+    xyxy[:, [0, 2]] += offset[0]
+    xyxy[:, [1, 3]] += offset[1]
+    return xyxy, np.asarray(confs, dtype=np.float32), np.asarray(classes, dtype=np.int64)
+
+
+def _downscale(frame: np.ndarray, imgsz: int):
+    """Shrink so the long side equals imgsz (never upscale). Returns (image, scale)."""
+    h, w = frame.shape[:2]
+    scale = imgsz / max(h, w)
+    if scale >= 1.0:
+        return frame, 1.0
+    small = cv2.resize(frame, (int(round(w * scale)), int(round(h * scale))), interpolation=cv2.INTER_AREA)
+    return small, scale
+
+
+def _tile_origins(length: int, tile: int, stride: int) -> list[int]:
+    if length <= tile:
+        return [0]
+    origins = list(range(0, length - tile, stride))
+    origins.append(length - tile)  # last tile flush with the border
+    return origins
+
+
+def _names(detector, result=None) -> ClassNames:
+    names = getattr(result, "names", None) if result is not None else None
+    return ClassNames(names or getattr(detector, "names", None) or {})
+
+
+def detect_frame(detector, frame: np.ndarray, cfg: dict = None) -> DetectionResult:
+    """
+    Run the detector on one frame using explicit inference resolution.
+
+    Non-tiled: the frame is downscaled once (INTER_AREA) to cfg["imgsz"] on the long side
+    before inference, so the backend never copies/letterboxes the full-resolution frame.
+    Tiled: overlapping tile_size crops are batched through the detector at tile_size and
+    merged with class-aware NMS (plus an optional downscaled full-frame pass).
+    Boxes are always returned in full-frame coordinates.
+    """
+    cfg = cfg or resolve_detect_config()
+    h, w = frame.shape[:2]
+    imgsz = int(cfg["imgsz"])
+    tile = int(cfg["tile_size"])
+
+    if not cfg["tiled"] or max(h, w) <= tile:
+        small, scale = _downscale(frame, imgsz)
+        result = detector(small, imgsz=imgsz)[0]
+        xyxy, conf, cls = _collect(result, scale)
+        return DetectionResult([DetectionBox(xyxy[i], conf[i], cls[i]) for i in range(len(conf))], _names(detector, result))
+
+    stride = max(1, int(tile * (1.0 - float(cfg["tile_overlap"]))))
+    crops, origins = [], []
+    for y in _tile_origins(h, tile, stride):
+        for x in _tile_origins(w, tile, stride):
+            crops.append(frame[y:y + tile, x:x + tile])
+            origins.append((x, y))
+
+    all_xyxy, all_conf, all_cls = [], [], []
+    names = None
+    batch = max(1, int(cfg["tile_batch"]))
+    for i in range(0, len(crops), batch):
+        results = detector(crops[i:i + batch], imgsz=tile)
+        for result, origin in zip(results, origins[i:i + batch]):
+            names = names or _names(detector, result)
+            xyxy, conf, cls = _collect(result, 1.0, origin)
+            all_xyxy.append(xyxy)
+            all_conf.append(conf)
+            all_cls.append(cls)
+
+    if cfg["tile_full_frame"]:
+        small, scale = _downscale(frame, imgsz)
+        result = detector(small, imgsz=imgsz)[0]
+        xyxy, conf, cls = _collect(result, scale)
+        all_xyxy.append(xyxy)
+        all_conf.append(conf)
+        all_cls.append(cls)
+
+    xyxy = np.concatenate(all_xyxy) if all_xyxy else np.zeros((0, 4), np.float32)
+    conf = np.concatenate(all_conf) if all_conf else np.zeros((0,), np.float32)
+    cls = np.concatenate(all_cls) if all_cls else np.zeros((0,), np.int64)
+    keep = batched_nms(xyxy, conf, cls, float(cfg["merge_iou"]))[:DETECTOR_MAX_DET]
+    boxes = [DetectionBox(xyxy[i], conf[i], cls[i]) for i in keep]
+    return DetectionResult(boxes, names or _names(detector))
+
+
+def load_detector(backend: str = None):
+    """Construct the configured detector backend."""
+    from app.tasks.detect import WEIGHTS_PATH
+    backend = (backend or DETECTOR_BACKEND).strip().lower()
+    if backend == "onnx":
+        path = DETECTOR_ONNX_PATH or default_onnx_path(WEIGHTS_PATH)
+        print(f"[detector] Loading ONNX detector from {path} (providers={DETECTOR_ONNX_PROVIDERS})...")
+        return OnnxDetector(path)
+    if backend == "ultralytics":
+        print(f"[detector] Loading YOLO model from {WEIGHTS_PATH}...")
+        return UltralyticsDetector(WEIGHTS_PATH)
+    raise ValueError(f"Unknown DETECTOR_BACKEND '{backend}' (expected ultralytics or onnx)")
+
+
+# ---------------- Export ----------------
+
+def export_onnx(weights_path: str, output_path: str = None, imgsz: int = DETECTOR_IMGSZ,
+                int8: bool = False, dynamic: bool = True, opset: int = 12) -> str:
+    """Export YOLO weights to ONNX (optionally dynamically INT8-quantized). Returns the written path."""
+    from ultralytics import YOLO
+    output_path = output_path or default_onnx_path(weights_path)
+    exported = YOLO(weights_path).export(format="onnx", imgsz=imgsz, dynamic=dynamic, simplify=True, opset=opset)
+    exported = str(exported)
+    if int8:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantize_dynamic(exported, output_path, weight_type=QuantType.QUInt8)
+        if os.path.abspath(exported) != os.path.abspath(output_path):
+            os.remove(exported)
+    elif os.path.abspath(exported) != os.path.abspath(output_path):
+        os.replace(exported, output_path)
+    return output_path
@@ -8,25 +8,13 @@ from celery import shared_task
 
 from app.database import SessionLocal
 from app.models import UserEmbedding
+from app.tasks.frame_cache import bump_gallery_version
 
-# ---------------- InsightFace (same as before) ----------------
-_face_app = None
+# ---------------- InsightFace (shared per-process instance) ----------------
 
 def _get_face_app():
-    global _face_app
-    if _face_app is not None:
-        return _face_app
-
-    load_dotenv()
-    pack = os.getenv("INSIGHTFACE_PACK", "buffalo_l")
-    providers = [p.strip() for p in os.getenv("INSIGHTFACE_PROVIDERS", "CPUExecutionProvider").split(",") if p.strip()]
-    det_size = int(os.getenv("INSIGHTFACE_DET_SIZE", "640"))
-
-    from insightface.app import FaceAnalysis
-    app = FaceAnalysis(name=pack, providers=providers)
-    app.prepare(ctx_id=0, det_size=(det_size, det_size))
-    _face_app = app
-    return _face_app
+    from app.tasks.registry import get_face_app
+    return get_face_app()
 
 def _l2_normalize(v: np.ndarray) -> np.ndarray:
     n = np.linalg.norm(v)
@@ -273,6 +261,7 @@ def generate_face_embedding(user_id: int, face_path: str, image_type: str = "fro
             if color_emb is not None:
                 _upsert_user_embedding(session, user_id, color_emb, "outfit_color")
 
+        bump_gallery_version(session)
         session.commit()
         print(f"[embed] Stored {emb_type} (and outfit_color={also_color}) for user {user_id}")
         return True
@@ -0,0 +1,228 @@
+# app/tasks/frame_cache.py
+"""Gallery version and cached frame embeddings.
+
+The gallery version is a counter in gallery_state that is bumped whenever a user's
+embeddings are stored. The matcher records the version it scored each frame against
+(SurferFrame.match_gallery_version), so an unmatched frame is only scored again after
+the gallery has changed.
+
+Frame embeddings (face vector + outfit histogram) are computed once with InsightFace and
+cached. SurferFrame.embedding_ref says where:
+  - "mmap:<row>": a row of the memory-mapped store (frame_store.py, the default)
+  - "db:<id>":    a frame_embeddings row (FRAME_EMBEDDING_STORE=db, or caches written
+                  before the store existed; `flask migrate-frame-embeddings` moves them)
+A frame without a ref (new, or redone by process_video) is analysed again.
+Kept free of cv2/InsightFace imports.
+
+Environment:
+  - FRAME_EMBEDDING_STORE: mmap | db (default mmap)
+"""
+import os
+import json
+import numpy as np
+from sqlalchemy import update
+from dotenv import load_dotenv
+
+from app.models import FrameEmbedding, GalleryState, SurferFrame
+from app.tasks.frame_store import get_frame_store, FACE_DIM, COLOR_DIM
+
+load_dotenv()
+
+FRAME_EMBEDDING_STORE = os.getenv("FRAME_EMBEDDING_STORE", "mmap").strip().lower()
+DB_REF_PREFIX = "db:"
+MMAP_REF_PREFIX = "mmap:"
+
+
+# ------------- Gallery version -------------
+
+def current_gallery_version(session) -> int:
+    state = session.query(GalleryState).filter_by(id=1).first()
+    return int(state.version) if state else 0
+
+
+def bump_gallery_version(session) -> None:
+    """Increment the gallery version inside the caller's transaction."""
+    bumped = session.execute(
+        update(GalleryState).where(GalleryState.id == 1).values(version=GalleryState.version + 1)
+    ).rowcount
+    if not bumped:
+        session.add(GalleryState(id=1, version=1))
+
+
+# ------------- Frame embeddings -------------
+
+def _to_json(vec):
+    return json.dumps(np.asarray(vec, dtype=float).tolist()) if vec is not None else None
+
+
+def _from_json(s):
+    return np.asarray(json.loads(s), dtype=np.float32) if s else None
+
+
+def _parse_ref(ref):
+    """Return (kind, number) for a valid embedding_ref, else (None, None)."""
+    for kind, prefix in (("mmap", MMAP_REF_PREFIX), ("db", DB_REF_PREFIX)):
+        if ref and ref.startswith(prefix):
+            try:
+                return kind, int(ref[len(prefix):])
+            except ValueError:
+                return None, None
+    return None, None
+
+
+def _set_refs(session, refs: dict) -> None:
+    """refs: {frame_id: embedding_ref}. The caller commits."""
+    for fid, ref in refs.items():
+        session.execute(
+            update(SurferFrame)
+            .where(SurferFrame.id == fid)
+            # caching is not a change to the frame itself; leave updated_at alone
+            .values(embedding_ref=ref, updated_at=SurferFrame.updated_at)
+            .execution_options(synchronize_session=False)
+        )
+
+
+def load_frame_embeddings(session, frames) -> dict:
+    """Return {frame_id: (face, color)} for the frames whose embedding_ref is valid."""
+    mmap_rows, db_ids = {}, {}
+    for f in frames:
+        kind, num = _parse_ref(getattr(f, "embedding_ref", None))
+        if kind == "mmap":
+            mmap_rows[num] = f.id
+        elif kind == "db":
+            db_ids[num] = f.id
+    out = {}
+    if mmap_rows:
+        rows = list(mmap_rows)
+        try:
+            fids, faces, has_face, colors, has_color = get_frame_store().read(rows)
+        except (IndexError, OSError) as e:
+            print(f"[frame_cache] Could not read frame store rows: {e}")
+        else:
+            for i, row in enumerate(rows):
+                if int(fids[i]) != mmap_rows[row]:
+                    continue  # ref does not belong to this frame; recompute
+                out[int(fids[i])] = (faces[i] if has_face[i] else None, colors[i] if has_color[i] else None)
+    if db_ids:
+        for row in session.query(FrameEmbedding).filter(FrameEmbedding.id.in_(list(db_ids))).all():
+            if db_ids.get(row.id) != row.frame_id:
+                continue
+            out[row.frame_id] = (_from_json(row.face), _from_json(row.color))
+    return out
+
+
+def _store_db(session, items) -> dict:
+    frame_ids = [int(fid) for fid, _, _ in items]
+    existing = {
+        r.frame_id: r
+        for r in session.query(FrameEmbedding).filter(FrameEmbedding.frame_id.in_(frame_ids)).all()
+    }
+    rows = []
+    for fid, face, color in items:
+        row = existing.get(int(fid))
+        if row is None:
+            row = FrameEmbedding(frame_id=int(fid))
+            session.add(row)
+        row.face, row.color = _to_json(face), _to_json(color)
+        rows.append(row)
+    session.flush()
+    return {row.frame_id: f"{DB_REF_PREFIX}{row.id}" for row in rows}
+
+
+def store_frame_embeddings(session, items) -> None:
+    """
+    Cache (frame_id, face, color) items and point each frame's embedding_ref at them.
+    The caller commits (an uncommitted mmap row is simply never referenced).
+    """
+    items = list(items)
+    if not items:
+        return
+    if FRAME_EMBEDDING_STORE == "db":
+        refs = _store_db(session, items)
+    else:
+        rows = get_frame_store().append(items)
+        refs = {int(fid): f"{MMAP_REF_PREFIX}{row}" for (fid, _, _), row in zip(items, rows)}
+    _set_refs(session, refs)
+
+
+def _iter_db_blocks(session, frame_ids: list, batch_size: int):
+    for start in range(0, len(frame_ids), batch_size):
+        chunk = frame_ids[start:start + batch_size]
+        rows = session.query(FrameEmbedding).filter(FrameEmbedding.frame_id.in_(chunk)).all()
+        n = len(rows)
+        if not n:
+            continue
+        ids = np.empty(n, dtype=np.int64)
+        faces = np.zeros((n, FACE_DIM), dtype=np.float32)
+        colors = np.zeros((n, COLOR_DIM), dtype=np.float32)
+        has_face = np.zeros(n, dtype=bool)
+        has_color = np.zeros(n, dtype=bool)
+        for i, row in enumerate(rows):
+            ids[i] = row.frame_id
+            if row.face:
+                faces[i] = _from_json(row.face)
+                has_face[i] = True
+            if row.color:
+                colors[i] = _from_json(row.color)
+                has_color[i] = True
+        yield ids, faces, has_face, colors, has_color
+
+
+def iter_cached_embeddings(session, unmatched_only: bool = True, batch_size: int = 8192):
+    """
+    Stream cached embeddings as matrices.
+    Yields (frame_ids, faces, has_face, colors, has_color) with faces (n, FACE_DIM) and
+    colors (n, COLOR_DIM) float32; rows without a face/color are zeros with the mask False.
+    Store rows are read in row order straight from the memory map; frames without a valid
+    cache entry are not included (nothing is recomputed here).
+    """
+    q = session.query(SurferFrame.id, SurferFrame.embedding_ref).filter(SurferFrame.embedding_ref.isnot(None))
+    if unmatched_only:
+        q = q.filter(SurferFrame.user_id == 0)
+    expected, rows, db_frames = [], [], []
+    for fid, ref in q.yield_per(10000):
+        kind, num = _parse_ref(ref)
+        if kind == "mmap":
+            rows.append(num)
+            expected.append(fid)
+        elif kind == "db":
+            db_frames.append(fid)
+
+    if rows:
+        rows = np.asarray(rows, dtype=np.int64)
+        expected = np.asarray(expected, dtype=np.int64)
+        order = np.argsort(rows)
+        rows, expected = rows[order], expected[order]
+        store = get_frame_store()
+        for start in range(0, rows.size, batch_size):
+            fids, faces, has_face, colors, has_color = store.read(rows[start:start + batch_size])
+            ok = fids == expected[start:start + batch_size]
+            if not ok.all():
+                fids, faces, has_face, colors, has_color = fids[ok], faces[ok], has_face[ok], colors[ok], has_color[ok]
+            yield fids, faces, has_face, colors, has_color
+
+    yield from _iter_db_blocks(session, db_frames, batch_size)
+
+
+def migrate_db_embeddings(session, batch_size: int = 1000) -> int:
+    """Move frame_embeddings rows into the memory-mapped store. Returns the number moved."""
+    moved = 0
+    while True:
+        rows = session.query(FrameEmbedding).order_by(FrameEmbedding.id).limit(batch_size).all()
+        if not rows:
+            return moved
+        items = [(r.frame_id, _from_json(r.face), _from_json(r.color)) for r in rows]
+        store_rows = get_frame_store().append(items)
+        # Only repoint frames that still reference the migrated row
+        for r, store_row in zip(rows, store_rows):
+            session.execute(
+                update(SurferFrame)
+                .where(SurferFrame.id == r.frame_id)
+                .where(SurferFrame.embedding_ref == f"{DB_REF_PREFIX}{r.id}")
+                .values(embedding_ref=f"{MMAP_REF_PREFIX}{store_row}", updated_at=SurferFrame.updated_at)
+                .execution_options(synchronize_session=False)
+            )
+            session.delete(r)
+        session.commit()
+        moved += len(rows)
+        print(f"[frame_cache] Migrated {moved} frame embeddings to the frame store")
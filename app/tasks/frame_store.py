@@ -0,0 +1,163 @@
+# app/tasks/frame_store.py
+"""Append-only, memory-mapped store for frame embeddings.
+
+Layout under FRAME_STORE_DIR:
+  faces.f16   row-major float16 matrix, FACE_DIM columns (L2-normalized face vectors)
+  colors.f32  row-major float32 matrix, COLOR_DIM columns (HSV outfit histograms)
+  index.i64   sidecar index, one (frame_id, flags) int64 pair per row;
+              flags bit 0 = row has a face, bit 1 = row has a color histogram
+  lock        fcntl lock file serialising appends across processes
+
+A row is only visible once its index entry is written, and data is written at the offset
+given by the index length, so a writer killed halfway leaves no misaligned rows. Rows are
+never rewritten: re-embedding a frame appends a new row, and SurferFrame.embedding_ref
+("mmap:<row>") says which row is current. Readers map the files read-only and remap
+when the index has grown.
+
+Environment:
+  - FRAME_STORE_DIR: directory of the store (default instance/frame_store)
+"""
+import os
+import threading
+import numpy as np
+from dotenv import load_dotenv
+
+try:
+    import fcntl
+except ImportError:  # Windows dev setups: appends are then only serialised within a process
+    fcntl = None
+
+load_dotenv()
+
+FRAME_STORE_DIR = os.getenv("FRAME_STORE_DIR", os.path.join("instance", "frame_store"))
+FACE_DIM = 512    # InsightFace recognition embedding size
+COLOR_DIM = 144   # embed._hsv_hist default bins (12 x 4 x 3)
+HAS_FACE, HAS_COLOR = 1, 2
+
+
+class FrameEmbeddingStore:
+    def __init__(self, path: str = FRAME_STORE_DIR):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.faces_path = os.path.join(path, "faces.f16")
+        self.colors_path = os.path.join(path, "colors.f32")
+        self.index_path = os.path.join(path, "index.i64")
+        self._lock_path = os.path.join(path, "lock")
+        self._thread_lock = threading.Lock()
+        self._maps = None  # (rows, faces, colors, index) memmaps
+
+    # ------------- Writing -------------
+
+    def append(self, items) -> list:
+        """Append (frame_id, face, color) items. Returns the row number of each item."""
+        items = list(items)
+        if not items:
+            return []
+        n = len(items)
+        faces = np.zeros((n, FACE_DIM), dtype=np.float16)
+        colors = np.zeros((n, COLOR_DIM), dtype=np.float32)
+        index = np.zeros((n, 2), dtype=np.int64)
+        for i, (fid, face, color) in enumerate(items):
+            flags = 0
+            if face is not None:
+                faces[i] = np.asarray(face, dtype=np.float32).reshape(FACE_DIM)
+                flags |= HAS_FACE
+            if color is not None:
+                colors[i] = np.asarray(color, dtype=np.float32).reshape(COLOR_DIM)
+                flags |= HAS_COLOR
+            index[i] = (int(fid), flags)
+
+        with self._thread_lock, open(self._lock_path, "a+b") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            try:
+                start = self._index_rows()
+                self._write_at(self.faces_path, start * faces[0].nbytes, faces)
+                self._write_at(self.colors_path, start * colors[0].nbytes, colors)
+                # Index last: the rows become visible only once their data is in place
+                self._write_at(self.index_path, start * index[0].nbytes, index)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+        return list(range(start, start + n))
+
+    @staticmethod
+    def _write_at(path: str, offset: int, arr: np.ndarray):
+        """Write all of arr at offset. os.write may write less than asked (a signal, a full
+        disk), so loop until every byte is out; raises OSError if the file stops growing."""
+        data = memoryview(arr.tobytes())
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.lseek(fd, offset, os.SEEK_SET)
+            while data:
+                written = os.write(fd, data)
+                if written <= 0:
+                    raise OSError(f"Short write to {path} at offset {offset}: {len(data)} bytes left")
+                data = data[written:]
+        finally:
+            os.close(fd)
+
+    def _index_rows(self) -> int:
+        try:
+            return os.path.getsize(self.index_path) // 16
+        except OSError:
+            return 0
+
+    # ------------- Reading -------------
+
+    def __len__(self):
+        return self._index_rows()
+
+    def _mapped(self, min_rows: int = 0):
+        """Current memmaps, remapped if rows were appended since they were opened."""
+        if self._maps is None or self._maps[0] < min_rows:
+            rows = self._index_rows()
+            if rows == 0:
+                return 0, None, None, None
+            self._maps = (
+                rows,
+                np.memmap(self.faces_path, dtype=np.float16, mode="r", shape=(rows, FACE_DIM)),
+                np.memmap(self.colors_path, dtype=np.float32, mode="r", shape=(rows, COLOR_DIM)),
+                np.memmap(self.index_path, dtype=np.int64, mode="r", shape=(rows, 2)),
+            )
+        return self._maps
+
+    def read(self, rows):
+        """
+        Gather rows into dense arrays.
+        Returns (frame_ids, faces float32 (n, FACE_DIM), has_face, colors (n, COLOR_DIM), has_color).
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        n_rows, faces, colors, index = self._mapped(int(rows.max()) + 1 if rows.size else 0)
+        if rows.size and rows.max() >= n_rows:
+            raise IndexError(f"frame store row {int(rows.max())} beyond {n_rows} rows")
+        if not rows.size:
+            return (np.zeros(0, dtype=np.int64), np.zeros((0, FACE_DIM), dtype=np.float32), np.zeros(0, dtype=bool),
+                    np.zeros((0, COLOR_DIM), dtype=np.float32), np.zeros(0, dtype=bool))
+        idx = index[rows]
+        return (
+            idx[:, 0].copy(),
+            faces[rows].astype(np.float32),
+            (idx[:, 1] & HAS_FACE) > 0,
+            np.asarray(colors[rows]),
+            (idx[:, 1] & HAS_COLOR) > 0,
+        )
+
+    def iter_blocks(self, rows, block_size: int = 8192):
+        """Yield read() results for rows in blocks (rows sorted first for sequential access)."""
+        rows = np.sort(np.asarray(rows, dtype=np.int64))
+        for start in range(0, rows.size, block_size):
+            yield self.read(rows[start:start + block_size])
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_frame_store() -> FrameEmbeddingStore:
+    """Per-process store instance."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = FrameEmbeddingStore()
+        return _store
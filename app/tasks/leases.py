@@ -0,0 +1,88 @@
+# app/tasks/leases.py
+"""Processing leases for SurfVideo rows.
+
+A worker running process_video holds a lease (lease_owner + lease_expires_at) that it
+renews with every checkpoint commit. If the worker dies, the lease simply expires: the
+video is then "stale" and may be picked up again, resuming from SurfVideo.checkpoint_frame.
+A lease can be taken on a pending or failed video, or on a processing one whose lease has
+expired, was handed over for a requeue (no owner) or is already ours. A completed video is
+never taken, so a duplicate process_video task (a redelivery, a second requeue, a double
+click) does nothing.
+Kept free of cv2/ML imports so the web tier can use is_lease_stale().
+
+Environment:
+  - VIDEO_LEASE_TTL: seconds a lease stays valid without renewal (default 300)
+  - VIDEO_MATCH_LEASE_TTL: lease taken for inline matching at the end of process_video,
+    which renews nothing while it runs (default 3600, the match queue's time limit)
+"""
+import os
+import socket
+from datetime import datetime, timedelta
+from sqlalchemy import and_, or_, update
+from dotenv import load_dotenv
+
+from app.models import SurfVideo
+
+load_dotenv()
+
+VIDEO_LEASE_TTL = int(os.getenv("VIDEO_LEASE_TTL", "300"))
+VIDEO_MATCH_LEASE_TTL = int(os.getenv("VIDEO_MATCH_LEASE_TTL", "3600"))
+ACQUIRABLE_STATUSES = ("pending", "failed")
+
+
+def lease_owner_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def lease_deadline(now: datetime = None, ttl: int = None) -> datetime:
+    return (now or datetime.utcnow()) + timedelta(seconds=VIDEO_LEASE_TTL if ttl is None else ttl)
+
+
+def is_lease_stale(video, now: datetime = None) -> bool:
+    """True if the video claims to be processing but nobody has renewed its lease in time."""
+    if video is None or video.status != "processing":
+        return False
+    expires = getattr(video, "lease_expires_at", None)
+    return expires is None or expires < (now or datetime.utcnow())
+
+
+def acquire_video_lease(session, video_id: int, owner: str) -> bool:
+    """Atomically take the lease of a pending/failed video, or of a processing one whose lease
+    expired, was released for a requeue, or is already ours. Commits; True if taken."""
+    now = datetime.utcnow()
+    stmt = (
+        update(SurfVideo)
+        .where(SurfVideo.id == video_id)
+        .where(or_(
+            SurfVideo.status.in_(ACQUIRABLE_STATUSES),
+            and_(
+                SurfVideo.status == "processing",
+                or_(
+                    SurfVideo.lease_owner.is_(None),
+                    SurfVideo.lease_owner == owner,
+                    SurfVideo.lease_expires_at.is_(None),
+                    SurfVideo.lease_expires_at < now,
+                ),
+            ),
+        ))
+        .values(status="processing", lease_owner=owner, lease_expires_at=lease_deadline(now))
+        .execution_options(synchronize_session=False)
+    )
+    acquired = session.execute(stmt).rowcount == 1
+    session.commit()
+    return acquired
+
+
+def hand_over_for_requeue(video, now: datetime = None):
+    """
+    Mark a stale video as handed to a newly enqueued task: the dead owner is dropped, so the
+    next worker can take it, and the expiry moves forward, so is_lease_stale (and with it the
+    periodic sweep) leaves it alone while the task waits in the queue. The caller commits.
+    """
+    video.lease_owner = None
+    video.lease_expires_at = lease_deadline(now)
+
+
+def release_video_lease(video):
+    video.lease_owner = None
+    video.lease_expires_at = None
@@ -3,11 +3,15 @@ import os
 import json
 import cv2
 import numpy as np
-from celery import shared_task
+from celery import shared_task, chord, group
 from dotenv import load_dotenv
+from sqlalchemy import or_
 
 from app.models import SurferFrame, UserEmbedding
+from app.metrics import timed
 from app.database import SessionLocal
+from app.tasks.match_writer import MatchResultWriter
+from app.tasks.frame_cache import current_gallery_version, load_frame_embeddings, store_frame_embeddings
 from app.tasks.embed import _get_face_app, _l2_normalize, _select_best_face, _hsv_hist, _torso_roi_from_face
 
 # ------------- Config -------------
@@ -22,6 +26,9 @@ FACE_MIN_ACCEPT = float(os.getenv("FACE_MIN_ACCEPT", "0.35"))    # accept if fac
 TOP2_GAP = float(os.getenv("TOP2_GAP", "0.06"))                  # best-vs-second margin for acceptance
 COLOR_ONLY_GAP = float(os.getenv("COLOR_ONLY_GAP", "0.08"))      # margin for color-only acceptance
 DET_SIZE = int(os.getenv("INSIGHTFACE_DET_SIZE", "640"))
+MATCH_FAN_OUT = os.getenv("MATCH_FAN_OUT", "1") not in ("0", "false", "False")  # dispatch chunks instead of a serial loop
+MATCH_CHUNK_SIZE = int(os.getenv("MATCH_CHUNK_SIZE", "200"))     # frames per match_frame_chunk task
+MATCH_WRITE_BATCH = int(os.getenv("MATCH_WRITE_BATCH", "500"))   # results per bulk UPDATE
 
 
 # ------------- Helpers -------------
@@ -233,6 +240,98 @@ def _score_color(frame_color: np.ndarray, user_colors: list[np.ndarray]) -> floa
         return 0.0
     return max((_hist_intersection(frame_color, uc) for uc in user_colors), default=0.0)
 
+@timed("score")
+def _decide_match(f_face, f_color, faces_map: dict, colors_map: dict):
+    """
+    Apply the acceptance rules to one frame's embeddings against the loaded gallery.
+    Returns (user_id, score, detail): user_id is 0 when no match is accepted.
+    """
+    # Score all users
+    candidates = []  # (uid, total, face_score, color_score)
+    all_uids = set(list(faces_map.keys()) + list(colors_map.keys()))
+    for uid in all_uids:
+        face_score  = _score_face(f_face, faces_map.get(uid, {})) if f_face is not None else 0.0
+        color_score = _score_color(f_color, colors_map.get(uid, [])) if f_color is not None else 0.0
+        total = FACE_WEIGHT * face_score + COLOR_WEIGHT * color_score
+        candidates.append((uid, total, face_score, color_score))
+
+    if not candidates:
+        return 0, 0.0, "no candidates after scoring"
+
+    # Sort to get top-2
+    candidates.sort(key=lambda x: x[1], reverse=True)
+    best_uid, best_total, best_face, best_color = candidates[0]
+    second_total = candidates[1][1] if len(candidates) > 1 else -1.0
+    second_face = candidates[1][2] if len(candidates) > 1 else -1.0
+    margin_total = best_total - second_total
+    margin_face = best_face - second_face
+
+    # Color-only path
+    if f_face is None and f_color is not None:
+        if best_total >= COLOR_ONLY_THRESHOLD and (len(candidates) == 1 or margin_total >= COLOR_ONLY_GAP):
+            return int(best_uid), float(best_total), f"color-only={best_total:.3f}, margin={margin_total:.3f}"
+        return 0, float(best_total), f"no color-only match over threshold/margin (best={best_total:.3f}, margin={margin_total:.3f})"
+
+    # Combined acceptance
+    if best_total >= MATCH_THRESHOLD and (len(candidates) == 1 or margin_total >= TOP2_GAP):
+        return int(best_uid), float(best_total), f"combined={best_total:.3f}, margin={margin_total:.3f}"
+
+    # Face-strong fallback acceptance
+    if f_face is not None and best_face >= FACE_MIN_ACCEPT and (len(candidates) == 1 or margin_total >= TOP2_GAP or margin_face >= TOP2_GAP):
+        return int(best_uid), float(best_total), f"face-strong={best_face:.3f}, total={best_total:.3f}, margin_t={margin_total:.3f}, margin_f={margin_face:.3f}"
+
+    return 0, float(best_total), f"no match accepted (best_total={best_total:.3f}, best_face={best_face:.3f}, margin_t={margin_total:.3f}, margin_f={margin_face:.3f})"
+
+def _frame_embeddings(session, frames: list) -> dict:
+    """
+    Return {frame_id: (face, color)}, using cached embeddings where available.
+    Frames without a cache entry are analysed with InsightFace once and cached (committed here).
+    A frame whose image cannot be read maps to None (not cached); one whose analysis raised
+    is left out and tried again on a later sweep.
+    """
+    cached = load_frame_embeddings(session, frames)
+    fresh = []
+    for frame in frames:
+        if frame.id in cached:
+            continue
+        try:
+            with timed("frame_embed"):
+                f_face, f_color = _compute_frame_face_embedding_and_color(frame)
+        except Exception as e:
+            print(f"[match] Error embedding frame {frame.id}: {e}")
+            continue
+        if f_face is None and f_color is None:
+            cached[frame.id] = None  # unreadable image
+            continue
+        cached[frame.id] = (f_face, f_color)
+        fresh.append((frame.id, f_face, f_color))
+    if fresh:
+        try:
+            store_frame_embeddings(session, fresh)
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            print(f"[match] Could not cache {len(fresh)} frame embeddings: {e}")
+    return cached
+
+def _score_frames(session, frames: list, faces_map: dict, colors_map: dict):
+    """
+    Yield (frame_id, user_id, score, detail) for every frame that has embeddings. An unreadable
+    frame is yielded as rejected, so it is stamped with the gallery version and not re-read by
+    every sweep until the gallery changes.
+    """
+    frame_ids = [frame.id for frame in frames]  # read before the cache commit expires the objects
+    embeddings = _frame_embeddings(session, frames)
+    for fid in frame_ids:
+        if fid not in embeddings:
+            continue
+        if embeddings[fid] is None:
+            yield fid, 0, 0.0, "unreadable image"
+            continue
+        f_face, f_color = embeddings[fid]
+        uid, score, detail = _decide_match(f_face, f_color, faces_map, colors_map)
+        yield fid, uid, score, detail
+
 def match_surfer_to_users(frame_id: int) -> int:
     session = SessionLocal()
     try:
@@ -241,62 +340,25 @@ def match_surfer_to_users(frame_id: int) -> int:
             print(f"[match] Frame {frame_id} not found")
             return 0
 
-        f_face, f_color = _compute_frame_face_embedding_and_color(frame)
+        gallery_version = current_gallery_version(session)
         faces_map, colors_map = _load_user_embeddings(session)
 
         if not faces_map and not colors_map:
             print("[match] No user embeddings in DB")
             return 0
 
-        # Score all users
-        candidates = []  # (uid, total, face_score, color_score)
-        all_uids = set(list(faces_map.keys()) + list(colors_map.keys()))
-        for uid in all_uids:
-            face_score  = _score_face(f_face, faces_map.get(uid, {})) if f_face is not None else 0.0
-            color_score = _score_color(f_color, colors_map.get(uid, [])) if f_color is not None else 0.0
-            total = FACE_WEIGHT * face_score + COLOR_WEIGHT * color_score
-            candidates.append((uid, total, face_score, color_score))
-
-        if not candidates:
-            print("[match] No candidates after scoring")
-            return 0
-
-        # Sort to get top-2
-        candidates.sort(key=lambda x: x[1], reverse=True)
-        best_uid, best_total, best_face, best_color = candidates[0]
-        second_total = candidates[1][1] if len(candidates) > 1 else -1.0
-        second_face = candidates[1][2] if len(candidates) > 1 else -1.0
-        margin_total = best_total - second_total
-        margin_face = best_face - second_face
-
-        # Color-only path
-        if f_face is None and f_color is not None:
-            if best_total >= COLOR_ONLY_THRESHOLD and (len(candidates) == 1 or margin_total >= COLOR_ONLY_GAP):
-                frame.user_id = int(best_uid)
-                frame.score = float(best_total)
-                session.commit()
-                print(f"[match] Frame {frame_id} -> user {best_uid} (color-only={best_total:.3f}, margin={margin_total:.3f})")
-                return best_uid
-            print(f"[match] No color-only match over threshold/margin for frame {frame_id} (best={best_total:.3f}, margin={margin_total:.3f})")
+        scored = list(_score_frames(session, [frame], faces_map, colors_map))
+        if not scored:
             return 0
-
-        # Combined acceptance
-        if best_total >= MATCH_THRESHOLD and (len(candidates) == 1 or margin_total >= TOP2_GAP):
-            frame.user_id = int(best_uid)
-            frame.score = float(best_total)
-            session.commit()
-            print(f"[match] Frame {frame_id} -> user {best_uid} (combined={best_total:.3f}, margin={margin_total:.3f})")
-            return best_uid
-
-        # Face-strong fallback acceptance
-        if f_face is not None and best_face >= FACE_MIN_ACCEPT and (len(candidates) == 1 or margin_total >= TOP2_GAP or margin_face >= TOP2_GAP):
-            frame.user_id = int(best_uid)
-            frame.score = float(best_total)
-            session.commit()
-            print(f"[match] Frame {frame_id} -> user {best_uid} (face-strong={best_face:.3f}, total={best_total:.3f}, margin_t={margin_total:.3f}, margin_f={margin_face:.3f})")
-            return best_uid
-
-        print(f"[match] No match accepted for frame {frame_id} (best_total={best_total:.3f}, best_face={best_face:.3f}, margin_t={margin_total:.3f}, margin_f={margin_face:.3f})")
+        _, uid, score, detail = scored[0]
+        writer = MatchResultWriter(session, gallery_version)
+        writer.add(frame_id, uid, score)
+        writer.flush()
+        if uid:
+            print(f"[match] Frame {frame_id} -> user {uid} ({detail})")
+            return uid
+
+        print(f"[match] Frame {frame_id}: {detail}")
         return 0
 
     except Exception as e:
@@ -306,22 +368,110 @@ def match_surfer_to_users(frame_id: int) -> int:
     finally:
         session.close()
 
+def _unmatched_frame_ids(session, gallery_version: int) -> list:
+    """Unmatched frames with a file (file_status "ok") not yet scored against this gallery version."""
+    q = (
+        session.query(SurferFrame.id)
+        .filter(SurferFrame.user_id == 0, SurferFrame.file_status == "ok")
+        .filter(or_(
+            SurferFrame.match_gallery_version.is_(None),
+            SurferFrame.match_gallery_version < gallery_version,
+        ))
+        .order_by(SurferFrame.id)
+    )
+    return [fid for (fid,) in q.all()]
+
+# ------------- Fan-out matching -------------
+
+def _chunked(ids: list, size: int) -> list:
+    return [ids[i:i + size] for i in range(0, len(ids), size)]
+
+@shared_task(name="match_frame_chunk")
+def match_frame_chunk(frame_ids: list) -> list:
+    """
+    Score a chunk of frames against the gallery, loaded once for the whole chunk.
+    Returns [[frame_id, user_id, score], ...] for every scored frame (user_id 0 = rejected).
+    Only the frame embedding cache is written here; results are applied by the callback.
+    """
+    session = SessionLocal()
+    results = []
+    try:
+        faces_map, colors_map = _load_user_embeddings(session)
+        if not faces_map and not colors_map:
+            print("[match] No user embeddings in DB")
+            return results
+        frames = session.query(SurferFrame).filter(SurferFrame.id.in_(frame_ids)).all()
+        for fid, uid, score, _ in _score_frames(session, frames, faces_map, colors_map):
+            results.append([int(fid), uid, score])
+        print(f"[match] Chunk of {len(frame_ids)} frames -> {sum(1 for r in results if r[1])} matches")
+        return results
+    finally:
+        session.close()
+
+@shared_task(name="apply_match_assignments")
+def apply_match_assignments(chunk_results: list, gallery_version: int = None) -> int:
+    """
+    Chord callback: record every chunk's results in bulk (see MatchResultWriter).
+    Returns the number of frames assigned to a user.
+    """
+    session = SessionLocal()
+    try:
+        writer = MatchResultWriter(session, gallery_version, flush_every=MATCH_WRITE_BATCH)
+        for chunk in (chunk_results or []):
+            writer.extend(chunk or [])
+        writer.flush()
+        print(f"[match] Applied {writer.assigned} assignments, recorded {writer.rejected} rejected attempts")
+        return writer.assigned
+    except Exception as e:
+        print(f"[match] Failed to apply assignments: {e}")
+        return 0
+    finally:
+        session.close()
+
+def dispatch_match_chunks(frame_ids: list, gallery_version: int = None, chunk_size: int = None):
+    """Fan frame ids out as a chord of match_frame_chunk tasks with apply_match_assignments as callback."""
+    chunks = _chunked(list(frame_ids), max(1, chunk_size or MATCH_CHUNK_SIZE))
+    if not chunks:
+        return None
+    callback = apply_match_assignments.s(gallery_version=gallery_version)
+    job = chord(group(match_frame_chunk.s(c) for c in chunks))(callback)
+    print(f"[match] Dispatched {len(frame_ids)} frames in {len(chunks)} chunks (chord id={getattr(job, 'id', None)})")
+    return job
+
 @shared_task(name="match_all_frames")
 def match_all_frames():
     """
-    Match all frames with user_id=0. Returns count of matched.
+    Match all frames with user_id=0 that were not yet scored against the current gallery.
+    Frame embeddings are cached, so a frame is only analysed with InsightFace once.
+    With MATCH_FAN_OUT=1 (default) the frames are dispatched as chunks to the matching
+    queue and the number of dispatched frames is returned; otherwise they are matched
+    serially in this process (gallery loaded once, results written in batches) and the
+    count of matched frames is returned.
     """
     session = SessionLocal()
     try:
-        to_match = session.query(SurferFrame).filter_by(user_id=0).all()
-        print(f"[match] Found {len(to_match)} unmatched frames")
-        count = 0
-        for f in to_match:
-            if match_surfer_to_users(f.id) > 0:
-                count += 1
-        return count
+        # Read the version before the gallery: if it changes meanwhile, frames get another pass
+        gallery_version = current_gallery_version(session)
+        ids = _unmatched_frame_ids(session, gallery_version)
+        print(f"[match] Found {len(ids)} unmatched frames to score (gallery v{gallery_version})")
+        if MATCH_FAN_OUT:
+            dispatch_match_chunks(ids, gallery_version)
+            return len(ids)
+        faces_map, colors_map = _load_user_embeddings(session)
+        if not faces_map and not colors_map:
+            print("[match] No user embeddings in DB")
+            return 0
+        writer = MatchResultWriter(session, gallery_version, flush_every=MATCH_WRITE_BATCH)
+        for chunk in _chunked(ids, MATCH_WRITE_BATCH):
+            frames = session.query(SurferFrame).filter(SurferFrame.id.in_(chunk)).all()
+            for fid, uid, score, _ in _score_frames(session, frames, faces_map, colors_map):
+                writer.add(fid, uid, score)
+            writer.flush()
+            session.expunge_all()
+        return writer.assigned
     except Exception as e:
+        session.rollback()
         print(f"[match] Batch error: {e}")
         return 0
     finally:
-        session.close()
\ No newline at end of file
+        session.close()
@@ -0,0 +1,120 @@
+# app/tasks/match_writer.py
+"""Batched persistence of match results.
+
+Matching code collects one (frame_id, user_id, score) tuple per scored frame, with
+user_id=0 for a rejected frame, and flushes them in bulk:
+  - PostgreSQL: a single UPDATE ... FROM (VALUES ...) per batch
+  - other dialects (SQLite): an executemany UPDATE
+Every recorded frame gets match_attempts + 1, last_match_at and the gallery version it was
+scored against, so a rejected frame is not rescored until the gallery changes. Accepted
+frames also get user_id/score. Rows whose user_id is no longer 0 (matched elsewhere
+meanwhile) are not touched, so the assigned/rejected counts (and MATCH_RESULTS) come from
+the rows the UPDATEs actually changed, not from the results handed in. Users that gained
+frames get their cached dashboard stats dropped.
+"""
+from datetime import datetime
+from sqlalchemy import update, bindparam, text, func
+
+from app.models import SurferFrame
+from app.metrics import timed, MATCH_RESULTS
+from app.tasks.dashboard_stats import invalidate_user_stats
+
+PG_VALUES_BATCH = 1000  # rows per UPDATE ... FROM (VALUES ...) statement
+
+
+class MatchResultWriter:
+    def __init__(self, session, gallery_version: int = None, flush_every: int = 500):
+        self.session = session
+        self.gallery_version = gallery_version
+        self.flush_every = flush_every
+        self.pending = []
+        self.assigned = 0
+        self.rejected = 0
+
+    def add(self, frame_id: int, user_id: int, score: float):
+        self.pending.append((int(frame_id), int(user_id or 0), float(score or 0.0)))
+        if self.flush_every and len(self.pending) >= self.flush_every:
+            self.flush()
+
+    def extend(self, rows):
+        for frame_id, user_id, score in rows:
+            self.add(frame_id, user_id, score)
+
+    def flush(self) -> int:
+        """Write and commit pending results. Returns the number of rows updated."""
+        rows, self.pending = self.pending, []
+        if not rows:
+            return 0
+        now = datetime.utcnow()
+        try:
+            with timed("assign"):
+                if self.session.get_bind().dialect.name == "postgresql":
+                    n_assigned, n_rejected, gained = self._flush_values(rows, now)
+                else:
+                    n_assigned, n_rejected, gained = self._flush_executemany(rows, now)
+                self.session.commit()
+        except Exception:
+            self.session.rollback()
+            raise
+        self.assigned += n_assigned
+        self.rejected += n_rejected
+        MATCH_RESULTS.inc(n_assigned, outcome="assigned")
+        MATCH_RESULTS.inc(n_rejected, outcome="rejected")
+        if gained:
+            invalidate_user_stats(gained)
+        return n_assigned + n_rejected
+
+    def _flush_values(self, rows, now):
+        n_assigned, n_rejected, gained = 0, 0, set()
+        for start in range(0, len(rows), PG_VALUES_BATCH):
+            batch = rows[start:start + PG_VALUES_BATCH]
+            params = {"now": now, "gv": self.gallery_version}
+            values = []
+            for i, (fid, uid, score) in enumerate(batch):
+                values.append(f"(CAST(:id{i} AS INTEGER), CAST(:u{i} AS INTEGER), CAST(:s{i} AS DOUBLE PRECISION))")
+                params.update({f"id{i}": fid, f"u{i}": uid, f"s{i}": score})
+            sql = (
+                "UPDATE surfer_frames AS f SET "
+                "user_id = CASE WHEN v.user_id > 0 THEN v.user_id ELSE f.user_id END, "
+                "score = CASE WHEN v.user_id > 0 THEN v.score ELSE f.score END, "
+                "match_attempts = COALESCE(f.match_attempts, 0) + 1, "
+                "last_match_at = :now, match_gallery_version = CAST(:gv AS INTEGER), "
+                "updated_at = CASE WHEN v.user_id > 0 THEN :now ELSE f.updated_at END "
+                f"FROM (VALUES {', '.join(values)}) AS v(id, user_id, score) "
+                "WHERE f.id = v.id AND f.user_id = 0 "
+                "RETURNING v.user_id"
+            )
+            for uid, in self.session.execute(text(sql), params):
+                if uid > 0:
+                    n_assigned += 1
+                    gained.add(uid)
+                else:
+                    n_rejected += 1
+        return n_assigned, n_rejected, gained
+
+    def _flush_executemany(self, rows, now):
+        table = SurferFrame.__table__
+        attempts = func.coalesce(table.c.match_attempts, 0) + 1
+        guard = (table.c.id == bindparam("b_id")) & (table.c.user_id == 0)
+        accepted = [{"b_id": fid, "b_user_id": uid, "b_score": score} for fid, uid, score in rows if uid]
+        rejected = [{"b_id": fid} for fid, uid, _ in rows if not uid]
+        n_assigned = n_rejected = 0
+        if accepted:
+            n_assigned = self.session.execute(
+                update(table).where(guard).values(
+                    user_id=bindparam("b_user_id"), score=bindparam("b_score"),
+                    match_attempts=attempts, last_match_at=now, updated_at=now,
+                    match_gallery_version=self.gallery_version,
+                ),
+                accepted,
+            ).rowcount
+        if rejected:
+            n_rejected = self.session.execute(
+                update(table).where(guard).values(
+                    match_attempts=attempts, last_match_at=now,
+                    match_gallery_version=self.gallery_version, updated_at=table.c.updated_at,
+                ),
+                rejected,
+            ).rowcount
+        # executemany reports only a total, so every accepted user counts as having gained
+        return n_assigned, n_rejected, {p["b_user_id"] for p in accepted} if n_assigned else set()
@@ -2,17 +2,41 @@
 
 import os
 import cv2
-import time
+import json
 from celery import shared_task
 from app.database import SessionLocal
 from app.models import SurfVideo, SurferFrame
 from app.tasks.detect import detect_and_capture
 from app.tasks.match import match_surfer_to_users, _resolve_image_path
+from app.tasks.leases import (
+    acquire_video_lease, release_video_lease, lease_deadline, lease_owner_id, is_lease_stale,
+    hand_over_for_requeue, VIDEO_MATCH_LEASE_TTL,
+)
+from app.metrics import timed, FRAMES, DETECTIONS
+from app.tasks.progress import ProgressReporter, write_progress
+from app.tasks.dashboard_stats import invalidate_user_stats
+from app.tasks.derivatives import write_derivatives, remove_derivatives, DERIVATIVES_EAGER
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+THUMBNAIL_WIDTH = 640
+
+
+def _write_thumbnail(video_path_relative, video_path_full, frame):
+    """Write a downscaled JPEG thumbnail next to the video; returns its static-relative path or None."""
+    stem = os.path.splitext(os.path.basename(video_path_full))[0]
+    thumbnail_dir = os.path.join(os.path.dirname(video_path_full), "thumbnails")
+    os.makedirs(thumbnail_dir, exist_ok=True)
+    h, w = frame.shape[:2]
+    if w > THUMBNAIL_WIDTH:
+        frame = cv2.resize(frame, (THUMBNAIL_WIDTH, max(1, round(h * THUMBNAIL_WIDTH / w))), interpolation=cv2.INTER_AREA)
+    if not cv2.imwrite(os.path.join(thumbnail_dir, f"{stem}_thumb.jpg"), frame):
+        return None
+    rel_dir = os.path.dirname(str(video_path_relative).replace("\\", "/"))
+    return "/".join(p for p in (rel_dir, "thumbnails", f"{stem}_thumb.jpg") if p)
+
 
 @shared_task(name="process_video")
 def process_video(video_id):
@@ -34,11 +58,17 @@ def process_video(video_id):
         if not video:
             print(f"Video with ID {video_id} not found")
             return False
+        owner_user_id = video.user_id
             
-        # Update status to processing
-        video.status = "processing"
+        # Take the processing lease (sets status to processing). If another live worker
+        # holds it, leave the video alone; an expired lease means that worker died.
+        owner = lease_owner_id()
         try:
-            session.commit()
+            if not acquire_video_lease(session, video_id, owner):
+                print(f"Video {video_id} is leased by {video.lease_owner} until {video.lease_expires_at}; skipping")
+                return False
+            session.refresh(video)
+            invalidate_user_stats([owner_user_id])
         except Exception as e:
             session.rollback()
             print(f"Failed to set video {video_id} to processing: {e}")
@@ -56,57 +86,134 @@ def process_video(video_id):
         if not cap.isOpened():
             print(f"Could not open video at {video_path_resolved}")
             video.status = "failed"
+            write_progress(video_id, status="failed")
+            release_video_lease(video)
             try:
                 session.commit()
             except Exception as e:
                 session.rollback()
                 print(f"Failed to mark video {video_id} as failed after open error: {e}")
+            invalidate_user_stats([owner_user_id])
             return False
             
-        # Get video properties
-        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        # Get video properties. The upload stored the container's sample count, which (unlike
+        # CAP_PROP_FRAME_COUNT) is exact for variable frame rate files; older rows fall back.
+        frame_count = video.frame_count or int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
         fps = cap.get(cv2.CAP_PROP_FPS)
+        video.frame_count = frame_count  # saved with the first checkpoint; the status fallback reads it
+        need_thumbnail = not video.thumbnail_path
         
         # Create directory for frames
         frames_dir_full = os.path.join("app", "static", "frames", f"video_{video_id}")
         frames_dir_relative = os.path.join("frames", f"video_{video_id}")
         os.makedirs(frames_dir_full, exist_ok=True)
         
-        # Process frames
-        processed_frames = 0
+        # Resume from the last fully committed frame if an earlier run was interrupted
+        checkpoint = video.checkpoint_frame
+        resuming = checkpoint is not None
+        processed_frames = (video.processed_frames or 0) if resuming else 0
+        skipped_frames = (video.skipped_frames or 0) if resuming else 0
         detected_frames = 0
+        # Rows from an earlier attempt may exist; only then do we need per-frame upserts
+        has_prior_rows = session.query(SurferFrame.id).filter_by(video_id=video.id).first() is not None
+        if resuming:
+            print(f"Resuming video {video_id} after checkpoint frame {checkpoint} ({processed_frames} frames already processed)")
+        
+        # Live progress for the status API / SSE stream (Redis hash, see app/tasks/progress.py)
+        prior_detections = 0
+        if resuming and has_prior_rows:
+            prior_detections = session.query(SurferFrame.id).filter(
+                SurferFrame.video_id == video.id, SurferFrame.frame_idx <= checkpoint).count()
+        progress = ProgressReporter(video_id, video.user_id, frame_count, fps,
+                                    start_position=checkpoint + 1 if resuming else 0, detections=prior_detections)
         
-        # Load the YOLO model once outside the loop for efficiency
-        from app.tasks.detect import WEIGHTS_PATH, CONFIDENCE_THRESHOLD
-        from ultralytics import YOLO
+        # Reuse the worker's detector instance (prewarmed on worker start unless MODEL_PRELOAD=lazy)
+        from app.tasks.detect import CONFIDENCE_THRESHOLD
+        from app.tasks.detector import detect_frame, resolve_detect_config
+        from app.tasks.registry import get_detector
         
-        print(f"Loading YOLO model from {WEIGHTS_PATH}...")
-        model = YOLO(WEIGHTS_PATH)
-        print("YOLO model loaded successfully")
+        model = get_detector()
+        detect_cfg = resolve_detect_config(video.location)
+        print(f"Detection config for video {video_id}: {detect_cfg}")
         
-        # For POC, process every 10th frame to speed things up
-        frame_interval = 10
+        # Sample every FRAME_INTERVAL-th frame; the motion gate skips still frames and
+        # tightens the interval while something is moving (see app/tasks/motion.py)
+        from app.tasks.motion import MotionGate, FRAME_INTERVAL, MOTION_GATING
+        gate = MotionGate() if MOTION_GATING else None
         
-        for frame_idx in range(0, frame_count, frame_interval):
-            # Set the frame position
-            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
-            ret, frame = cap.read()
+        def _checkpoint(frame_idx):
+            # Counters, checkpoint and lease renewal go out in the same transaction
+            video.processed_frames = processed_frames
+            video.skipped_frames = skipped_frames
+            video.checkpoint_frame = frame_idx
+            video.lease_expires_at = lease_deadline()
+        
+        def _save_progress(frame_idx):
+            _checkpoint(frame_idx)
+            try:
+                session.commit()
+            except Exception as e:
+                session.rollback()
+                print(f"Failed to commit progress for video {video_id} at frame {frame_idx}: {e}")
+                return
+            progress.update(frame_idx, processed_frames, skipped_frames)
+        
+        # Decode sequentially (grab() past unsampled frames) instead of seeking per sample.
+        # The checkpoint is the last sampled frame, so a resumed run continues one sampling
+        # interval after it and stays on the same frame grid as an uninterrupted one.
+        pos = 0
+        next_idx = checkpoint + (gate.next_interval() if gate is not None else FRAME_INTERVAL) if resuming else 0
+        if next_idx > 0 and cap.set(cv2.CAP_PROP_POS_FRAMES, next_idx):
+            pos = next_idx
+        while True:
+            frame_idx = next_idx
+            with timed("decode"):
+                while pos < frame_idx and cap.grab():
+                    pos += 1
+                ret, frame = cap.read()
             
             if not ret:
                 break
+            pos += 1
+            
+            if need_thumbnail:
+                # The upload route no longer decodes; the first frame we see becomes the thumbnail
+                video.thumbnail_path = _write_thumbnail(video.video_path, video_path_resolved, frame)
+                need_thumbnail = False
+            
+            if gate is not None:
+                run_detector, _ = gate.should_detect(frame)
+                next_idx = frame_idx + gate.next_interval()
+                if not run_detector:
+                    skipped_frames += 1
+                    FRAMES.inc(outcome="skipped")
+                    processed_frames += 1
+                    if processed_frames % 5 == 0:
+                        _save_progress(frame_idx)
+                    continue
+            else:
+                next_idx = frame_idx + FRAME_INTERVAL
                 
             # Save the frame
             frame_path_full = os.path.join(frames_dir_full, f"frame_{frame_idx}.jpg")
-            cv2.imwrite(frame_path_full, frame)
+            with timed("frame_write"):
+                cv2.imwrite(frame_path_full, frame)
             
             # Detect surfers in the frame using the YOLO model
             # Run detection on the frame
             try:
-                results = model(frame)[0]
+                with timed("detect"):
+                    results = detect_frame(model, frame, detect_cfg)
             except Exception as e:
                 print(f"Error during model inference on frame {frame_idx}: {str(e)}")
                 continue
             frame_detections = 0
+            existing_rows = {}
+            if has_prior_rows:
+                existing_rows = {
+                    r.detection_idx: r
+                    for r in session.query(SurferFrame).filter_by(video_id=video.id, frame_idx=frame_idx).all()
+                }
             
             # Process each detection
             for i, box in enumerate(results.boxes):
@@ -123,82 +230,120 @@ def process_video(video_id):
                 crop_path_full = os.path.join(frames_dir_full, crop_filename)
                 crop_path_relative = os.path.join(frames_dir_relative, crop_filename)
                 crop = frame[int(y1):int(y2), int(x1):int(x2)]
-                cv2.imwrite(crop_path_full, crop)
+                with timed("crop_write"):
+                    # Views list only file_status="ok" rows instead of stat()ing every file
+                    file_status = "ok" if crop.size and cv2.imwrite(crop_path_full, crop) else "missing"
+                derivatives = None
+                if file_status == "ok" and DERIVATIVES_EAGER:
+                    with timed("derivatives"):
+                        written = write_derivatives(crop, crop_path_relative)
+                    derivatives = json.dumps(written) if written else None
                 
-                # Create a SurferFrame entry
-                new_frame = SurferFrame(
-                    user_id=0,  # Placeholder, will be updated by matching process
-                    frame_path=crop_path_relative,
-                    x1=x1,
-                    y1=y1,
-                    x2=x2,
-                    y2=y2,
-                    score=conf,
-                    video_id=video.id,
-                )
-                session.add(new_frame)
+                # Create (or, when redoing a frame after a crash, refresh) the SurferFrame entry
+                existing = existing_rows.get(i)
+                if existing is not None:
+                    existing.frame_path = crop_path_relative
+                    existing.x1, existing.y1, existing.x2, existing.y2 = x1, y1, x2, y2
+                    if not existing.user_id:
+                        existing.score = conf
+                    existing.embedding_ref = None  # new crop: cached embedding is stale
+                    existing.file_status = file_status
+                    if existing.derivatives and not derivatives:
+                        remove_derivatives(existing.derivatives)  # don't serve copies of the old crop
+                    existing.derivatives = derivatives
+                    existing.match_gallery_version = None
+                else:
+                    new_frame = SurferFrame(
+                        user_id=0,  # Placeholder, will be updated by matching process
+                        frame_path=crop_path_relative,
+                        x1=x1,
+                        y1=y1,
+                        x2=x2,
+                        y2=y2,
+                        score=conf,
+                        video_id=video.id,
+                        frame_idx=frame_idx,
+                        detection_idx=i,
+                        file_status=file_status,
+                        derivatives=derivatives,
+                    )
+                    session.add(new_frame)
                 frame_detections += 1
                 
-            # Commit all detections for this frame
+            # Commit all detections for this frame together with the checkpoint
+            processed_frames += 1
+            _checkpoint(frame_idx)
             try:
-                session.commit()
+                with timed("db_commit"):
+                    session.commit()
             except Exception as e:
                 session.rollback()
+                processed_frames -= 1
                 print(f"Commit failed after adding detections for frame {frame_idx}: {e}")
                 continue
             detected_frames += frame_detections
+            FRAMES.inc(outcome="detected")
+            DETECTIONS.inc(frame_detections)
+            progress.detections += frame_detections
+            progress.update(frame_idx, processed_frames, skipped_frames)
             
             # Print progress
             if frame_detections > 0:
                 print(f"Frame {frame_idx}: Detected {frame_detections} surfers")
-            
-            # Update progress
-            processed_frames += 1
-            if processed_frames % 5 == 0:
-                video.processed_frames = processed_frames
-                try:
-                    session.commit()
-                except Exception as e:
-                    session.rollback()
-                    print(f"Failed to commit progress for video {video_id} at frame {frame_idx}: {e}")
-                
-            # Simulate processing time
-            time.sleep(0.1)
         
         # Close the video
         cap.release()
+        progress.update(frame_count, processed_frames, skipped_frames, force=True)
         
         # Match detected surfers to users
         print(f"Processing complete. Matching {detected_frames} detected surfers to registered users...")
         
         try:
             # Import the matching function
-            from app.tasks.match import match_all_frames
+            from app.tasks.match import match_all_frames, MATCH_FAN_OUT
+            
+            # Inline matching renews nothing while it runs: extend the lease to cover it so the
+            # stale sweep does not requeue a video that is only matching. If the worker dies
+            # here, the lease still expires and the resumed run goes straight to matching.
+            video.lease_expires_at = lease_deadline(ttl=None if MATCH_FAN_OUT else VIDEO_MATCH_LEASE_TTL)
+            session.commit()
             
-            # Run the matching process
+            # Run the matching process (with MATCH_FAN_OUT this only dispatches chunks to the match queue)
             matched_count = match_all_frames()
             
-            print(f"Matching complete. Successfully matched {matched_count} surfers to registered users.")
+            if MATCH_FAN_OUT:
+                print(f"Matching dispatched for {matched_count} unmatched frames.")
+            else:
+                print(f"Matching complete. Successfully matched {matched_count} surfers to registered users.")
             
             # Update status to completed
             video.status = "completed"
             video.processed_frames = processed_frames
+            video.skipped_frames = skipped_frames
+            video.checkpoint_frame = None
+            release_video_lease(video)
             try:
                 session.commit()
             except Exception as e:
                 session.rollback()
                 print(f"Failed to mark video {video_id} as completed: {e}")
+            progress.finish(video.status, processed_frames, skipped_frames)
+            invalidate_user_stats([owner_user_id])
             
         except Exception as e:
             print(f"Error during matching process: {str(e)}")
             video.status = "completed_with_errors"
+            video.checkpoint_frame = None
+            release_video_lease(video)
             try:
                 session.commit()
             except Exception as e2:
                 session.rollback()
                 print(f"Failed to mark video {video_id} as completed_with_errors: {e2}")
+            progress.finish(video.status, processed_frames, skipped_frames)
+            invalidate_user_stats([owner_user_id])
         
-        print(f"Video processing completed: {processed_frames} frames processed, {detected_frames} surfers detected")
+        print(f"Video processing completed: {processed_frames} frames processed ({skipped_frames} skipped by motion gate), {detected_frames} surfers detected")
         return True
         
     except Exception as e:
@@ -209,17 +354,45 @@ def process_video(video_id):
         except Exception:
             pass
         if 'video' in locals():
+            # Keep checkpoint_frame so a retry resumes instead of starting over
             video.status = "failed"
+            write_progress(video_id, status="failed")
+            release_video_lease(video)
             try:
                 session.commit()
             except Exception as e2:
                 session.rollback()
                 print(f"Also failed to mark video {video_id} as failed in outer except: {e2}")
+            invalidate_user_stats([owner_user_id])
         return False
         
     finally:
         session.close()
 
+@shared_task(name="requeue_stale_videos")
+def requeue_stale_videos():
+    """
+    Re-enqueue videos stuck in 'processing' whose lease expired (the worker died).
+    process_video then resumes each one from its checkpoint. A requeued video gets a fresh
+    lease deadline with no owner, so it is not requeued again while the task waits in the
+    queue. Returns the number requeued.
+    """
+    session = SessionLocal()
+    try:
+        stale = [v for v in session.query(SurfVideo).filter_by(status="processing").all() if is_lease_stale(v)]
+        for v in stale:
+            print(f"[stale] Video {v.id} lease expired (owner={v.lease_owner}, checkpoint={v.checkpoint_frame}); requeueing")
+            # Push the lease forward first, so the next sweep does not enqueue it again
+            hand_over_for_requeue(v)
+            session.commit()
+            process_video.delay(v.id)
+        return len(stale)
+    except Exception as e:
+        print(f"[stale] Error scanning for stale videos: {e}")
+        return 0
+    finally:
+        session.close()
+
 # Function to simulate a background task
 def process_video_task():
     """
@@ -0,0 +1,183 @@
+# app/tasks/progress.py
+"""Live processing progress for SurfVideo rows, kept in a Redis hash.
+
+process_video writes its counters to `seesea:video:<id>:progress` as it goes. The status
+JSON endpoint and the server-sent-event stream read that hash, so polling a running job
+costs one HGETALL instead of ORM queries. The hash is a cache: SurfVideo stays the source of
+truth, and when Redis is unavailable or the hash has expired the web tier falls back to
+a single-row query (see snapshot_from_video). Kept free of cv2/ML imports for the web tier.
+
+Environment:
+  - PROGRESS_REDIS_URL: Redis for progress hashes (default CELERY_BROKER_URL)
+  - PROGRESS_INTERVAL: minimum seconds between hash updates from a worker (default 1.0)
+  - PROGRESS_TTL: seconds a hash outlives its last update (default 86400)
+"""
+import os
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PROGRESS_REDIS_URL = os.getenv("PROGRESS_REDIS_URL") or os.getenv("CELERY_BROKER_URL", "redis://localhost:6380/0")
+PROGRESS_INTERVAL = float(os.getenv("PROGRESS_INTERVAL", "1.0"))
+PROGRESS_TTL = int(os.getenv("PROGRESS_TTL", "86400"))
+
+TERMINAL_STATUSES = ("completed", "completed_with_errors", "failed")
+_INT_FIELDS = ("user_id", "frame_count", "processed_frames", "skipped_frames", "detections",
+               "position", "start_position")
+_FLOAT_FIELDS = ("fps", "started_at", "updated_at")
+
+# After a connection error, leave Redis alone for this long so a worker never stalls on it
+_RETRY_AFTER = 30.0
+_client = None
+_down_until = 0.0
+
+
+def _redis():
+    global _client
+    if time.monotonic() < _down_until:
+        return None
+    if _client is None:
+        import redis
+        _client = redis.Redis.from_url(PROGRESS_REDIS_URL, socket_timeout=0.5, socket_connect_timeout=0.5,
+                                       decode_responses=True)
+    return _client
+
+
+def _mark_down(e):
+    global _down_until
+    if time.monotonic() >= _down_until:
+        print(f"[progress] Redis unavailable at {PROGRESS_REDIS_URL}: {e}")
+    _down_until = time.monotonic() + _RETRY_AFTER
+
+
+def progress_key(video_id: int) -> str:
+    return f"seesea:video:{video_id}:progress"
+
+
+def write_progress(video_id: int, **fields) -> bool:
+    """HSET the given fields (plus updated_at) and refresh the TTL. Never raises."""
+    client = _redis()
+    if client is None:
+        return False
+    fields["updated_at"] = time.time()
+    try:
+        key = progress_key(video_id)
+        pipe = client.pipeline(transaction=False)
+        pipe.hset(key, mapping={k: ("" if v is None else v) for k, v in fields.items()})
+        pipe.expire(key, PROGRESS_TTL)
+        pipe.execute()
+        return True
+    except Exception as e:
+        _mark_down(e)
+        return False
+
+
+def read_progress(video_id: int):
+    """The progress hash as a typed dict, or None if there is none (or Redis is down)."""
+    client = _redis()
+    if client is None:
+        return None
+    try:
+        raw = client.hgetall(progress_key(video_id))
+    except Exception as e:
+        _mark_down(e)
+        return None
+    if not raw:
+        return None
+    out = {}
+    for k, v in raw.items():
+        if v == "":
+            out[k] = None
+        elif k in _INT_FIELDS:
+            out[k] = int(float(v))
+        elif k in _FLOAT_FIELDS:
+            out[k] = float(v)
+        else:
+            out[k] = v
+    return out
+
+
+def eta_seconds(progress: dict):
+    """Remaining seconds from the decode rate of this run, or None while it cannot be estimated."""
+    if progress.get("status") != "processing":
+        return None
+    frame_count, position = progress.get("frame_count"), progress.get("position")
+    started_at, updated_at = progress.get("started_at"), progress.get("updated_at")
+    if not frame_count or position is None or not started_at or not updated_at:
+        return None
+    done = position - (progress.get("start_position") or 0)
+    elapsed = updated_at - started_at
+    if done <= 0 or elapsed <= 0:
+        return None
+    return max(0.0, (frame_count - position) * elapsed / done)
+
+
+def progress_payload(progress: dict) -> dict:
+    """The public JSON shape served by the status API and the SSE stream."""
+    frame_count = progress.get("frame_count") or 0
+    position = progress.get("position")
+    if progress.get("status") in ("completed", "completed_with_errors"):
+        percent = 100.0
+    elif frame_count and position is not None:
+        percent = round(min(100.0, 100.0 * (position + 1) / frame_count), 1)
+    else:
+        percent = 0.0
+    eta = eta_seconds(progress)
+    return {
+        "video_id": progress.get("video_id"),
+        "status": progress.get("status"),
+        "frame_count": frame_count,
+        "processed_frames": progress.get("processed_frames") or 0,
+        "skipped_frames": progress.get("skipped_frames") or 0,
+        "detections": progress.get("detections") or 0,
+        "percent": percent,
+        "eta_seconds": round(eta, 1) if eta is not None else None,
+        "updated_at": progress.get("updated_at"),
+    }
+
+
+def snapshot_from_video(session, video) -> dict:
+    """Fallback progress dict built from the SurfVideo row and one COUNT of its detections."""
+    from sqlalchemy import func
+    from app.models import SurferFrame
+    detections = session.query(func.count(SurferFrame.id)).filter(SurferFrame.video_id == video.id).scalar() or 0
+    return {
+        "video_id": video.id,
+        "user_id": video.user_id,
+        "status": video.status,
+        "frame_count": video.frame_count or 0,
+        "processed_frames": video.processed_frames or 0,
+        "skipped_frames": video.skipped_frames or 0,
+        "detections": detections,
+        "position": video.checkpoint_frame,
+        "updated_at": video.updated_at.timestamp() if getattr(video, "updated_at", None) else None,
+    }
+
+
+class ProgressReporter:
+    """Throttled writer used by process_video: at most one update per PROGRESS_INTERVAL
+    seconds, except for status changes, which always go out."""
+
+    def __init__(self, video_id: int, user_id: int, frame_count: int, fps: float = None,
+                 start_position: int = 0, detections: int = 0):
+        self.video_id = video_id
+        self.detections = detections
+        self._last = 0.0
+        write_progress(video_id, user_id=user_id, status="processing", frame_count=frame_count,
+                       fps=fps, start_position=start_position, position=start_position,
+                       started_at=time.time(), detections=detections)
+
+    def update(self, position: int, processed_frames: int, skipped_frames: int, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._last < PROGRESS_INTERVAL:
+            return
+        self._last = now
+        write_progress(self.video_id, position=position, processed_frames=processed_frames,
+                       skipped_frames=skipped_frames, detections=self.detections)
+
+    def finish(self, status: str, processed_frames: int = None, skipped_frames: int = None):
+        fields = {"status": status, "detections": self.detections}
+        if processed_frames is not None:
+            fields.update(processed_frames=processed_frames, skipped_frames=skipped_frames)
+        write_progress(self.video_id, **fields)
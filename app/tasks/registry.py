@@ -0,0 +1,140 @@
+# app/tasks/registry.py
+"""Per-process model registry.
+
+Heavy models (the YOLO surfer detector, InsightFace FaceAnalysis) are constructed once
+per worker process and reused by every task that runs in it. With MODEL_PRELOAD=eager (default) the
+models listed in PRELOAD_MODELS are loaded on Celery's worker_process_init signal, so
+the first task on a fresh worker does not pay the cold start. With MODEL_PRELOAD=lazy
+each model is loaded on first use instead.
+
+Environment:
+  - MODEL_PRELOAD: eager | lazy (default eager)
+  - PRELOAD_MODELS: comma list of models to prewarm (default "detector,face_app")
+"""
+import os
+import threading
+import time
+from celery import shared_task
+from dotenv import load_dotenv
+
+from app.metrics import MODEL_LOAD_SECONDS
+
+load_dotenv()
+
+MODEL_PRELOAD = os.getenv("MODEL_PRELOAD", "eager").strip().lower()
+PRELOAD_MODELS = [m.strip() for m in os.getenv("PRELOAD_MODELS", "detector,face_app").split(",") if m.strip()]
+
+_lock = threading.Lock()
+_models = {}
+_load_times = {}
+
+
+# ---------------- Loaders ----------------
+
+def _load_detector():
+    # Backend (PyTorch YOLO or ONNX Runtime) is chosen by DETECTOR_BACKEND
+    from app.tasks.detector import load_detector
+    return load_detector()
+
+
+def _load_face_app():
+    pack = os.getenv("INSIGHTFACE_PACK", "buffalo_l")
+    providers = [p.strip() for p in os.getenv("INSIGHTFACE_PROVIDERS", "CPUExecutionProvider").split(",") if p.strip()]
+    det_size = int(os.getenv("INSIGHTFACE_DET_SIZE", "640"))
+
+    from insightface.app import FaceAnalysis
+    print(f"[registry] Loading InsightFace pack '{pack}' (providers={providers}, det_size={det_size})...")
+    app = FaceAnalysis(name=pack, providers=providers)
+    app.prepare(ctx_id=0, det_size=(det_size, det_size))
+    _instrument_face_app(app)
+    return app
+
+
+def _instrument_face_app(app):
+    """Time InsightFace's detector and per-face models as face_detect / face_<task> stages."""
+    from app.metrics import timed
+    det = getattr(app, "det_model", None)
+    if det is not None and hasattr(det, "detect"):
+        det.detect = timed("face_detect")(det.detect)
+    for task, model in getattr(app, "models", {}).items():
+        if task == "detection" or not hasattr(model, "get"):
+            continue
+        stage = "face_recognize" if task == "recognition" else f"face_{task}"
+        model.get = timed(stage)(model.get)
+
+
+_LOADERS = {
+    "detector": _load_detector,
+    "face_app": _load_face_app,
+}
+
+
+# ---------------- Public API ----------------
+
+def get_model(name: str):
+    """Return the process-wide instance of a model, loading it on first use."""
+    model = _models.get(name)
+    if model is not None:
+        return model
+    if name not in _LOADERS:
+        raise KeyError(f"Unknown model '{name}'. Known: {sorted(_LOADERS)}")
+    with _lock:
+        model = _models.get(name)
+        if model is None:
+            t0 = time.perf_counter()
+            model = _LOADERS[name]()
+            elapsed = time.perf_counter() - t0
+            _models[name] = model
+            _load_times[name] = elapsed
+            MODEL_LOAD_SECONDS.set(elapsed, model=name)
+            print(f"[registry] Loaded {name} in {elapsed:.2f}s (pid={os.getpid()})")
+    return model
+
+
+def get_detector():
+    return get_model("detector")
+
+
+def get_face_app():
+    return get_model("face_app")
+
+
+def load_times() -> dict:
+    """Seconds spent constructing each loaded model in this process."""
+    return dict(_load_times)
+
+
+def loaded_models() -> list[str]:
+    return sorted(_models)
+
+
+def prewarm(names=None) -> dict:
+    """Load the given models (default PRELOAD_MODELS) now. Failures are logged, not raised,
+    so a missing optional model never prevents a worker from starting."""
+    for name in (names if names is not None else PRELOAD_MODELS):
+        try:
+            get_model(name)
+        except Exception as e:
+            print(f"[registry] Prewarm of {name} failed: {e}")
+    return load_times()
+
+
+def prewarm_on_worker_start():
+    """Hook for worker_process_init; only loads when MODEL_PRELOAD=eager."""
+    if MODEL_PRELOAD != "eager":
+        print(f"[registry] MODEL_PRELOAD={MODEL_PRELOAD}; models will load on first use")
+        return {}
+    times = prewarm()
+    print(f"[registry] Prewarmed models in pid={os.getpid()}: " + ", ".join(f"{k}={v:.2f}s" for k, v in times.items()))
+    return times
+
+
+# Celery task: inspect what a worker process has loaded and how long it took
+@shared_task(name="model_registry_status")
+def model_registry_status():
+    return {
+        "pid": os.getpid(),
+        "preload": MODEL_PRELOAD,
+        "loaded": loaded_models(),
+        "load_times": load_times(),
+    }
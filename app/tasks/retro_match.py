@@ -0,0 +1,90 @@
+# app/tasks/retro_match.py
+"""Incremental matching of old frames against a newly enrolled user.
+
+When a user stores reference photos, retro_match_user scans the cached embeddings of the
+unmatched frames (see frame_cache) in blocks:
+  1. one matrix multiply of the block against the new user's face vectors (front + side
+     stacked), plus their outfit histograms, drops every frame the new user cannot win
+     under any acceptance rule;
+  2. the few remaining frames are decided against the whole gallery with the vectorized
+     rules (scoring.decide_block), so TOP2_GAP margins against other users still apply.
+Frames the new user wins are written with MatchResultWriter. Frames without cached
+embeddings are left to match_all_frames; face detection is never re-run here.
+"""
+import numpy as np
+from celery import shared_task
+
+from app.database import SessionLocal
+from app.metrics import timed
+from app.tasks.match import (
+    _load_user_embeddings, MATCH_THRESHOLD, FACE_WEIGHT, COLOR_WEIGHT, SIDE_WEIGHT,
+    COLOR_ONLY_THRESHOLD, FACE_MIN_ACCEPT, MATCH_WRITE_BATCH,
+)
+from app.tasks.match_writer import MatchResultWriter
+from app.tasks.frame_cache import current_gallery_version, iter_cached_embeddings
+from app.tasks.scoring import Gallery, decide_block
+
+
+def _newcomer_upper_bound(faces, has_face, colors, has_color, user_faces: dict, user_colors: list):
+    """Face and total score of every frame against one user (mirrors match._score_face/_score_color)."""
+    fronts, sides = user_faces.get("front", []), user_faces.get("side", [])
+    n = faces.shape[0]
+    face = np.zeros(n, dtype=np.float32)
+    if fronts or sides:
+        sims = faces @ np.stack(fronts + sides).T
+        best_front = sims[:, :len(fronts)].max(axis=1) if fronts else np.zeros(n, dtype=np.float32)
+        best_side = sims[:, len(fronts):].max(axis=1) if sides else np.zeros(n, dtype=np.float32)
+        face = np.maximum(best_front, SIDE_WEIGHT * best_side) + (0.01 if fronts and sides else 0.0)
+        face[~has_face] = 0.0
+    color = np.zeros(n, dtype=np.float32)
+    for c in user_colors:
+        color = np.maximum(color, np.minimum(colors, c[None, :]).sum(axis=1))
+    color[~has_color] = 0.0
+    return face, FACE_WEIGHT * face + COLOR_WEIGHT * color
+
+
+def retro_match(user_id: int) -> int:
+    session = SessionLocal()
+    try:
+        gallery_version = current_gallery_version(session)
+        faces_map, colors_map = _load_user_embeddings(session)
+        user_faces, user_colors = faces_map.get(user_id, {}), colors_map.get(user_id, [])
+        if not user_faces and not user_colors:
+            print(f"[retro] User {user_id} has no embeddings; nothing to match")
+            return 0
+        gallery = Gallery(faces_map, colors_map)
+        writer = MatchResultWriter(session, gallery_version, flush_every=MATCH_WRITE_BATCH)
+        scanned = candidates = 0
+        for ids, faces, has_face, colors, has_color in iter_cached_embeddings(session):
+            scanned += len(ids)
+            face, total = _newcomer_upper_bound(faces, has_face, colors, has_color, user_faces, user_colors)
+            color_only = ~has_face & has_color
+            possible = np.where(
+                color_only,
+                total >= COLOR_ONLY_THRESHOLD,
+                (total >= MATCH_THRESHOLD) | (has_face & (face >= FACE_MIN_ACCEPT)),
+            )
+            idx = np.flatnonzero(possible)
+            if idx.size == 0:
+                continue
+            candidates += idx.size
+            with timed("score"):
+                uids, scores = decide_block(gallery, faces[idx], has_face[idx], colors[idx], has_color[idx])
+            for fid, uid, score in zip(ids[idx], uids, scores):
+                if int(uid) == user_id:
+                    writer.add(int(fid), user_id, float(score))
+        writer.flush()
+        print(f"[retro] User {user_id}: scanned {scanned} cached frames, {candidates} candidates, "
+              f"{writer.assigned} assigned")
+        return writer.assigned
+    except Exception as e:
+        session.rollback()
+        print(f"[retro] Error retro-matching user {user_id}: {e}")
+        return 0
+    finally:
+        session.close()
+
+
+@shared_task(name="retro_match_user")
+def retro_match_user(user_id: int) -> int:
+    return retro_match(user_id)
@@ -0,0 +1,214 @@
+# app/tasks/scoring.py
+"""Vectorized version of the matcher's scoring rules.
+
+match._decide_match scores one frame against the gallery in a Python loop. Here a block
+of cached frame embeddings is scored against the whole (stacked) gallery with matrix
+multiplies, and the same acceptance rules are applied with array operations:
+
+  face(u)  = max(best_front_cos, SIDE_WEIGHT * best_side_cos) (+0.01 with both kinds),
+             a missing kind counting as 0.0
+  color(u) = max histogram intersection with the user's outfit histograms (0.0 if none)
+  total(u) = FACE_WEIGHT * face + COLOR_WEIGHT * color
+
+followed by the color-only, combined and face-strong acceptance paths with the top-2
+margins. Frames without a face use 0.0 face scores, frames without colors 0.0 color
+scores, exactly like the scalar path.
+
+The rule-independent similarities are split from the rules (MatchRules), so sweep() can
+evaluate a grid of thresholds/weights on one pass over the cached embeddings
+(`flask rescore-sweep`).
+"""
+from collections import namedtuple
+from itertools import product
+import numpy as np
+
+from app.tasks.match import (
+    MATCH_THRESHOLD, FACE_WEIGHT, COLOR_WEIGHT, SIDE_WEIGHT, COLOR_ONLY_THRESHOLD,
+    FACE_MIN_ACCEPT, TOP2_GAP, COLOR_ONLY_GAP,
+)
+
+class Gallery:
+    """The gallery as stacked matrices. Column j of every score matrix is user uids[j]."""
+
+    def __init__(self, faces_map: dict, colors_map: dict, uids: list = None):
+        self.uids = list(uids) if uids is not None else sorted(set(faces_map) | set(colors_map))
+        self.front, self.front_owner = self._stack(
+            [(j, v) for j, uid in enumerate(self.uids) for v in faces_map.get(uid, {}).get("front", [])])
+        self.side, self.side_owner = self._stack(
+            [(j, v) for j, uid in enumerate(self.uids) for v in faces_map.get(uid, {}).get("side", [])])
+        self.colors, self.color_owner = self._stack(
+            [(j, v) for j, uid in enumerate(self.uids) for v in colors_map.get(uid, [])])
+        self.both_bonus = np.array(
+            [0.01 if (faces_map.get(uid, {}).get("front") and faces_map.get(uid, {}).get("side")) else 0.0
+             for uid in self.uids], dtype=np.float32)
+
+    @staticmethod
+    def _stack(items):
+        if not items:
+            return None, np.zeros(0, dtype=np.int64)
+        owners = np.array([j for j, _ in items], dtype=np.int64)
+        return np.stack([np.asarray(v, dtype=np.float32) for _, v in items]), owners
+
+    def __len__(self):
+        return len(self.uids)
+
+
+def _per_user_max(sims: np.ndarray, owners: np.ndarray, n_users: int) -> np.ndarray:
+    """Reduce (N, rows) similarities to (N, users) maxima; users without rows get 0.0."""
+    out = np.zeros((sims.shape[0], n_users), dtype=np.float32)
+    if owners.size == 0:
+        return out
+    best = np.full((sims.shape[0], n_users), -np.inf, dtype=np.float32)
+    for j in np.unique(owners):
+        best[:, j] = sims[:, owners == j].max(axis=1)
+    has = np.isin(np.arange(n_users), owners)
+    out[:, has] = best[:, has]
+    return out
+
+
+class MatchRules(namedtuple("MatchRules", [
+    "MATCH_THRESHOLD", "FACE_WEIGHT", "COLOR_WEIGHT", "SIDE_WEIGHT", "COLOR_ONLY_THRESHOLD",
+    "FACE_MIN_ACCEPT", "TOP2_GAP", "COLOR_ONLY_GAP",
+])):
+    """The matcher knobs as a value, so several settings can be evaluated on the same scores."""
+
+    @classmethod
+    def from_env(cls, **overrides):
+        values = dict(
+            MATCH_THRESHOLD=MATCH_THRESHOLD, FACE_WEIGHT=FACE_WEIGHT, COLOR_WEIGHT=COLOR_WEIGHT,
+            SIDE_WEIGHT=SIDE_WEIGHT, COLOR_ONLY_THRESHOLD=COLOR_ONLY_THRESHOLD, FACE_MIN_ACCEPT=FACE_MIN_ACCEPT,
+            TOP2_GAP=TOP2_GAP, COLOR_ONLY_GAP=COLOR_ONLY_GAP,
+        )
+        values.update(overrides)
+        return cls(**values)
+
+
+def similarity_components(gallery: Gallery, faces: np.ndarray, has_face: np.ndarray,
+                          colors: np.ndarray, has_color: np.ndarray):
+    """
+    The rule-independent part of scoring, (N, U) each: best front cosine, best side cosine
+    and outfit score per user. Users without a kind get 0.0, rows without a face/color 0.0.
+    """
+    n, u = faces.shape[0], len(gallery)
+    zeros = np.zeros((n, u), dtype=np.float32)
+    best_front = _per_user_max(faces @ gallery.front.T, gallery.front_owner, u) if gallery.front is not None else zeros
+    best_side = _per_user_max(faces @ gallery.side.T, gallery.side_owner, u) if gallery.side is not None else zeros
+    if gallery.colors is None:
+        color = zeros
+    else:
+        # One gallery histogram at a time keeps the temporary at (N, bins) and memory-friendly
+        inter = np.empty((n, gallery.colors.shape[0]), dtype=np.float32)
+        tmp = np.empty(colors.shape, dtype=np.float32)
+        for j, hist in enumerate(gallery.colors):
+            np.minimum(colors, hist, out=tmp)
+            inter[:, j] = tmp.sum(axis=1)
+        color = _per_user_max(inter, gallery.color_owner, u)
+        color[~has_color] = 0.0
+    return best_front, best_side, color
+
+
+def decide_components(gallery: Gallery, components, has_face: np.ndarray, has_color: np.ndarray,
+                      rules: MatchRules = None):
+    """
+    Apply the acceptance rules to precomputed similarity components.
+    Returns (user_ids, scores, ambiguous): user_ids[i] is 0 when frame i is rejected, scores[i]
+    is the best total, and ambiguous[i] marks frames whose best user clears a score threshold
+    but loses on the top-2 margin.
+    """
+    rules = rules or MatchRules.from_env()
+    best_front, best_side, color = components
+    n = best_front.shape[0]
+    if len(gallery) == 0 or n == 0:
+        return np.zeros(n, dtype=np.int64), np.zeros(n, dtype=np.float32), np.zeros(n, dtype=bool)
+    face = np.maximum(best_front, rules.SIDE_WEIGHT * best_side) + gallery.both_bonus[None, :]
+    face[~has_face] = 0.0
+    total = rules.FACE_WEIGHT * face + rules.COLOR_WEIGHT * color
+
+    rows = np.arange(n)
+    best = np.argmax(total, axis=1)
+    best_total, best_face = total[rows, best], face[rows, best]
+    if len(gallery) == 1:
+        margin_total = margin_face = np.full(n, np.inf, dtype=np.float32)
+    else:
+        masked = total.copy()
+        masked[rows, best] = -np.inf
+        second = np.argmax(masked, axis=1)
+        margin_total = best_total - total[rows, second]
+        margin_face = best_face - face[rows, second]
+
+    color_only = ~has_face & has_color
+    color_score_ok = best_total >= rules.COLOR_ONLY_THRESHOLD
+    combined_ok = best_total >= rules.MATCH_THRESHOLD
+    face_ok = has_face & (best_face >= rules.FACE_MIN_ACCEPT)
+    accept_color = color_only & color_score_ok & (margin_total >= rules.COLOR_ONLY_GAP)
+    accept_combined = combined_ok & (margin_total >= rules.TOP2_GAP)
+    accept_face = face_ok & ((margin_total >= rules.TOP2_GAP) | (margin_face >= rules.TOP2_GAP))
+    accepted = np.where(color_only, accept_color, accept_combined | accept_face)
+    ambiguous = ~accepted & np.where(color_only, color_score_ok, combined_ok | face_ok)
+
+    uids = np.asarray(gallery.uids, dtype=np.int64)[best]
+    return np.where(accepted, uids, 0), best_total.astype(np.float32), ambiguous
+
+
+def decide_block(gallery: Gallery, faces: np.ndarray, has_face: np.ndarray,
+                 colors: np.ndarray, has_color: np.ndarray, rules: MatchRules = None):
+    """
+    Apply the acceptance rules to N frames at once.
+    Returns (user_ids, scores): user_ids[i] is 0 when frame i is rejected, scores[i] is the best total.
+    """
+    components = similarity_components(gallery, faces, has_face, colors, has_color)
+    uids, scores, _ = decide_components(gallery, components, has_face, has_color, rules)
+    return uids, scores
+
+
+# ------------- Offline threshold sweeps -------------
+
+def rules_grid(grid: dict, base: MatchRules = None) -> list:
+    """Every combination of {knob: [values]} on top of base (default: the current env)."""
+    base = base or MatchRules.from_env()
+    names = list(grid)
+    return [base._replace(**dict(zip(names, combo))) for combo in product(*(grid[n] for n in names))]
+
+
+def _lookup_labels(frame_ids: np.ndarray, label_ids: np.ndarray, label_users: np.ndarray) -> np.ndarray:
+    """User label of each frame id (0 if unlabelled); label_ids must be sorted."""
+    if label_ids.size == 0:
+        return np.zeros(frame_ids.size, dtype=np.int64)
+    pos = np.clip(np.searchsorted(label_ids, frame_ids), 0, label_ids.size - 1)
+    return np.where(label_ids[pos] == frame_ids, label_users[pos], 0)
+
+
+def sweep(blocks, gallery: Gallery, rules_list: list, labels: dict = None) -> list:
+    """
+    Evaluate every MatchRules in rules_list over blocks of (frame_ids, faces, has_face, colors,
+    has_color). Similarities are computed once per block and shared by all combinations.
+    labels maps frame_id -> user_id for frames whose correct user is known.
+    Returns one stats dict per combination, in rules_list order.
+    """
+    labels = labels or {}
+    label_ids = np.array(sorted(labels), dtype=np.int64)
+    label_users = np.array([labels[i] for i in label_ids], dtype=np.int64)
+    stats = [dict(frames=0, assigned=0, ambiguous=0, labelled=0, labelled_assigned=0, agree=0) for _ in rules_list]
+    for frame_ids, faces, has_face, colors, has_color in blocks:
+        components = similarity_components(gallery, faces, has_face, colors, has_color)
+        truth = _lookup_labels(frame_ids, label_ids, label_users)
+        labelled = truth > 0
+        for st, rules in zip(stats, rules_list):
+            uids, _, ambiguous = decide_components(gallery, components, has_face, has_color, rules)
+            st["frames"] += int(frame_ids.size)
+            st["assigned"] += int((uids > 0).sum())
+            st["ambiguous"] += int(ambiguous.sum())
+            st["labelled"] += int(labelled.sum())
+            st["labelled_assigned"] += int((labelled & (uids > 0)).sum())
+            st["agree"] += int((labelled & (uids == truth)).sum())
+    out = []
+    for st, rules in zip(stats, rules_list):
+        n = max(st["frames"], 1)
+        out.append(dict(
+            rules._asdict(), **st,
+            assign_rate=st["assigned"] / n,
+            ambiguity_rate=st["ambiguous"] / n,
+            precision=st["agree"] / st["labelled_assigned"] if st["labelled_assigned"] else None,
+            recall=st["agree"] / st["labelled"] if st["labelled"] else None,
+        ))
+    return out
@@ -0,0 +1,245 @@
+# app/tasks/uploads.py
+"""Completion and expiry of resumable uploads (see app/upload/chunked.py).
+
+The PATCH that delivers the last byte only moves its VideoUpload row to "completing" and
+enqueues complete_upload on the maintenance queue. The task verifies the whole-file
+checksum, creates the SurfVideo, moves the file into VIDEO_UPLOAD_FOLDER and enqueues
+process_video, so hashing a multi-GB file never ties up a web worker. Every step can be
+repeated: a run that died halfway is picked up again from where it stopped.
+
+expire_stale_uploads runs on the same queue (scheduled by celery beat):
+  - a "completing" upload whose task has not been heard from for UPLOAD_COMPLETE_TIMEOUT
+    seconds (the task refreshes updated_at while it hashes) is enqueued again, or marked
+    failed after UPLOAD_COMPLETE_ATTEMPTS runs;
+  - uploads that are still uploading or have failed and have not been written to for
+    UPLOAD_EXPIRE_HOURS are deleted together with their partial files.
+
+Environment:
+  - UPLOAD_EXPIRE_HOURS: idle hours after which an unfinished upload is deleted (default 24)
+  - UPLOAD_COMPLETE_TIMEOUT: seconds without progress before a completion is retried (default 300)
+  - UPLOAD_COMPLETE_ATTEMPTS: completion runs before the upload is marked failed (default 3)
+  - UPLOAD_EXPIRE_SWEEP_SECONDS: how often beat runs the sweep (default 60, see celery_worker.py)
+"""
+import hashlib
+import os
+import time
+from datetime import datetime, timedelta
+from celery import shared_task
+from dotenv import load_dotenv
+from sqlalchemy import update
+from werkzeug.utils import secure_filename
+
+from app.database import SessionLocal
+from app.models import User, SurfVideo, VideoUpload
+from app.tasks.dashboard_stats import invalidate_user_stats
+from app.video_probe import probe_video
+
+load_dotenv()
+
+UPLOAD_EXPIRE_HOURS = float(os.getenv("UPLOAD_EXPIRE_HOURS", "24"))
+UPLOAD_COMPLETE_TIMEOUT = float(os.getenv("UPLOAD_COMPLETE_TIMEOUT", "300"))
+UPLOAD_COMPLETE_ATTEMPTS = int(os.getenv("UPLOAD_COMPLETE_ATTEMPTS", "3"))
+EXPIRABLE_STATUSES = ("uploading", "failed")
+HASH_BUFFER = 4 * 1024 * 1024
+# Refresh updated_at this often while hashing, well inside UPLOAD_COMPLETE_TIMEOUT
+HEARTBEAT_SECONDS = min(30.0, UPLOAD_COMPLETE_TIMEOUT / 3)
+
+
+def _hex_digest(path: str, algo: str, heartbeat):
+    """Hex digest of a file; None if heartbeat() returns False (the completion was taken over)."""
+    h = hashlib.new(algo)
+    beat = time.monotonic()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(HASH_BUFFER), b""):
+            h.update(block)
+            if time.monotonic() - beat >= HEARTBEAT_SECONDS:
+                if not heartbeat():
+                    return None
+                beat = time.monotonic()
+    return h.hexdigest()
+
+
+def _fail(session, upload, error):
+    upload.status = "failed"
+    upload.error = error[:500]
+    session.commit()
+    if upload.video_id is None:
+        try:
+            os.remove(upload.part_path)
+        except FileNotFoundError:
+            pass
+    print(f"[uploads] Upload {upload.id} failed: {error}")
+
+
+@shared_task(name="complete_upload")
+def complete_upload(upload_id: str) -> bool:
+    """
+    Finish an upload whose last byte has arrived: check its whole-file checksum, create the
+    SurfVideo, move the file into VIDEO_UPLOAD_FOLDER and enqueue process_video.
+    Returns True once the upload is complete.
+    """
+    session = SessionLocal()
+    try:
+        upload = session.get(VideoUpload, upload_id)
+        if upload is None or upload.status != "completing":
+            return False
+        # Claim this run: of two copies of the task (e.g. one re-enqueued by the sweep) only one proceeds
+        seen = upload.complete_attempts or 0
+        attempt = seen + 1
+        claimed = session.execute(
+            update(VideoUpload)
+            .where(VideoUpload.id == upload_id, VideoUpload.status == "completing",
+                   VideoUpload.complete_attempts == seen)
+            .values(complete_attempts=attempt, updated_at=datetime.utcnow())
+        ).rowcount
+        session.commit()
+        if not claimed:
+            return False
+        session.refresh(upload)
+
+        def heartbeat():
+            alive = session.execute(
+                update(VideoUpload)
+                .where(VideoUpload.id == upload_id, VideoUpload.status == "completing",
+                       VideoUpload.complete_attempts == attempt)
+                .values(updated_at=datetime.utcnow())
+            ).rowcount
+            session.commit()
+            return bool(alive)
+
+        if upload.video_id is None:
+            if upload.checksum:
+                algo, _, expected = upload.checksum.partition(" ")
+                digest = _hex_digest(upload.part_path, algo.lower(), heartbeat)
+                if digest is None:
+                    return False
+                if digest != expected.strip().lower():
+                    _fail(session, upload, "Whole-file checksum mismatch; upload discarded")
+                    return False
+            try:
+                info = probe_video(upload.part_path)  # container headers only, see app/video_probe.py
+            except (OSError, ValueError) as e:
+                _fail(session, upload, f"Could not read the uploaded video: {e}")
+                return False
+            owner = session.get(User, upload.user_id)
+            timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+            video_filename = secure_filename(f"{owner.username}_video_{timestamp}_{upload_id[:8]}.mp4")
+            video = SurfVideo(
+                user_id=upload.user_id,
+                video_path=f"videos/{video_filename}",
+                location=upload.location,
+                description=upload.description,
+                duration=info.duration or 0,
+                frame_count=info.frame_count or 0,
+                status="pending",
+            )
+            session.add(video)
+            session.flush()
+            upload.video_id = video.id
+            session.commit()  # the row and the upload's link to it land together
+        else:
+            video = session.get(SurfVideo, upload.video_id)
+
+        video_folder = os.getenv("VIDEO_UPLOAD_FOLDER", "app/static/videos")
+        os.makedirs(video_folder, exist_ok=True)
+        video_path = os.path.join(video_folder, os.path.basename(video.video_path))
+        if os.path.exists(upload.part_path):
+            os.replace(upload.part_path, video_path)
+        elif not os.path.exists(video_path):
+            _fail(session, upload, "Uploaded file is missing")
+            return False
+
+        # Enqueue before marking complete: if the broker is down the sweep retries this step
+        from celery_worker import enqueue_process_video
+        enqueue_process_video(video.id)
+        upload.status = "complete"
+        upload.error = None
+        session.commit()
+        invalidate_user_stats([upload.user_id])
+        print(f"[uploads] Upload {upload_id} complete: video {video.id}")
+        return True
+    except Exception as e:
+        session.rollback()
+        print(f"[uploads] Error completing upload {upload_id} (retried after {UPLOAD_COMPLETE_TIMEOUT:g}s): {e}")
+        return False
+    finally:
+        session.close()
+
+
+def _retry_stuck_completions(session) -> int:
+    """Re-enqueue (or give up on) completions without progress for UPLOAD_COMPLETE_TIMEOUT."""
+    cutoff = datetime.utcnow() - timedelta(seconds=UPLOAD_COMPLETE_TIMEOUT)
+    stuck = (
+        session.query(VideoUpload.id, VideoUpload.complete_attempts, VideoUpload.updated_at)
+        .filter(VideoUpload.status == "completing", VideoUpload.updated_at < cutoff)
+        .all()
+    )
+    handled = 0
+    for upload_id, attempts, updated_at in stuck:
+        give_up = (attempts or 0) >= UPLOAD_COMPLETE_ATTEMPTS
+        values = {"updated_at": datetime.utcnow()}
+        if give_up:
+            values.update(status="failed", error="Upload could not be completed")
+        # Conditional on updated_at: a completion that is still running has moved it on
+        touched = session.execute(
+            update(VideoUpload)
+            .where(VideoUpload.id == upload_id, VideoUpload.status == "completing",
+                   VideoUpload.updated_at == updated_at)
+            .values(**values)
+        ).rowcount
+        session.commit()
+        if not touched:
+            continue
+        handled += 1
+        if give_up:
+            print(f"[uploads] Upload {upload_id} failed after {attempts} completion attempts")
+        else:
+            complete_upload.delay(upload_id)
+            print(f"[uploads] Retrying completion of upload {upload_id} (attempt {(attempts or 0) + 1})")
+    return handled
+
+
+@shared_task(name="expire_stale_uploads")
+def expire_stale_uploads(max_idle_hours: float = None) -> int:
+    """
+    Retry stuck completions, then delete unfinished uploads idle for longer than
+    max_idle_hours. Returns the number deleted.
+    """
+    hours = UPLOAD_EXPIRE_HOURS if max_idle_hours is None else max_idle_hours
+    cutoff = datetime.utcnow() - timedelta(hours=hours)
+    session = SessionLocal()
+    expired = 0
+    try:
+        _retry_stuck_completions(session)
+        stale = (
+            session.query(VideoUpload.id, VideoUpload.part_path)
+            .filter(VideoUpload.status.in_(EXPIRABLE_STATUSES), VideoUpload.updated_at < cutoff)
+            .all()
+        )
+        for upload_id, part_path in stale:
+            # Re-check in the DELETE: a PATCH may have touched the upload since the query
+            deleted = (
+                session.query(VideoUpload)
+                .filter(VideoUpload.id == upload_id, VideoUpload.status.in_(EXPIRABLE_STATUSES),
+                        VideoUpload.updated_at < cutoff)
+                .delete(synchronize_session=False)
+            )
+            session.commit()
+            if not deleted:
+                continue
+            expired += 1
+            try:
+                os.remove(part_path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"[uploads] Could not remove {part_path}: {e}")
+        if expired:
+            print(f"[uploads] Expired {expired} uploads idle for more than {hours:g}h")
+        return expired
+    except Exception as e:
+        session.rollback()
+        print(f"[uploads] Error expiring uploads: {e}")
+        return expired
+    finally:
+        session.close()
@@ -4,4 +4,4 @@ from flask import Blueprint
 
 upload_bp = Blueprint("upload", __name__, url_prefix="/upload")
 
-from app.upload import routes
+from app.upload import routes, chunked
@@ -0,0 +1,326 @@
+# app/upload/chunked.py
+"""Resumable, chunked video uploads (a subset of the tus 1.0.0 protocol).
+
+  POST   /upload/video/uploads          create; Upload-Length + Upload-Metadata
+                                        (filename, location, description, checksum)
+  HEAD   /upload/video/uploads/<id>     current Upload-Offset, to resume after a failure
+  PATCH  /upload/video/uploads/<id>     append bytes at Upload-Offset
+                                        (Content-Type: application/offset+octet-stream)
+  DELETE /upload/video/uploads/<id>     abandon the upload and delete the partial file
+
+Request bodies are streamed to the partial file in UPLOAD_COPY_BUFFER blocks, so memory
+use does not depend on the file or chunk size, and a request only lasts as long as one
+chunk. A PATCH may carry Upload-Checksum ("<algo> <base64 digest>") for its own bytes;
+the create request may carry a whole-file "checksum" ("<algo> <hex digest>") in its
+metadata.
+
+Only one PATCH writes to an upload at a time: the writer holds an exclusive fcntl lock on
+the partial file until its offset is committed, and a concurrent PATCH gets 409. The
+request that receives the last byte moves the row from "uploading" to "completing" with a
+conditional UPDATE, so an upload is completed once, and enqueues the complete_upload task
+(app/tasks/uploads.py). The task verifies the checksum, moves the file into
+VIDEO_UPLOAD_FOLDER, creates the SurfVideo row and enqueues process_video; the client polls
+HEAD (or GET for the status and error) until Upload-Video-Id / Upload-Video-Url appear.
+A completion that stalls is retried, and abandoned uploads are deleted, by the
+expire_stale_uploads maintenance task.
+
+Environment:
+  - VIDEO_UPLOAD_MAX_BYTES: largest accepted upload (default 20 GiB)
+"""
+import base64
+import hashlib
+import os
+import secrets
+from flask import Response, current_app, jsonify, request, url_for
+from flask_login import login_required, current_user
+from flask_wtf.csrf import validate_csrf
+from sqlalchemy import update
+from wtforms import ValidationError
+from dotenv import load_dotenv
+
+from app.upload import upload_bp
+from app.database import SessionLocal
+from app.models import VideoUpload
+
+try:
+    import fcntl
+except ImportError:  # Windows dev setups: concurrent PATCHes are only caught by the offset check
+    fcntl = None
+
+load_dotenv()
+
+VIDEO_UPLOAD_MAX_BYTES = int(os.getenv("VIDEO_UPLOAD_MAX_BYTES", str(20 * 1024 ** 3)))
+UPLOAD_COPY_BUFFER = 1024 * 1024
+TUS_VERSION = "1.0.0"
+CHECKSUM_ALGORITHMS = ("sha1", "sha256", "md5")
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".avi")
+
+
+def _tus_response(status=204, body=None, **headers):
+    response = jsonify(body) if body is not None else Response()
+    response.status_code = status
+    response.headers["Tus-Resumable"] = TUS_VERSION
+    response.headers["Cache-Control"] = "no-store"
+    for name, value in headers.items():
+        response.headers[name.replace("_", "-")] = str(value)
+    return response
+
+
+def _error(status, message):
+    return _tus_response(status, {"error": message})
+
+
+def _parse_metadata(header: str) -> dict:
+    """tus Upload-Metadata: comma-separated "key base64(value)" pairs."""
+    meta = {}
+    for pair in (header or "").split(","):
+        parts = pair.strip().split(" ", 1)
+        if not parts[0]:
+            continue
+        try:
+            meta[parts[0]] = base64.b64decode(parts[1]).decode("utf-8") if len(parts) > 1 else ""
+        except (ValueError, UnicodeDecodeError):
+            raise ValueError(f"Bad Upload-Metadata value for {parts[0]}")
+    return meta
+
+
+def _parse_checksum(value: str, encoding: str):
+    """("algo", digest bytes) from "<algo> <digest>", digest in base64 or hex."""
+    algo, _, digest = (value or "").strip().partition(" ")
+    algo = algo.lower()
+    if algo not in CHECKSUM_ALGORITHMS or not digest:
+        raise ValueError(f"Unsupported checksum {value!r}; use one of {', '.join(CHECKSUM_ALGORITHMS)}")
+    try:
+        return algo, (base64.b64decode(digest) if encoding == "base64" else bytes.fromhex(digest))
+    except ValueError:
+        raise ValueError(f"Malformed checksum digest {digest!r}")
+
+
+def _own_upload(session, upload_id):
+    return session.query(VideoUpload).filter_by(id=upload_id, user_id=current_user.id).first()
+
+
+def _lock_part(fh) -> bool:
+    """Take the partial file's write lock without waiting. False if another request holds it."""
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+
+def _video_headers(upload) -> dict:
+    """Upload-Video-Id / Upload-Video-Url of a completed upload."""
+    if upload.status != "complete" or not upload.video_id:
+        return {}
+    return {"Upload_Video_Id": upload.video_id,
+            "Upload_Video_Url": url_for("upload.video_status", video_id=upload.video_id)}
+
+
+def _not_uploading(upload):
+    """Response to a PATCH on an upload that no longer takes bytes."""
+    if upload.status == "complete":
+        # The client probably lost the final response: repeat it
+        return _tus_response(204, Upload_Offset=upload.offset, **_video_headers(upload))
+    if upload.status == "completing":
+        return _tus_response(409, {"error": "Upload is being completed"}, Retry_After=2)
+    return _error(410 if upload.status == "failed" else 409, f"Upload is {upload.status}")
+
+
+@upload_bp.route("/video/uploads", methods=["OPTIONS"])
+def upload_options():
+    return _tus_response(204, Tus_Version=TUS_VERSION, Tus_Max_Size=VIDEO_UPLOAD_MAX_BYTES,
+                         Tus_Extension="creation,termination,checksum",
+                         Tus_Checksum_Algorithm=",".join(CHECKSUM_ALGORITHMS))
+
+
+@upload_bp.route("/video/uploads", methods=["POST"])
+@login_required
+def create_upload():
+    """
+    Start a resumable upload. Requires the page's CSRF token in X-CSRFToken.
+    """
+    try:
+        validate_csrf(request.headers.get("X-CSRFToken"))
+    except ValidationError as e:
+        return _error(403, f"CSRF check failed: {e}")
+    try:
+        length = int(request.headers.get("Upload-Length", ""))
+        meta = _parse_metadata(request.headers.get("Upload-Metadata"))
+        if meta.get("checksum"):
+            _parse_checksum(meta["checksum"], "hex")
+    except ValueError as e:
+        return _error(400, str(e) or "Upload-Length is required")
+    if length <= 0 or length > VIDEO_UPLOAD_MAX_BYTES:
+        return _error(413, f"Upload-Length must be between 1 and {VIDEO_UPLOAD_MAX_BYTES} bytes")
+    filename = meta.get("filename", "")
+    if not filename.lower().endswith(VIDEO_EXTENSIONS):
+        return _error(400, "Video files only (MP4, MOV, AVI)!")
+
+    upload_id = secrets.token_hex(16)
+    video_folder = os.getenv("VIDEO_UPLOAD_FOLDER", "app/static/videos")
+    part_dir = os.path.join(video_folder, ".partial")  # same filesystem as the final file
+    os.makedirs(part_dir, exist_ok=True)
+    part_path = os.path.join(part_dir, f"{upload_id}.part")
+    open(part_path, "wb").close()
+
+    session = SessionLocal()
+    try:
+        session.add(VideoUpload(
+            id=upload_id, user_id=current_user.id, length=length, offset=0,
+            filename=filename[:255], location=(meta.get("location") or None),
+            description=(meta.get("description") or None), checksum=meta.get("checksum") or None,
+            part_path=part_path, status="uploading",
+        ))
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        os.remove(part_path)
+        return _error(500, f"Could not create upload: {e}")
+    finally:
+        session.close()
+    return _tus_response(201, Location=url_for("upload.upload_resource", upload_id=upload_id), Upload_Offset=0)
+
+
+@upload_bp.route("/video/uploads/<upload_id>", methods=["HEAD", "GET"])
+@login_required
+def upload_resource(upload_id):
+    """
+    Offset of an upload (HEAD, per tus) or its state as JSON (GET).
+    """
+    session = SessionLocal()
+    try:
+        upload = _own_upload(session, upload_id)
+        if upload is None:
+            return _error(404, "Upload not found")
+        if upload.status == "failed" and request.method == "HEAD":
+            return _tus_response(410)
+        headers = {"Upload_Offset": upload.offset, "Upload_Length": upload.length, **_video_headers(upload)}
+        if request.method == "HEAD":
+            return _tus_response(200, **headers)
+        return _tus_response(200, {"id": upload.id, "offset": upload.offset, "length": upload.length,
+                                   "status": upload.status, "error": upload.error,
+                                   "video_id": headers.get("Upload_Video_Id"),
+                                   "video_url": headers.get("Upload_Video_Url")}, **headers)
+    finally:
+        session.close()
+
+
+@upload_bp.route("/video/uploads/<upload_id>", methods=["PATCH"])
+@login_required
+def append_upload(upload_id):
+    """
+    Append the request body at Upload-Offset, streaming it to disk.
+    """
+    if request.headers.get("Tus-Resumable") != TUS_VERSION:
+        return _error(412, f"Tus-Resumable: {TUS_VERSION} required")
+    if request.mimetype != "application/offset+octet-stream":
+        return _error(415, "Content-Type must be application/offset+octet-stream")
+    try:
+        offset = int(request.headers.get("Upload-Offset", ""))
+        chunk_checksum = request.headers.get("Upload-Checksum")
+        chunk_algo, chunk_digest = _parse_checksum(chunk_checksum, "base64") if chunk_checksum else (None, None)
+    except ValueError as e:
+        return _error(400, str(e) or "Upload-Offset is required")
+
+    session = SessionLocal()
+    try:
+        upload = _own_upload(session, upload_id)
+        if upload is None:
+            return _error(404, "Upload not found")
+        if upload.status != "uploading":
+            return _not_uploading(upload)
+        if offset != upload.offset:
+            return _error(409, f"Upload-Offset {offset} does not match the server offset {upload.offset}")
+        remaining = upload.length - offset
+        if request.content_length is not None and request.content_length > remaining:
+            return _error(413, f"Body is larger than the {remaining} bytes left")
+
+        # Stream the body to disk; a dropped connection keeps what arrived (unless checksummed).
+        # The file lock is held until the new offset is committed, so a second PATCH for the
+        # same offset can neither interleave its bytes nor truncate ours.
+        h = hashlib.new(chunk_algo) if chunk_algo else None
+        written = 0
+        with open(upload.part_path, "r+b") as fh:
+            if not _lock_part(fh):
+                return _error(409, "Another request is writing to this upload")
+            session.refresh(upload)  # the offset may have moved before we got the lock
+            if upload.status != "uploading":
+                return _not_uploading(upload)
+            if offset != upload.offset:
+                return _error(409, f"Upload-Offset {offset} does not match the server offset {upload.offset}")
+            fh.seek(offset)
+            while written < remaining:
+                block = request.stream.read(min(UPLOAD_COPY_BUFFER, remaining - written))
+                if not block:
+                    break
+                fh.write(block)
+                if h is not None:
+                    h.update(block)
+                written += len(block)
+            if h is not None and h.digest() != chunk_digest:
+                fh.truncate(offset)
+                return _error(460, "Checksum mismatch")
+            fh.flush()
+            os.fsync(fh.fileno())
+
+            # Conditional bump: without fcntl it is what stops two PATCHes both winning
+            new_offset = offset + written
+            moved = session.execute(
+                update(VideoUpload)
+                .where(VideoUpload.id == upload_id, VideoUpload.offset == offset)
+                .values(offset=new_offset)
+            ).rowcount
+            session.commit()
+        if not moved:
+            return _error(409, "Upload offset changed concurrently")
+        if new_offset < upload.length:
+            return _tus_response(204, Upload_Offset=new_offset)
+        return _complete_upload(session, upload_id, new_offset)
+    finally:
+        session.close()
+
+
+def _complete_upload(session, upload_id, final_offset):
+    # Claim the completion: of two requests that both saw the last byte, only one moves the
+    # row out of "uploading"; the other answers like a PATCH on a completing upload.
+    claimed = session.execute(
+        update(VideoUpload)
+        .where(VideoUpload.id == upload_id, VideoUpload.status == "uploading",
+               VideoUpload.offset == VideoUpload.length)
+        .values(status="completing")
+    ).rowcount
+    session.commit()
+    if not claimed:
+        return _not_uploading(_own_upload(session, upload_id))
+    try:
+        # Checksum, move and registration run in the worker (imported here: the web tier only sends)
+        from celery_worker import enqueue_complete_upload
+        enqueue_complete_upload(upload_id)
+    except Exception:
+        # The row stays "completing"; expire_stale_uploads enqueues it again after UPLOAD_COMPLETE_TIMEOUT
+        current_app.logger.exception("[enqueue] Failed to dispatch complete_upload(upload_id=%s)", upload_id)
+    return _tus_response(204, Upload_Offset=final_offset)
+
+
+@upload_bp.route("/video/uploads/<upload_id>", methods=["DELETE"])
+@login_required
+def delete_upload(upload_id):
+    if request.headers.get("Tus-Resumable") != TUS_VERSION:
+        return _error(412, f"Tus-Resumable: {TUS_VERSION} required")
+    session = SessionLocal()
+    try:
+        upload = _own_upload(session, upload_id)
+        if upload is None:
+            return _error(404, "Upload not found")
+        if upload.status == "completing":
+            return _tus_response(409, {"error": "Upload is being completed"}, Retry_After=2)
+        if upload.status in ("uploading", "failed") and os.path.exists(upload.part_path):
+            os.remove(upload.part_path)
+        session.delete(upload)
+        session.commit()
+        return _tus_response(204)
+    finally:
+        session.close()
@@ -0,0 +1,84 @@
+# app/upload/keyset.py
+"""Keyset (cursor) pagination helpers for the frame listings.
+
+A page is fetched with WHERE (sort key) after/before the cursor row instead of OFFSET, so
+page 500 costs the same as page 1 as long as an index covers the sort key. Every sort
+key ends in the primary key so it is unique and pages are stable under ties. Cursors are
+opaque url-safe strings holding a tag (the sort option they belong to) and the sort-key
+values of a boundary row; a cursor from another sort order is ignored.
+"""
+import base64
+import json
+from collections import namedtuple
+from datetime import datetime
+from sqlalchemy import and_, or_
+
+# rows of the page; cursors for the pages after and before it (None at either end)
+Page = namedtuple("Page", ["rows", "next_cursor", "prev_cursor"])
+
+
+def encode_cursor(values, tag: str = "") -> str:
+    packed = [tag] + [{"dt": v.isoformat()} if isinstance(v, datetime) else v for v in values]
+    raw = json.dumps(packed, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token: str, n_keys: int, tag: str = ""):
+    """The values of a cursor, or None if it is missing, malformed or has another tag."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list) or len(values) != n_keys + 1 or values[0] != tag:
+        return None
+    try:
+        return [datetime.fromisoformat(v["dt"]) if isinstance(v, dict) else v for v in values[1:]]
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _after(order, values):
+    """Rows strictly after `values` in the given (column, descending) order."""
+    clauses = []
+    for i, (col, desc) in enumerate(order):
+        if values[i] is None:
+            continue
+        equal = [c == v for (c, _), v in zip(order[:i], values[:i]) if v is not None]
+        step = col < values[i] if desc else col > values[i]
+        clauses.append(and_(*equal, step))
+    return or_(*clauses)
+
+
+def _row_key(row, order):
+    return [getattr(row, col.key) for col, _ in order]
+
+
+def keyset_page(query, order, after=None, before=None, limit=24, tag: str = "") -> Page:
+    """
+    One page of `query` in `order`, a list of (column, descending) ending in a unique column.
+    `after` / `before` are decoded cursor values: the page starts right after `after`, or
+    ends right before `before` (fetched in reverse, then flipped). With neither, the first page.
+    """
+    backward = before is not None and after is None
+    walk = [(col, not desc) for col, desc in order] if backward else order
+    cursor = before if backward else after
+    if cursor is not None:
+        query = query.filter(_after(walk, cursor))
+    query = query.order_by(*[col.desc() if desc else col.asc() for col, desc in walk])
+    rows = query.limit(limit + 1).all()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if backward:
+        rows.reverse()
+    if not rows:
+        return Page(rows, None, None)
+    has_next = True if backward else more
+    has_prev = more if backward else cursor is not None
+    return Page(
+        rows,
+        encode_cursor(_row_key(rows[-1], order), tag) if has_next else None,
+        encode_cursor(_row_key(rows[0], order), tag) if has_prev else None,
+    )
@@ -1,19 +1,25 @@
 # app/upload/routes.py
 
 import os
-import cv2
-import numpy as np
+import json
+import time
 from datetime import datetime
-from flask import render_template, redirect, url_for, flash, request, current_app
+from flask import render_template, redirect, url_for, flash, request, current_app, jsonify, Response, abort, send_file
 from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
 from app.upload import upload_bp
 from app.upload.forms import UploadForm
 from app.upload.video_forms import VideoUploadForm
-from app.tasks.embed import generate_face_embedding
-from celery_worker import enqueue_process_video
+from app.upload.keyset import keyset_page, decode_cursor
+from app.media import media_url, static_relpath
+from app.video_probe import probe_video
+from app.tasks.leases import is_lease_stale, hand_over_for_requeue
+from app.tasks.progress import read_progress, progress_payload, snapshot_from_video, TERMINAL_STATUSES
+from app.tasks.dashboard_stats import user_stats, invalidate_user_stats, cached_frame_count
+from app.tasks.derivatives import DERIVATIVE_WIDTHS, STATIC_ROOT, ensure_derivative, parse_derivatives
 from app.database import SessionLocal
 from app.models import UserProfile, SurferFrame, SurfVideo, UserEmbedding
+from sqlalchemy import update
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -22,6 +28,48 @@ load_dotenv()
 # Get upload folder from environment or use default
 UPLOAD_FOLDER = os.getenv("UPLOAD_FOLDER", "app/static/uploads")
 
+# Gallery sort options -> keyset order (column, descending); each ends in the unique id
+GALLERY_SORTS = {
+    'date_desc': [(SurferFrame.created_at, True), (SurferFrame.id, True)],
+    'date_asc': [(SurferFrame.created_at, False), (SurferFrame.id, False)],
+    'score_desc': [(SurferFrame.score, True), (SurferFrame.id, True)],
+    'score_asc': [(SurferFrame.score, False), (SurferFrame.id, False)],
+}
+
+# Matched photos shown per "page" of the profile listing
+PROFILE_PAGE_SIZE = int(os.getenv("PROFILE_PAGE_SIZE", "48"))
+
+@upload_bp.app_template_global()
+def frame_image(frame):
+    """
+    URLs for a frame's <img>: the smallest derivative as src, a srcset of all configured
+    widths, and the full-size crop for on-demand viewing. Widths not yet rendered point at
+    upload.frame_derivative, which creates them on first request.
+    """
+    src_rel = static_relpath(frame.frame_path)
+    known = parse_derivatives(frame.derivatives)
+    urls = []
+    version = frame.updated_at  # changes whenever the crop (and so its derivatives) is rewritten
+    for width in DERIVATIVE_WIDTHS:
+        if width in known:
+            urls.append((width, media_url(known[width], version)))
+        else:
+            urls.append((width, url_for("upload.frame_derivative", frame_id=frame.id, width=width)))
+    full = media_url(src_rel, version)
+    return {
+        "src": urls[0][1] if urls else full,
+        "srcset": ", ".join(f"{u} {w}w" for w, u in urls),
+        "full": full,
+    }
+
+# Server-sent progress events. Each open stream holds a web worker, so the status page polls
+# progress.json unless PROGRESS_SSE is on; then: poll interval, keep-alive comment interval,
+# and how long one stream stays open before the browser's EventSource reconnects
+PROGRESS_SSE = os.getenv("PROGRESS_SSE", "0") not in ("0", "false", "False")
+PROGRESS_SSE_POLL = float(os.getenv("PROGRESS_SSE_POLL", "1.0"))
+PROGRESS_SSE_KEEPALIVE = float(os.getenv("PROGRESS_SSE_KEEPALIVE", "15"))
+PROGRESS_SSE_MAX_SECONDS = float(os.getenv("PROGRESS_SSE_MAX_SECONDS", "30"))
+
 def validate_face_image(image_path):
     """Validate face presence using the same pipeline as embed.py.
     Returns True if a valid face embedding can be computed, False otherwise.
@@ -87,7 +135,8 @@ def upload_page():
                 face_side_filename = None
                 flash("No face detected in the side view image. It will be ignored.", "warning")
         
-        # Generate embeddings with error handling
+        # Generate embeddings with error handling (InsightFace loads on first use, not at startup)
+        from app.tasks.embed import generate_face_embedding
         ok_front = generate_face_embedding(current_user.id, face_path, "front")
         if not ok_front:
             # Clean up files and abort
@@ -146,6 +195,13 @@ def upload_page():
 
             session.commit()
             flash("Reference images uploaded and embeddings generated successfully!", "success")
+            # Match the new reference photos against earlier sessions in the background
+            try:
+                from celery_worker import enqueue_retro_match
+                enqueue_retro_match(current_user.id)
+            except Exception:
+                # Non-fatal: the next match_all_frames sweep picks these frames up
+                pass
             
         except Exception as e:
             flash(f"Error saving profile: {str(e)}", "error")
@@ -169,28 +225,20 @@ def profile():
         # Get user profile
         profile = session.query(UserProfile).filter_by(user_id=current_user.id).first()
         
-        # Get user's surf photos (newest first)
-        if hasattr(SurferFrame, 'created_at'):
-            frames = session.query(SurferFrame).filter_by(user_id=current_user.id).order_by(SurferFrame.created_at.desc()).all()
-        else:
-            frames = session.query(SurferFrame).filter_by(user_id=current_user.id).order_by(SurferFrame.id.desc()).all()
-        
-        # Normalize and filter out frames that no longer exist on disk
-        base_static = os.path.join("app", "static")
-        clean_frames = []
+        # Get user's surf photos (newest first), one keyset page at a time. Files known to be
+        # missing (file_status, kept by process_video and clean-missing) are filtered in SQL.
+        order = [(SurferFrame.created_at, True), (SurferFrame.id, True)]
+        after = decode_cursor(request.args.get('after'), len(order), tag="profile")
+        query = session.query(SurferFrame).filter(
+            SurferFrame.user_id == current_user.id, SurferFrame.file_status == "ok"
+        )
+        result = keyset_page(query, order, after=after, limit=PROFILE_PAGE_SIZE, tag="profile")
+        frames, next_cursor = result.rows, result.next_cursor
         for f in frames:
-            p = (f.frame_path or "").replace("\\", "/")
-            if p.startswith("app/static/"):
-                p = p[len("app/static/"):]
-            elif p.startswith("static/"):
-                p = p[len("static/"):]
-            disk_path = os.path.join(base_static, p)
-            if os.path.exists(disk_path):
-                f.frame_path = p
-                clean_frames.append(f)
-        frames = clean_frames
+            f.frame_path = static_relpath(f.frame_path)
         
-        return render_template("profile.html", profile=profile, frames=frames)
+        return render_template("profile.html", profile=profile, frames=frames, next_cursor=next_cursor,
+                               first_page=after is None)
         
     except Exception as e:
         flash(f"Error loading profile: {str(e)}", "error")
@@ -207,73 +255,55 @@ def gallery():
     """
     # Get filter, sort, and pagination parameters from request
     sort_option = request.args.get('sort', 'date_desc')
+    if sort_option not in GALLERY_SORTS:
+        sort_option = 'date_desc'
     min_score = float(request.args.get('min_score', 0))
     view_option = request.args.get('view', 'grid')
     date_range = request.args.get('date_range', 'all')
-    page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 12, type=int)  # Number of photos per page
+    page = max(1, request.args.get('page', 1, type=int))  # display only; the cursor selects the rows
+    per_page = min(100, max(1, request.args.get('per_page', 12, type=int)))  # Number of photos per page
     
     session = SessionLocal()
     
     try:
-        # Base query - get frames for current user with minimum score
-        query = session.query(SurferFrame).filter_by(user_id=current_user.id).filter(SurferFrame.score >= min_score)
-        
-        # Apply date range filter if SurferFrame has created_at field
-        if hasattr(SurferFrame, 'created_at'):
-            from datetime import datetime, timedelta
-            now = datetime.now()
-
-            if date_range == 'today':
-                start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-                query = query.filter(SurferFrame.created_at >= start)
-            elif date_range == 'week':
-                start = now - timedelta(days=7)
-                query = query.filter(SurferFrame.created_at >= start)
-            elif date_range == 'month':
-                start = now - timedelta(days=30)
-                query = query.filter(SurferFrame.created_at >= start)
-        
-        # Apply sorting
-        if sort_option == 'date_asc':
-            if hasattr(SurferFrame, 'created_at'):
-                query = query.order_by(SurferFrame.created_at.asc())
-            else:
-                query = query.order_by(SurferFrame.id.asc())
-        elif sort_option == 'date_desc':
-            if hasattr(SurferFrame, 'created_at'):
-                query = query.order_by(SurferFrame.created_at.desc())
-            else:
-                query = query.order_by(SurferFrame.id.desc())
-        elif sort_option == 'score_asc':
-            query = query.order_by(SurferFrame.score.asc())
-        elif sort_option == 'score_desc':
-            query = query.order_by(SurferFrame.score.desc())
-        
-        # Get total count for pagination
-        total_count = query.count()
-        
-        # Calculate pagination values
-        total_pages = (total_count + per_page - 1) // per_page  # Ceiling division
-        offset = (page - 1) * per_page
-        
-        # Get frames for current page
-        frames = query.limit(per_page).offset(offset).all()
-        
-        # Process frame paths and filter out missing files to avoid 404s
-        base_static = os.path.join("app", "static")
-        clean_frames = []
+        # Base query - get frames for current user with minimum score (files known present)
+        query = session.query(SurferFrame).filter_by(user_id=current_user.id, file_status="ok").filter(SurferFrame.score >= min_score)
+        
+        # Apply date range filter
+        from datetime import datetime, timedelta
+        now = datetime.now()
+        if date_range == 'today':
+            start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+            query = query.filter(SurferFrame.created_at >= start)
+        elif date_range == 'week':
+            start = now - timedelta(days=7)
+            query = query.filter(SurferFrame.created_at >= start)
+        elif date_range == 'month':
+            start = now - timedelta(days=30)
+            query = query.filter(SurferFrame.created_at >= start)
+        
+        # Keyset pagination on the sort key + id: pages are selected by cursor (the first/last
+        # row of the neighbouring page) rather than OFFSET, so deep pages cost the same as page 1
+        order = GALLERY_SORTS[sort_option]
+        after = decode_cursor(request.args.get('after'), len(order), tag=sort_option)
+        before = decode_cursor(request.args.get('before'), len(order), tag=sort_option)
+        result = keyset_page(query, order, after=after, before=before, limit=per_page, tag=sort_option)
+        if not result.rows and (after is not None or before is not None):
+            # Stale cursor (rows deleted or filters changed): start over
+            page = 1
+            result = keyset_page(query, order, limit=per_page, tag=sort_option)
+        elif after is None and before is None:
+            page = 1
+        frames = result.rows
+        
+        # Total for "Page N of M": a COUNT per filter combination, cached briefly per user
+        signature = f"{min_score}|{date_range}"
+        total_count = cached_frame_count(current_user.id, signature, query.count)
+        total_pages = max(page, (total_count + per_page - 1) // per_page)  # Ceiling division
+        
+        # Missing files were already filtered by file_status; just normalize the paths
         for frame in frames:
-            p = (frame.frame_path or "").replace("\\", "/")
-            if p.startswith("app/static/"):
-                p = p[len("app/static/"):]
-            elif p.startswith("static/"):
-                p = p[len("static/"):]
-            disk_path = os.path.join(base_static, p)
-            if os.path.exists(disk_path):
-                frame.frame_path = p
-                clean_frames.append(frame)
-        frames = clean_frames
+            frame.frame_path = static_relpath(frame.frame_path)
         
         # Create pagination metadata
         pagination = {
@@ -281,10 +311,12 @@ def gallery():
             'per_page': per_page,
             'total_count': total_count,
             'total_pages': total_pages,
-            'has_prev': page > 1,
-            'has_next': page < total_pages,
-            'prev_page': page - 1 if page > 1 else None,
-            'next_page': page + 1 if page < total_pages else None,
+            'has_prev': result.prev_cursor is not None,
+            'has_next': result.next_cursor is not None,
+            'prev_page': page - 1 if result.prev_cursor else None,
+            'next_page': page + 1 if result.next_cursor else None,
+            'prev_cursor': result.prev_cursor,
+            'next_cursor': result.next_cursor,
         }
         
         # Render template with frames, pagination, and filter/sort options
@@ -305,6 +337,99 @@ def gallery():
     finally:
         session.close()
 
+@upload_bp.route("/frame/<int:frame_id>/w<int:width>")
+@login_required
+def frame_derivative(frame_id, width):
+    """
+    Lazily render one derivative of a frame crop, cache it on disk and record it on the
+    row so later page views link the static file directly.
+    """
+    session = SessionLocal()
+    try:
+        frame = session.query(SurferFrame).filter_by(id=frame_id, user_id=current_user.id).first()
+        if not frame:
+            abort(404)
+        src_rel = static_relpath(frame.frame_path)
+        rel = ensure_derivative(src_rel, width)
+        if rel is None:
+            # Width not configured or source unreadable: fall back to the original crop
+            return redirect(media_url(src_rel, frame.updated_at))
+        known = parse_derivatives(frame.derivatives)
+        if known.get(width) != rel:
+            known[width] = rel
+            session.execute(
+                update(SurferFrame)
+                .where(SurferFrame.id == frame_id)
+                .values(derivatives=json.dumps({str(k): v for k, v in sorted(known.items())}),
+                        updated_at=SurferFrame.updated_at)  # not a content change
+            )
+            session.commit()
+        return send_file(os.path.abspath(os.path.join(STATIC_ROOT, rel)), max_age=86400)
+    finally:
+        session.close()
+
+def _video_destination():
+    """(full path, file name) for a new upload of the current user in VIDEO_UPLOAD_FOLDER."""
+    video_upload_folder = os.getenv("VIDEO_UPLOAD_FOLDER", "app/static/videos")
+    os.makedirs(video_upload_folder, exist_ok=True)
+    
+    # Generate unique filename with timestamp
+    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+    video_filename = secure_filename(f"{current_user.username}_video_{timestamp}.mp4")
+    return os.path.join(video_upload_folder, video_filename), video_filename
+
+def _register_video(video_path, video_filename, location, description):
+    """
+    Read metadata from a saved upload's container headers, create its SurfVideo row and
+    enqueue process_video (which also writes the thumbnail). Returns (video_id,
+    enqueue_error or None). Raises ValueError if the file is not a readable video.
+    """
+    videos_dir_relative = "videos"
+    # Relative path for database storage (without app/static/ prefix)
+    video_path_relative = os.path.join(videos_dir_relative, video_filename)
+    
+    # Header-only probe: no decoding on the web worker (see app/video_probe.py)
+    info = probe_video(video_path)
+    frame_count = info.frame_count or 0
+    duration = info.duration or 0
+    
+    # Store video information in database (paths normalized to forward slashes)
+    session = SessionLocal()
+    try:
+        new_video = SurfVideo(
+            user_id=current_user.id,
+            video_path=video_path_relative.replace("\\", "/"),
+            location=location,
+            description=description,
+            duration=duration,
+            frame_count=frame_count,
+            status="pending"
+        )
+        session.add(new_video)
+        session.commit()
+        video_id = new_video.id
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+    invalidate_user_stats([current_user.id])
+    
+    try:
+        # Queue the video processing task in Celery (imported here: the web tier only needs it to send)
+        from celery_worker import enqueue_process_video
+        async_res = enqueue_process_video(video_id)
+        current_app.logger.info(
+            "[enqueue] Sent process_video(video_id=%s) task_id=%s to broker=%s",
+            video_id,
+            getattr(async_res, "id", None),
+            os.getenv("CELERY_BROKER_URL")
+        )
+        return video_id, None
+    except Exception as e:
+        current_app.logger.exception("[enqueue] Failed to dispatch process_video(video_id=%s)", video_id)
+        return video_id, e
+
 @upload_bp.route("/video", methods=["GET", "POST"])
 @login_required
 def video_upload():
@@ -318,111 +443,29 @@ def video_upload():
         location = form.location.data
         description = form.description.data
         
-        # Create upload directory if it doesn't exist
-        video_upload_folder = os.getenv("VIDEO_UPLOAD_FOLDER", "app/static/videos")
-        os.makedirs(video_upload_folder, exist_ok=True)
-        
-        # Generate unique filename with timestamp
-        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        video_filename = secure_filename(f"{current_user.username}_video_{timestamp}.mp4")
-        
-        # Create full path for file operations
-        video_path = os.path.join(video_upload_folder, video_filename)
-        
-        # Create relative path for database storage (without app/static/ prefix)
-        videos_dir_relative = "videos"
-        video_path_relative = os.path.join(videos_dir_relative, video_filename)
+        video_path, video_filename = _video_destination()
         
         # Save the video file
         video_file.save(video_path)
         
-        # Get video metadata using OpenCV
         try:
-            cap = cv2.VideoCapture(video_path)
-            if not cap.isOpened():
-                flash("Error: Could not open video file.", "error")
-                os.remove(video_path)  # Remove the invalid video
-                return redirect(url_for("upload.video_upload"))
-                
-            # Get video properties
-            frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-            fps = cap.get(cv2.CAP_PROP_FPS)
-            duration = frame_count / fps if fps > 0 else 0
-            
-            # Create thumbnail
-            thumbnail_folder = os.path.join(video_upload_folder, "thumbnails")
-            os.makedirs(thumbnail_folder, exist_ok=True)
-            thumbnail_filename = f"{os.path.splitext(video_filename)[0]}_thumb.jpg"
-            
-            # Create full path for file operations
-            thumbnail_path = os.path.join(thumbnail_folder, thumbnail_filename)
-            
-            # Create relative path for database storage (without app/static/ prefix)
-            thumbnails_dir_relative = os.path.join(videos_dir_relative, "thumbnails")
-            thumbnail_path_relative = os.path.join(thumbnails_dir_relative, thumbnail_filename)
-            
-            # Read the first frame for thumbnail
-            ret, frame = cap.read()
-            if ret:
-                cv2.imwrite(thumbnail_path, frame)
-            else:
-                thumbnail_path = None
-                thumbnail_path_relative = None
-                
-            cap.release()
-            
-            # Store video information in database
-            session = SessionLocal()
-            try:
-                new_video = SurfVideo(
-                    user_id=current_user.id,
-                    video_path=video_path_relative,
-                    thumbnail_path=thumbnail_path_relative,
-                    location=location,
-                    description=description,
-                    duration=duration,
-                    frame_count=frame_count,
-                    status="pending"
-                )
-                session.add(new_video)
-                session.commit()
-                
-                # Get the video ID for redirect
-                video_id = new_video.id
-                
-                # Normalize stored paths to forward slashes for consistency across OS/container
-                if new_video.video_path:
-                    new_video.video_path = str(new_video.video_path).replace("\\", "/")
-                if new_video.thumbnail_path:
-                    new_video.thumbnail_path = str(new_video.thumbnail_path).replace("\\", "/")
-                try:
-                    # Queue the video processing task in Celery
-                    async_res = enqueue_process_video(video_id)
-                    current_app.logger.info(
-                        "[enqueue] Sent process_video(video_id=%s) task_id=%s to broker=%s",
-                        video_id,
-                        getattr(async_res, "id", None),
-                        os.getenv("CELERY_BROKER_URL")
-                    )
-                    flash("Video uploaded successfully! Processing has started automatically.", "success")
-                except Exception as e:
-                    current_app.logger.exception("[enqueue] Failed to dispatch process_video(video_id=%s)", video_id)
-                    flash(f"Video uploaded, but failed to start processing automatically. You can press 'Process' on the video page. Error: {e}", "error")
-                return redirect(url_for("upload.video_status", video_id=video_id))
-                
-            except Exception as e:
-                flash(f"Error saving video information: {str(e)}", "error")
-                return redirect(url_for("upload.video_upload"))
-                
-            finally:
-                session.close()
-                
+            video_id, enqueue_error = _register_video(video_path, video_filename, location, description)
+        except ValueError:
+            flash("Error: Could not open video file.", "error")
+            os.remove(video_path)  # Remove the invalid video
+            return redirect(url_for("upload.video_upload"))
         except Exception as e:
             flash(f"Error processing video: {str(e)}", "error")
             # Clean up the file if there was an error
             if os.path.exists(video_path):
                 os.remove(video_path)
             return redirect(url_for("upload.video_upload"))
+        
+        if enqueue_error is None:
+            flash("Video uploaded successfully! Processing has started automatically.", "success")
+        else:
+            flash(f"Video uploaded, but failed to start processing automatically. You can press 'Process' on the video page. Error: {enqueue_error}", "error")
+        return redirect(url_for("upload.video_status", video_id=video_id))
     
     # Get user's videos for display
     session = SessionLocal()
@@ -464,10 +507,11 @@ def video_status(video_id):
             
         # Get frames from this video that have been matched to the current user
         # Prefer filtering by video_id (requires DB column 'video_id'). Fallback to user-only if unavailable.
+        # The page shows six of them plus a "View All" link, so seven rows are enough.
         try:
-            frames = session.query(SurferFrame).filter_by(user_id=current_user.id, video_id=video_id).all()
+            frames = session.query(SurferFrame).filter_by(user_id=current_user.id, video_id=video_id).limit(7).all()
         except Exception:
-            frames = session.query(SurferFrame).filter_by(user_id=current_user.id).all()
+            frames = session.query(SurferFrame).filter_by(user_id=current_user.id).limit(7).all()
         
         # Process frame paths to ensure they work correctly with url_for('static', ...)
         for frame in frames:
@@ -478,7 +522,8 @@ def video_status(video_id):
                 p = p[len("static/"):]
             frame.frame_path = p
         
-        return render_template("video_status.html", video=video, frames=frames)
+        return render_template("video_status.html", video=video, frames=frames, can_resume=is_lease_stale(video) or video.status == "failed",
+                               progress_sse=PROGRESS_SSE)
         
     except Exception as e:
         flash(f"Error loading video status: {str(e)}", "error")
@@ -487,6 +532,80 @@ def video_status(video_id):
     finally:
         session.close()
 
+def _video_progress(video_id):
+    """
+    Progress of one of the current user's videos: the Redis hash written by process_video
+    when there is one, otherwise a snapshot of the SurfVideo row. None if not the user's video.
+    """
+    progress = read_progress(video_id)
+    if progress is not None and progress.get("user_id") == current_user.id:
+        return progress
+    session = SessionLocal()
+    try:
+        video = session.query(SurfVideo).filter_by(id=video_id, user_id=current_user.id).first()
+        if not video:
+            return None
+        snapshot = snapshot_from_video(session, video)
+        if progress is not None and progress.get("user_id") is None:
+            # Hash without an owner (e.g. only a status was written); trust it once the row checks out
+            snapshot.update({k: v for k, v in progress.items() if v is not None})
+        return snapshot
+    finally:
+        session.close()
+
+@upload_bp.route("/video/<int:video_id>/progress.json")
+@login_required
+def video_progress(video_id):
+    """
+    JSON processing status for polling: status, frame counts, detections so far and ETA.
+    """
+    progress = _video_progress(video_id)
+    if progress is None:
+        return jsonify({"error": "not found"}), 404
+    progress["video_id"] = video_id
+    response = jsonify(progress_payload(progress))
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
+@upload_bp.route("/video/<int:video_id>/events")
+@login_required
+def video_progress_events(video_id):
+    """
+    Server-sent events stream of progress payloads. The first event comes from
+    _video_progress (which may hit the database once); after that only the Redis hash is
+    polled, and an event is sent only when it changes. The stream ends once the video
+    reaches a final status or after PROGRESS_SSE_MAX_SECONDS, since it holds a web worker
+    for as long as it is open; the browser then reconnects.
+    """
+    progress = _video_progress(video_id)
+    if progress is None:
+        return jsonify({"error": "not found"}), 404
+    user_id = current_user.id
+
+    def _event(payload):
+        return f"event: progress\ndata: {json.dumps(payload)}\n\n"
+
+    def stream():
+        last = dict(progress, video_id=video_id)
+        payload = progress_payload(last)
+        yield "retry: 3000\n\n"
+        yield _event(payload)
+        started = sent = time.monotonic()
+        while payload["status"] not in TERMINAL_STATUSES and time.monotonic() - started < PROGRESS_SSE_MAX_SECONDS:
+            time.sleep(PROGRESS_SSE_POLL)
+            current = read_progress(video_id)
+            if current is not None and current.get("user_id") in (None, user_id) and current != last:
+                last = dict(current, video_id=video_id)
+                payload = progress_payload(last)
+                yield _event(payload)
+                sent = time.monotonic()
+            elif time.monotonic() - sent >= PROGRESS_SSE_KEEPALIVE:
+                yield ": keep-alive\n\n"
+                sent = time.monotonic()
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(stream(), mimetype="text/event-stream", headers=headers)
+
 @upload_bp.route("/dashboard")
 @login_required
 def dashboard():
@@ -496,58 +615,22 @@ def dashboard():
     session = SessionLocal()
     
     try:
-        # Get user's videos
-        videos = session.query(SurfVideo).filter_by(user_id=current_user.id).all()
-        
-        # Get user's frames
-        frames = session.query(SurferFrame).filter_by(user_id=current_user.id).all()
-        
-        # Calculate statistics
-        stats = {
-            'total_videos': len(videos),
-            'total_frames': len(frames),
-            'videos_by_status': {},
-            'avg_score': 0,
-            'high_confidence_frames': 0,
-            'processing_time': {},
+        # Counts and averages come from GROUP BY queries, cached per user for a few seconds
+        # (see app/tasks/dashboard_stats.py); no SurferFrame rows are loaded here
+        stats = dict(user_stats(session, current_user.id))
+        
+        # Video table (one row per upload; small compared to frames)
+        videos = session.query(SurfVideo).filter_by(user_id=current_user.id).order_by(SurfVideo.id.desc()).all()
+        
+        # Processing time of completed videos
+        stats['processing_time'] = {
+            v.id: (v.updated_at - v.created_at).total_seconds()
+            for v in videos
+            if v.status == 'completed' and v.created_at and v.updated_at
         }
         
-        # Count videos by status
-        for video in videos:
-            status = video.status
-            if status in stats['videos_by_status']:
-                stats['videos_by_status'][status] += 1
-            else:
-                stats['videos_by_status'][status] = 1
-        
-        # Calculate average score and high confidence frames
-        if frames:
-            total_score = sum(frame.score for frame in frames)
-            stats['avg_score'] = total_score / len(frames)
-            stats['high_confidence_frames'] = sum(1 for frame in frames if frame.score >= 0.9)
-        
-        # Calculate processing times and rates
-        for video in videos:
-            if video.status == 'completed' and video.frame_count and video.processed_frames:
-                # Calculate processing time (if we had created_at and updated_at)
-                if hasattr(video, 'created_at') and hasattr(video, 'updated_at'):
-                    processing_time = (video.updated_at - video.created_at).total_seconds()
-                    stats['processing_time'][video.id] = processing_time
-                
-                # Calculate detection rate
-                detection_rate = video.processed_frames / video.frame_count
-                if 'detection_rate' not in stats:
-                    stats['detection_rate'] = []
-                stats['detection_rate'].append(detection_rate)
-        
-        # Calculate average detection rate
-        if 'detection_rate' in stats and stats['detection_rate']:
-            stats['avg_detection_rate'] = sum(stats['detection_rate']) / len(stats['detection_rate'])
-        else:
-            stats['avg_detection_rate'] = 0
-        
-        # Get recent activity (last 5 videos)
-        recent_videos = session.query(SurfVideo).filter_by(user_id=current_user.id).order_by(SurfVideo.id.desc()).limit(5).all()
+        # Recent activity (last 5 videos)
+        recent_videos = videos[:5]
         
         return render_template(
             "dashboard.html",
@@ -579,20 +662,29 @@ def process_video_route(video_id):
             flash("Video not found or you don't have permission to process it.", "error")
             return redirect(url_for("upload.video_upload"))
             
-        # Check if the video is already being processed
-        if video.status == "processing":
+        # Check if the video is already being processed (a stale lease means the worker died)
+        if video.status == "processing" and not is_lease_stale(video):
             flash("This video is already being processed.", "warning")
             return redirect(url_for("upload.video_status", video_id=video_id))
             
         # Check if the video has already been processed
-        if video.status == "completed":
+        if video.status in ("completed", "completed_with_errors"):
             flash("This video has already been processed.", "warning")
             return redirect(url_for("upload.video_status", video_id=video_id))
             
-        # Queue the video processing task in Celery
+        # A stale video is handed to the new task, so the periodic sweep does not requeue it too
+        if video.status == "processing":
+            hand_over_for_requeue(video)
+            session.commit()
+            
+        # Queue the video processing task in Celery (resumes from the checkpoint if there is one)
+        from celery_worker import enqueue_process_video
         enqueue_process_video(video_id)
         
-        flash("Video processing has started. This may take several minutes.", "success")
+        if video.checkpoint_frame is not None:
+            flash(f"Video processing resumed from frame {video.checkpoint_frame}.", "success")
+        else:
+            flash("Video processing has started. This may take several minutes.", "success")
         return redirect(url_for("upload.video_status", video_id=video_id))
         
     except Exception as e:
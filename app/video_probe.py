@@ -0,0 +1,207 @@
+# app/video_probe.py
+"""Video metadata read straight from the container headers, without decoding anything.
+
+Used on the upload path instead of cv2.VideoCapture, so the web tier needs no codec stack
+and an upload costs a few small reads however long the video is (process_video makes the
+thumbnail while it decodes anyway).
+  - MP4 / MOV (ISO BMFF, QuickTime): moov/mvhd and the first video trak (tkhd, mdhd, hdlr,
+    stsd, stsz). The frame count is the sample count from stsz and fps is samples / media
+    duration, so variable frame rate files get their true count and average rate.
+    Fragmented files (empty stsz) are counted from their moof/traf/trun boxes.
+    Only box headers are read, so the moov may sit before or after mdat.
+  - AVI (RIFF): the avih main header and the video stream's strh/strf, with the OpenDML
+    dmlh total frame count for files over 1 GB.
+Fields that a file does not record are None.
+"""
+import struct
+from collections import namedtuple
+
+VideoInfo = namedtuple("VideoInfo", ["container", "codec", "width", "height", "fps", "frame_count", "duration"])
+
+# Top-level box types that may open an ISO BMFF / QuickTime file
+_MP4_FIRST_BOXES = {b"ftyp", b"moov", b"mdat", b"free", b"skip", b"wide", b"pnot", b"styp"}
+
+
+def _box_headers(fh, start, end):
+    """(type, payload start, box end) for each box between start and end."""
+    pos = start
+    while pos + 8 <= end:
+        fh.seek(pos)
+        header = fh.read(8)
+        if len(header) < 8:
+            return
+        size, kind = struct.unpack(">I4s", header)
+        header_len = 8
+        if size == 1:
+            large = fh.read(8)
+            if len(large) < 8:
+                return
+            size, header_len = struct.unpack(">Q", large)[0], 16
+        elif size == 0:
+            size = end - pos  # box runs to the end of its parent
+        if size < header_len:
+            raise ValueError(f"Corrupt {kind!r} box at offset {pos}")
+        yield kind, pos + header_len, min(pos + size, end)
+        pos += size
+
+
+def _child(fh, start, end, kind):
+    for k, s, e in _box_headers(fh, start, end):
+        if k == kind:
+            return s, e
+    return None
+
+
+def _read(fh, pos, n):
+    fh.seek(pos)
+    data = fh.read(n)
+    if len(data) < n:
+        raise ValueError(f"Truncated box at offset {pos}")
+    return data
+
+
+def _timescale_duration(fh, start):
+    """(timescale, duration) from an mvhd or mdhd payload."""
+    if _read(fh, start, 1)[0] == 1:
+        return struct.unpack(">IQ", _read(fh, start + 20, 12))
+    return struct.unpack(">II", _read(fh, start + 12, 8))
+
+
+def _mp4_video_track(fh, moov):
+    """(track_id, tkhd width/height, media timescale/duration, codec, sample count) of the first video trak."""
+    for kind, start, end in _box_headers(fh, *moov):
+        if kind != b"trak":
+            continue
+        mdia = _child(fh, start, end, b"mdia")
+        hdlr = mdia and _child(fh, *mdia, b"hdlr")
+        if not hdlr or _read(fh, hdlr[0] + 8, 4) != b"vide":
+            continue
+        tkhd = _child(fh, start, end, b"tkhd")
+        track_id = width = height = None
+        if tkhd:
+            v1 = _read(fh, tkhd[0], 1)[0] == 1
+            track_id = struct.unpack(">I", _read(fh, tkhd[0] + (20 if v1 else 12), 4))[0]
+            w, h = struct.unpack(">II", _read(fh, tkhd[0] + (88 if v1 else 76), 8))
+            width, height = w >> 16, h >> 16  # 16.16 fixed point
+        mdhd = _child(fh, *mdia, b"mdhd")
+        timescale, duration = _timescale_duration(fh, mdhd[0]) if mdhd else (0, 0)
+        codec, samples = None, 0
+        minf = _child(fh, *mdia, b"minf")
+        stbl = minf and _child(fh, *minf, b"stbl")
+        if stbl:
+            stsd = _child(fh, *stbl, b"stsd")
+            if stsd and stsd[1] - stsd[0] >= 16:
+                codec = _read(fh, stsd[0] + 12, 4).decode("latin-1").strip()
+            stsz = _child(fh, *stbl, b"stsz") or _child(fh, *stbl, b"stz2")
+            if stsz:
+                samples = struct.unpack(">I", _read(fh, stsz[0] + 8, 4))[0]
+        return track_id, width, height, timescale, duration, codec, samples
+    return None
+
+
+def _mp4_fragment_samples(fh, file_end, track_id):
+    """Sample count of one track summed over the moof/traf/trun boxes of a fragmented file."""
+    total = 0
+    for kind, start, end in _box_headers(fh, 0, file_end):
+        if kind != b"moof":
+            continue
+        for k, s, e in _box_headers(fh, start, end):
+            if k != b"traf":
+                continue
+            tfhd = _child(fh, s, e, b"tfhd")
+            if tfhd and track_id is not None and struct.unpack(">I", _read(fh, tfhd[0] + 4, 4))[0] != track_id:
+                continue
+            for tk, ts, _te in _box_headers(fh, s, e):
+                if tk == b"trun":
+                    total += struct.unpack(">I", _read(fh, ts + 4, 4))[0]
+    return total
+
+
+def _probe_mp4(fh, file_end, container):
+    moov = _child(fh, 0, file_end, b"moov")
+    if moov is None:
+        raise ValueError("No moov box (incomplete upload?)")
+    movie_duration = None
+    mvhd = _child(fh, *moov, b"mvhd")
+    if mvhd:
+        timescale, duration = _timescale_duration(fh, mvhd[0])
+        movie_duration = duration / timescale if timescale and duration else None
+    track = _mp4_video_track(fh, moov)
+    if track is None:
+        raise ValueError("No video track")
+    track_id, width, height, timescale, duration, codec, samples = track
+    duration = duration / timescale if timescale and duration else movie_duration
+    if not samples and _child(fh, *moov, b"mvex"):
+        samples = _mp4_fragment_samples(fh, file_end, track_id)
+        mehd = _child(fh, *_child(fh, *moov, b"mvex"), b"mehd")
+        if mehd and mvhd:
+            v1 = _read(fh, mehd[0], 1)[0] == 1
+            fragment_duration = struct.unpack(">Q" if v1 else ">I", _read(fh, mehd[0] + 4, 8 if v1 else 4))[0]
+            movie_timescale = _timescale_duration(fh, mvhd[0])[0]
+            duration = duration or (fragment_duration / movie_timescale if movie_timescale else None)
+    fps = samples / duration if samples and duration else None
+    return VideoInfo(container, codec, width, height, fps, samples or None, duration)
+
+
+def _riff_chunks(fh, start, end):
+    """(fourcc, list type or None, data start, data end) of the RIFF chunks between start and end."""
+    pos = start
+    while pos + 8 <= end:
+        fourcc, size = struct.unpack("<4sI", _read(fh, pos, 8))
+        data = pos + 8
+        if fourcc in (b"LIST", b"RIFF"):
+            yield fourcc, _read(fh, data, 4), data + 4, min(data + size, end)
+        else:
+            yield fourcc, None, data, min(data + size, end)
+        pos = data + size + (size & 1)  # chunks are word aligned
+
+
+def _probe_avi(fh, file_end):
+    riff_end = min(8 + struct.unpack("<I", _read(fh, 4, 4))[0], file_end)
+    hdrl = next(((s, e) for c, t, s, e in _riff_chunks(fh, 12, riff_end) if c == b"LIST" and t == b"hdrl"), None)
+    if hdrl is None:
+        raise ValueError("No AVI hdrl list")
+    width = height = fps = frames = codec = total_frames = None
+    for fourcc, list_type, start, end in _riff_chunks(fh, *hdrl):
+        if fourcc == b"avih":
+            us_per_frame, = struct.unpack("<I", _read(fh, start, 4))
+            total_frames, = struct.unpack("<I", _read(fh, start + 16, 4))
+            width, height = struct.unpack("<II", _read(fh, start + 32, 8))
+            fps = 1e6 / us_per_frame if us_per_frame else None
+        elif fourcc == b"LIST" and list_type == b"strl" and frames is None:
+            strh = next(((s, e) for c, t, s, e in _riff_chunks(fh, start, end) if c == b"strh"), None)
+            if strh is None or _read(fh, strh[0], 4) != b"vids":
+                continue
+            scale, rate, _start, length = struct.unpack("<IIII", _read(fh, strh[0] + 20, 16))
+            frames = length
+            if scale and rate:
+                fps = rate / scale
+            strf = next(((s, e) for c, t, s, e in _riff_chunks(fh, start, end) if c == b"strf"), None)
+            if strf and strf[1] - strf[0] >= 20:
+                w, h = struct.unpack("<ii", _read(fh, strf[0] + 4, 8))
+                width, height = w, abs(h)  # negative height means a top-down bitmap
+                codec = _read(fh, strf[0] + 16, 4).decode("latin-1").strip("\x00 ") or None
+        elif fourcc == b"LIST" and list_type == b"odml":
+            dmlh = next(((s, e) for c, t, s, e in _riff_chunks(fh, start, end) if c == b"dmlh"), None)
+            if dmlh:
+                total_frames = max(total_frames or 0, struct.unpack("<I", _read(fh, dmlh[0], 4))[0])
+    frames = max(frames or 0, total_frames or 0) or None
+    duration = frames / fps if frames and fps else None
+    return VideoInfo("avi", codec, width, height, fps, frames, duration)
+
+
+def probe_video(path: str) -> VideoInfo:
+    """Container metadata of a video file. Raises ValueError for unknown or corrupt containers."""
+    with open(path, "rb") as fh:
+        fh.seek(0, 2)
+        file_end = fh.tell()
+        head = _read(fh, 0, 12) if file_end >= 12 else b""
+        try:
+            if head[:4] == b"RIFF" and head[8:12] == b"AVI ":
+                return _probe_avi(fh, file_end)
+            if head[4:8] in _MP4_FIRST_BOXES:
+                container = "mov" if head[4:8] != b"ftyp" or head[8:12] == b"qt  " else "mp4"
+                return _probe_mp4(fh, file_end, container)
+        except struct.error as e:
+            raise ValueError(f"Corrupt video header: {e}")
+    raise ValueError("Not an MP4, MOV or AVI file")
@@ -0,0 +1,384 @@
+# benchmarks/bench_pipeline.py
+"""End-to-end pipeline benchmark on synthetic footage, fully offline.
+
+Everything runs in a scratch directory with its own SQLite database and frame store; the
+YOLO detector and InsightFace are replaced by the stubs in benchmarks/stubs.py (with an
+optional per-call latency to emulate real models). Measured:
+
+  process_video   wall time with a per-stage breakdown (decode, motion gate, detect,
+                  image writes, database, matching, other)
+  match           match_all_frames at each --users gallery size: cold (frame embeddings
+                  computed), warm (cached embeddings, e.g. after a gallery change) and
+                  retro_match_user for one user
+  enroll          generate_face_embedding latency per reference photo
+
+Results are written as JSON; --compare checks them against an earlier run.
+
+Usage:
+    python benchmarks/bench_pipeline.py --json bench.json
+    python benchmarks/bench_pipeline.py --users 10,1000 --seconds 8 --json new.json --compare bench.json
+"""
+import argparse
+import contextlib
+import functools
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+
+class StageTimer:
+    """Accumulates wall time per stage; database time is only counted outside other stages."""
+
+    def __init__(self):
+        self.totals, self.counts = {}, {}
+        self.current = None
+
+    def add(self, stage, seconds):
+        self.totals[stage] = self.totals.get(stage, 0.0) + seconds
+        self.counts[stage] = self.counts.get(stage, 0) + 1
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        outer, self.current = self.current, name
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.current = outer
+            if outer is None:
+                self.add(name, time.perf_counter() - t0)
+
+    def wrap(self, name, fn):
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            with self.stage(name):
+                return fn(*args, **kwargs)
+        return timed
+
+    def report(self, wall: float) -> dict:
+        stages = {k: {"seconds": round(v, 4), "calls": self.counts[k]} for k, v in sorted(self.totals.items())}
+        stages["other"] = {"seconds": round(max(0.0, wall - sum(self.totals.values())), 4), "calls": 0}
+        return stages
+
+
+def _percentiles(samples: list) -> dict:
+    arr = np.asarray(samples) if samples else np.zeros(1)
+    return {"mean_ms": float(arr.mean() * 1000), "p50_ms": float(np.percentile(arr, 50) * 1000),
+            "p95_ms": float(np.percentile(arr, 95) * 1000), "n": len(samples)}
+
+
+def _instrument_process_video(timer: StageTimer):
+    """Patch the names process_video looks up so each stage is timed."""
+    import cv2
+    from sqlalchemy import event
+    import app.tasks.process_video as pv
+    import app.tasks.detector as detector_mod
+    import app.tasks.motion as motion_mod
+    import app.tasks.match as match_mod
+    from app.database import engine
+
+    class TimedCapture:
+        def __init__(self, *args):
+            self._cap = cv2.VideoCapture(*args)
+
+        def read(self):
+            with timer.stage("decode"):
+                return self._cap.read()
+
+        def grab(self):
+            with timer.stage("decode"):
+                return self._cap.grab()
+
+        def __getattr__(self, name):
+            return getattr(self._cap, name)
+
+    class Cv2Proxy:
+        VideoCapture = TimedCapture
+        imwrite = staticmethod(timer.wrap("imwrite", cv2.imwrite))
+
+        def __getattr__(self, name):
+            return getattr(cv2, name)
+
+    class TimedGate(motion_mod.MotionGate):
+        def should_detect(self, frame):
+            with timer.stage("motion"):
+                return super().should_detect(frame)
+
+    pv.cv2 = Cv2Proxy()
+    detector_mod.detect_frame = timer.wrap("detect", detector_mod.detect_frame)
+    motion_mod.MotionGate = TimedGate
+    match_mod.match_all_frames = timer.wrap("match", match_mod.match_all_frames)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info["bench_t0"] = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        if timer.current is None:
+            timer.add("db", time.perf_counter() - conn.info.pop("bench_t0", time.perf_counter()))
+
+
+def _seed_users(session, n_users: int, n_surfers: int, start_uid: int = 1):
+    """Bulk-insert n_users galleries. The first n_surfers users are the synthetic surfers."""
+    from sqlalchemy import insert
+    from app.models import UserEmbedding
+    from app.tasks.embed import _hsv_hist
+    from benchmarks.stubs import identity_embedding
+    from benchmarks.synthetic import surfer_image
+
+    rng = np.random.RandomState(n_users)
+    rows = []
+    for k in range(n_users):
+        uid = start_uid + k
+        if k < n_surfers:
+            face = identity_embedding(k)
+            img = surfer_image(k)
+            h, w = img.shape[:2]
+            color = _hsv_hist(img[h // 2:int(h * 0.8), int(w * 0.4):int(w * 0.6)])
+        else:
+            face = rng.randn(512).astype(np.float32)
+            face /= np.linalg.norm(face)
+            color = rng.rand(144).astype(np.float32)
+            color /= color.sum()
+        rows.append({"user_id": uid, "embedding_type": "face_front", "embedding": json.dumps(face.astype(float).tolist())})
+        rows.append({"user_id": uid, "embedding_type": "outfit_color", "embedding": json.dumps(color.astype(float).tolist())})
+    for i in range(0, len(rows), 5000):
+        session.execute(insert(UserEmbedding), rows[i:i + 5000])
+    session.commit()
+
+
+def _reset_matches(session, keep_cache: bool):
+    from sqlalchemy import update
+    from app.models import SurferFrame
+    values = dict(user_id=0, match_gallery_version=None, match_attempts=0)
+    if not keep_cache:
+        values["embedding_ref"] = None
+    session.execute(update(SurferFrame).values(**values))
+    session.commit()
+
+
+def bench_process_video(args, workdir: str) -> dict:
+    from app.database import SessionLocal
+    from app.models import SurfVideo
+    from app.tasks.process_video import process_video
+    from benchmarks.synthetic import make_surf_video
+
+    videos_dir = os.path.join(workdir, "app", "static", "videos")
+    os.makedirs(videos_dir, exist_ok=True)
+    t0 = time.perf_counter()
+    info = make_surf_video(os.path.join(videos_dir, "bench.mp4"), args.seconds, args.fps, args.width, args.height,
+                           args.surfers, faces_dir=args.faces_dir, seed=args.seed)
+    print(f"[bench] Synthesized {info['frames']} frames in {time.perf_counter() - t0:.1f}s")
+
+    session = SessionLocal()
+    try:
+        _seed_users(session, args.surfers, args.surfers)
+        video = SurfVideo(user_id=1, video_path=os.path.join("videos", "bench.mp4"), status="pending", location="bench")
+        session.add(video)
+        session.commit()
+        video_id = video.id
+    finally:
+        session.close()
+
+    timer = StageTimer()
+    _instrument_process_video(timer)
+    t0 = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        ok = process_video(video_id)
+    wall = time.perf_counter() - t0
+
+    session = SessionLocal()
+    try:
+        from app.models import SurferFrame
+        video = session.get(SurfVideo, video_id)
+        detections = session.query(SurferFrame).filter_by(video_id=video_id).count()
+        matched = session.query(SurferFrame).filter(SurferFrame.video_id == video_id, SurferFrame.user_id > 0).count()
+        result = {
+            "ok": bool(ok), "status": video.status, "video": info, "seconds": round(wall, 4),
+            "processed_frames": video.processed_frames, "skipped_frames": video.skipped_frames,
+            "detections": detections, "matched": matched,
+            "video_fps": round(info["frames"] / wall, 2) if wall else None,
+            "stages": timer.report(wall),
+        }
+    finally:
+        session.close()
+    print(f"[bench] process_video: {wall:.2f}s, {detections} detections, {matched} matched")
+    for name, st in result["stages"].items():
+        print(f"[bench]   {name:8s} {st['seconds']:8.3f}s  ({st['calls']} calls)")
+    return result
+
+
+def bench_match(args, user_counts: list) -> dict:
+    import app.tasks.match as match_mod
+    from app.database import SessionLocal
+    from app.models import UserEmbedding, SurferFrame
+    from app.tasks.frame_cache import bump_gallery_version
+    from app.tasks.retro_match import retro_match
+
+    match_all = getattr(match_mod.match_all_frames, "__wrapped__", None) or match_mod.match_all_frames
+    results = {}
+    for n_users in user_counts:
+        session = SessionLocal()
+        try:
+            session.query(UserEmbedding).delete()
+            session.commit()
+            t0 = time.perf_counter()
+            _seed_users(session, n_users, min(args.surfers, n_users))
+            bump_gallery_version(session)
+            session.commit()
+            seed_s = time.perf_counter() - t0
+            frames = session.query(SurferFrame).count()
+
+            runs = {}
+            for label, keep_cache in (("cold", False), ("warm", True)):
+                _reset_matches(session, keep_cache)
+                t0 = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    assigned = match_all()
+                runs[label] = {"seconds": round(time.perf_counter() - t0, 4), "assigned": int(assigned)}
+
+            _reset_matches(session, keep_cache=True)
+            t0 = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                retro_assigned = retro_match(1)
+            runs["retro_user_1"] = {"seconds": round(time.perf_counter() - t0, 4), "assigned": int(retro_assigned)}
+        finally:
+            session.close()
+        results[str(n_users)] = {"users": n_users, "frames": frames, "seed_seconds": round(seed_s, 3), **runs}
+        print(f"[bench] match @ {n_users} users, {frames} frames: cold {runs['cold']['seconds']:.2f}s, "
+              f"warm {runs['warm']['seconds']:.2f}s, retro {runs['retro_user_1']['seconds']:.2f}s")
+    return results
+
+
+def bench_enroll(args, workdir: str) -> dict:
+    import cv2
+    from app.tasks.embed import generate_face_embedding
+    from benchmarks.synthetic import surfer_image
+
+    photos_dir = os.path.join(workdir, "enroll")
+    os.makedirs(photos_dir, exist_ok=True)
+    samples, ok = [], 0
+    for k in range(args.enroll):
+        path = os.path.join(photos_dir, f"ref_{k}.jpg")
+        cv2.imwrite(path, surfer_image(k % args.surfers, size=args.enroll_size))
+        t0 = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            ok += bool(generate_face_embedding(900000 + k, path, "front"))
+        samples.append(time.perf_counter() - t0)
+    result = {"ok": ok, **_percentiles(samples)}
+    print(f"[bench] enroll: {ok}/{args.enroll} ok, p50 {result['p50_ms']:.1f}ms p95 {result['p95_ms']:.1f}ms")
+    return result
+
+
+def _seconds_leaves(report: dict, prefix: str = ""):
+    """Flatten every timing in a report to {path: seconds}."""
+    out = {}
+    for key, value in report.items():
+        path = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            out.update(_seconds_leaves(value, path))
+        elif key == "seconds" or key.endswith("_ms"):
+            out[path] = float(value) / (1000.0 if key.endswith("_ms") else 1.0)
+    return out
+
+
+def compare(current: dict, baseline: dict, tolerance: float, min_seconds: float = 0.05) -> bool:
+    """Print per-timing ratios against a baseline; True if nothing regressed beyond tolerance."""
+    cur, base = _seconds_leaves(current["results"]), _seconds_leaves(baseline["results"])
+    ok = True
+    for path in sorted(set(cur) & set(base)):
+        b, c = base[path], cur[path]
+        if max(b, c) < min_seconds:
+            continue
+        ratio = c / b if b else float("inf")
+        flag = ""
+        if ratio > 1.0 + tolerance:
+            flag, ok = "  REGRESSION", False
+        print(f"[compare] {path:45s} {b:9.3f}s -> {c:9.3f}s  x{ratio:5.2f}{flag}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workdir", default=None, help="Scratch directory (default: a new temp dir)")
+    parser.add_argument("--seconds", type=float, default=12.0, help="Length of the synthetic clip")
+    parser.add_argument("--fps", type=int, default=25)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--surfers", type=int, default=4, help="Surfers in the clip (also the matchable users)")
+    parser.add_argument("--faces-dir", default=None, help="Face crops to paste on the surfers")
+    parser.add_argument("--users", default="10,1000,50000", help="Gallery sizes for the match benchmark")
+    parser.add_argument("--enroll", type=int, default=20, help="Reference photos to enroll")
+    parser.add_argument("--enroll-size", type=int, default=512, help="Reference photo size in pixels")
+    parser.add_argument("--detector-latency-ms", type=float, default=0.0, help="Emulated detector cost per image")
+    parser.add_argument("--face-latency-ms", type=float, default=0.0, help="Emulated InsightFace cost per call")
+    parser.add_argument("--no-motion-gate", action="store_true", help="Run with MOTION_GATING=0")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", dest="json_path", default=None, help="Write results to this JSON file")
+    parser.add_argument("--compare", default=None, help="Earlier JSON results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown before --compare fails")
+    args = parser.parse_args()
+
+    json_path = os.path.abspath(args.json_path) if args.json_path else None
+    compare_path = os.path.abspath(args.compare) if args.compare else None
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="seesea-bench-"))
+    os.makedirs(workdir, exist_ok=True)
+
+    # Configure the app before anything imports it: private DB/store, serial matching, stubs
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(workdir, "bench.sqlite")
+    os.environ["FRAME_STORE_DIR"] = os.path.join(workdir, "frame_store")
+    os.environ["MATCH_FAN_OUT"] = "0"
+    os.environ["MODEL_PRELOAD"] = "lazy"
+    if args.no_motion_gate:
+        os.environ["MOTION_GATING"] = "0"
+    if os.path.exists(os.path.join(workdir, "bench.sqlite")):
+        os.remove(os.path.join(workdir, "bench.sqlite"))
+    os.chdir(workdir)  # process_video writes frames under ./app/static
+
+    from app.database import Base, engine
+    engine.echo = False
+    Base.metadata.create_all(bind=engine)
+    from benchmarks.stubs import install_stubs
+    detector, face_app = install_stubs(args.detector_latency_ms, args.face_latency_ms)
+    print(f"[bench] Workdir {workdir}")
+
+    results = {
+        "process_video": bench_process_video(args, workdir),
+        "match": bench_match(args, [int(u) for u in args.users.split(",") if u.strip()]),
+        "enroll": bench_enroll(args, workdir),
+    }
+    report = {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "args": {k: v for k, v in vars(args).items() if k not in ("json_path", "compare", "workdir")},
+            "stub_calls": {"detector": detector.calls, "face_app": face_app.calls},
+        },
+        "results": results,
+    }
+    if json_path:
+        with open(json_path, "w") as fh:
+            json.dump(report, fh, indent=2)
+        print(f"[bench] Results written to {json_path}")
+    if compare_path:
+        with open(compare_path) as fh:
+            baseline = json.load(fh)
+        if not compare(report, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
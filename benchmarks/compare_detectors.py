@@ -0,0 +1,158 @@
+# benchmarks/compare_detectors.py
+"""Compare the PyTorch and ONNX detector backends on real footage.
+
+The ultralytics model is treated as the reference. For every sampled frame both backends
+run on the same image; detections above CONFIDENCE_THRESHOLD are matched greedily by IoU.
+Reported: recall/precision of the ONNX boxes against the reference, mean IoU and
+confidence delta of matched pairs, and per-frame latency (mean/p50/p95) for each backend.
+
+Usage:
+    python benchmarks/compare_detectors.py --video app/static/videos/session.mp4 --frames 100
+    python benchmarks/compare_detectors.py --video clip.mp4 --onnx weights/surf_int8.onnx --json out.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.tasks.detect import WEIGHTS_PATH, CONFIDENCE_THRESHOLD  # noqa: E402
+from app.tasks.detector import UltralyticsDetector, OnnxDetector, default_onnx_path  # noqa: E402
+
+
+def _sample_frames(video_path: str, count: int, interval: int):
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise SystemExit(f"Could not open video at {video_path}")
+    frames, idx = [], 0
+    while len(frames) < count:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if idx % interval == 0:
+            frames.append(frame)
+        idx += 1
+    cap.release()
+    return frames
+
+
+def _boxes(result):
+    out = []
+    for box in result.boxes:
+        conf = float(box.conf)
+        if conf < CONFIDENCE_THRESHOLD:
+            continue
+        out.append((np.asarray(box.xyxy[0], dtype=np.float32).reshape(4), conf))
+    return out
+
+
+def _iou(a, b) -> float:
+    ix1, iy1 = max(a[0], b[0]), max(a[1], b[1])
+    ix2, iy2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, ix2 - ix1) * max(0.0, iy2 - iy1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def _match(ref, cand, iou_thres):
+    """Greedy one-to-one matching by IoU. Returns list of (iou, conf_delta)."""
+    pairs, used = [], set()
+    for rb, rc in sorted(ref, key=lambda x: -x[1]):
+        best_j, best_iou = None, iou_thres
+        for j, (cb, _) in enumerate(cand):
+            if j in used:
+                continue
+            v = _iou(rb, cb)
+            if v >= best_iou:
+                best_j, best_iou = j, v
+        if best_j is not None:
+            used.add(best_j)
+            pairs.append((best_iou, cand[best_j][1] - rc))
+    return pairs
+
+
+def _timed(detector, frame):
+    t0 = time.perf_counter()
+    result = detector(frame)[0]
+    return result, (time.perf_counter() - t0) * 1000.0
+
+
+def _latency(ms: list) -> dict:
+    arr = np.asarray(ms) if ms else np.zeros(1)
+    return {"mean_ms": float(arr.mean()), "p50_ms": float(np.percentile(arr, 50)), "p95_ms": float(np.percentile(arr, 95))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--video", required=True, help="Video to sample frames from")
+    parser.add_argument("--frames", type=int, default=100, help="Number of frames to compare")
+    parser.add_argument("--interval", type=int, default=10, help="Sample every Nth frame")
+    parser.add_argument("--weights", default=WEIGHTS_PATH, help="Reference .pt weights")
+    parser.add_argument("--onnx", default=None, help="ONNX model (default: weights path with .onnx suffix)")
+    parser.add_argument("--iou", type=float, default=0.5, help="IoU for counting a box as matched")
+    parser.add_argument("--warmup", type=int, default=3, help="Untimed warmup runs per backend")
+    parser.add_argument("--json", dest="json_path", default=None, help="Write the report to this JSON file")
+    args = parser.parse_args()
+
+    frames = _sample_frames(args.video, args.frames, args.interval)
+    if not frames:
+        raise SystemExit("No frames decoded")
+    print(f"[compare] {len(frames)} frames from {args.video}")
+
+    ref = UltralyticsDetector(args.weights)
+    onnx_path = args.onnx or default_onnx_path(args.weights)
+    cand = OnnxDetector(onnx_path)
+    for _ in range(args.warmup):
+        ref(frames[0])
+        cand(frames[0])
+
+    ref_ms, cand_ms = [], []
+    n_ref = n_cand = 0
+    pairs = []
+    for frame in frames:
+        r, t_ref = _timed(ref, frame)
+        c, t_cand = _timed(cand, frame)
+        ref_ms.append(t_ref)
+        cand_ms.append(t_cand)
+        rb, cb = _boxes(r), _boxes(c)
+        n_ref += len(rb)
+        n_cand += len(cb)
+        pairs.extend(_match(rb, cb, args.iou))
+
+    matched = len(pairs)
+    report = {
+        "video": args.video,
+        "frames": len(frames),
+        "onnx_model": onnx_path,
+        "reference_boxes": n_ref,
+        "onnx_boxes": n_cand,
+        "matched": matched,
+        "recall_vs_reference": matched / n_ref if n_ref else 1.0,
+        "precision_vs_reference": matched / n_cand if n_cand else 1.0,
+        "mean_iou": float(np.mean([p[0] for p in pairs])) if pairs else 0.0,
+        "mean_abs_conf_delta": float(np.mean([abs(p[1]) for p in pairs])) if pairs else 0.0,
+        "latency": {"ultralytics": _latency(ref_ms), "onnx": _latency(cand_ms)},
+    }
+    speedup = report["latency"]["ultralytics"]["mean_ms"] / max(report["latency"]["onnx"]["mean_ms"], 1e-9)
+    report["speedup"] = speedup
+
+    print(f"[compare] boxes: reference={n_ref} onnx={n_cand} matched={matched}")
+    print(f"[compare] recall={report['recall_vs_reference']:.3f} precision={report['precision_vs_reference']:.3f} "
+          f"mean_iou={report['mean_iou']:.3f} |dconf|={report['mean_abs_conf_delta']:.4f}")
+    for name, lat in report["latency"].items():
+        print(f"[compare] {name:12s} mean={lat['mean_ms']:.1f}ms p50={lat['p50_ms']:.1f}ms p95={lat['p95_ms']:.1f}ms")
+    print(f"[compare] speedup x{speedup:.2f}")
+
+    if args.json_path:
+        with open(args.json_path, "w") as fh:
+            json.dump(report, fh, indent=2)
+        print(f"[compare] Report written to {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+# benchmarks/import_time.py
+"""Startup import cost of the web tier, from `python -X importtime`.
+
+Each target is imported in a fresh interpreter, --repeat times; the median total import
+time is reported with the most expensive modules. The web targets (the Flask app, which
+every `flask ...` CLI command also builds) must not import the ML / worker stack: OpenCV,
+numpy, torch, ultralytics, InsightFace, ONNX Runtime or Celery. Those load lazily in the
+routes and tasks that use them. An import of one of them fails the run and prints the
+chain of modules that pulled it in.
+
+Results are written as JSON; --compare checks them against an earlier run (see
+bench_pipeline.compare).
+
+Usage:
+    python benchmarks/import_time.py --json imports.json
+    python benchmarks/import_time.py --json new.json --compare imports.json --tolerance 0.3
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+from datetime import datetime
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+WEB_FORBIDDEN = ("cv2", "numpy", "torch", "ultralytics", "insightface", "onnxruntime", "celery")
+
+# name: (code run in a fresh interpreter, modules it must not import)
+TARGETS = {
+    "web": ("from app import create_app; create_app()", WEB_FORBIDDEN),
+    "upload_routes": ("import app.upload.routes", WEB_FORBIDDEN),
+    "celery_app": ("import celery_worker", ("cv2", "numpy", "torch", "ultralytics", "insightface", "onnxruntime")),
+}
+
+
+def importtime(code: str):
+    """Run code under -X importtime. Returns [(module, depth, self_us, cumulative_us)] in output order."""
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT, env=env,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"{code!r} failed:\n{proc.stderr[-2000:]}")
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        stripped = name.lstrip(" ")
+        rows.append((stripped.strip(), (len(name) - len(stripped) - 1) // 2, int(self_us), int(cumulative_us)))
+    return rows
+
+
+def import_chain(rows, index):
+    """Modules that (transitively) imported rows[index], outermost first.
+    -X importtime prints a module after its imports, one indent level deeper than its parent."""
+    chain, depth = [rows[index][0]], rows[index][1]
+    for name, d, _, _ in rows[index + 1:]:
+        if d < depth:
+            chain.append(name)
+            depth = d
+            if d == 0:
+                break
+    return list(reversed(chain))
+
+
+def measure(code: str, forbidden=(), repeat: int = 5, top: int = 10) -> dict:
+    totals, rows = [], []
+    for _ in range(repeat):
+        rows = importtime(code)
+        totals.append(sum(cum for _, depth, _, cum in rows if depth == 0))
+    violations = {}
+    for i, (name, _, _, _) in enumerate(rows):
+        if name in forbidden and name not in violations:
+            violations[name] = " -> ".join(import_chain(rows, i))
+    return {
+        "import_ms": statistics.median(totals) / 1000.0,
+        "modules": len(rows),
+        "top": [{"module": n, "cumulative_ms": c / 1000.0}
+                for n, depth, _, c in sorted(rows, key=lambda r: -r[3]) if depth <= 1][:top],
+        "forbidden_imports": violations,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--targets", default=",".join(TARGETS), help="Comma list of targets to measure")
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters per target (median is reported)")
+    parser.add_argument("--json", dest="json_path", default=None, help="Write results to this JSON file")
+    parser.add_argument("--compare", default=None, help="Earlier JSON results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="Allowed slowdown before --compare fails")
+    args = parser.parse_args()
+
+    results, ok = {}, True
+    for name in [t.strip() for t in args.targets.split(",") if t.strip()]:
+        code, forbidden = TARGETS[name]
+        result = measure(code, forbidden, args.repeat)
+        results[name] = result
+        print(f"[imports] {name}: {result['import_ms']:.1f}ms, {result['modules']} modules")
+        for row in result["top"]:
+            print(f"[imports]   {row['module']:40s} {row['cumulative_ms']:8.1f}ms")
+        for module, chain in result["forbidden_imports"].items():
+            ok = False
+            print(f"[imports]   FORBIDDEN {module}: {chain}")
+
+    report = {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("json_path", "compare")},
+        },
+        "results": {name: {"import_ms": r["import_ms"]} for name, r in results.items()},
+    }
+    if args.json_path:
+        with open(args.json_path, "w") as fh:
+            json.dump(report, fh, indent=2)
+        print(f"[imports] Results written to {args.json_path}")
+    if args.compare:
+        from benchmarks.bench_pipeline import compare
+        with open(args.compare) as fh:
+            baseline = json.load(fh)
+        ok = compare(report, baseline, args.tolerance, min_seconds=0.01) and ok
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
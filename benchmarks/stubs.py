@@ -0,0 +1,103 @@
+# benchmarks/stubs.py
+"""Offline stand-ins for the YOLO detector and the InsightFace app.
+
+They follow the interfaces the pipeline uses (detector(frame, imgsz=...) -> [result with
+.boxes/.names]; face_app.get(img) -> [face with .bbox/.det_score/.normed_embedding]) and
+understand the synthetic footage from benchmarks/synthetic.py: blobs are found by their
+distance from the water color, and a crop's identity is the palette color it contains.
+An optional fixed latency per call emulates real model cost.
+"""
+import time
+
+import cv2
+import numpy as np
+
+from app.tasks.detector import DetectionBox, DetectionResult
+from benchmarks.synthetic import PALETTE
+
+EMBED_DIM = 512
+
+
+def identity_embedding(index: int) -> np.ndarray:
+    """The face vector of synthetic surfer `index` (palette position)."""
+    v = np.random.RandomState(7000 + index).randn(EMBED_DIM).astype(np.float32)
+    return v / np.linalg.norm(v)
+
+
+class StubDetector:
+    backend = "stub"
+    names = {0: "surfer"}
+
+    def __init__(self, latency_ms: float = 0.0, min_area: int = 40):
+        self.latency_ms = latency_ms
+        self.min_area = min_area
+        self.calls = 0
+
+    def _detect(self, img: np.ndarray) -> DetectionResult:
+        sample = img.reshape(-1, 3)[::97].astype(np.float32)
+        water = np.median(sample, axis=0)
+        dist = np.abs(img.astype(np.int16) - water.astype(np.int16)).sum(axis=2)
+        mask = (dist > 150).astype(np.uint8)
+        mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, np.ones((3, 3), np.uint8))
+        n, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+        boxes = []
+        for i in range(1, n):
+            x, y, w, h, area = stats[i]
+            if area < self.min_area:
+                continue
+            pad = max(2, int(0.15 * max(w, h)))
+            boxes.append(DetectionBox([x - pad, y - pad, x + w + pad, y + h + pad], 0.9, 0))
+        return DetectionResult(boxes, self.names)
+
+    def __call__(self, source, **kwargs):
+        frames = source if isinstance(source, (list, tuple)) else [source]
+        self.calls += len(frames)
+        if self.latency_ms:
+            time.sleep(self.latency_ms * len(frames) / 1000.0)
+        return [self._detect(f) for f in frames]
+
+
+class _Face:
+    def __init__(self, bbox, embedding):
+        self.bbox = np.asarray(bbox, dtype=np.float32)
+        self.det_score = np.float32(0.9)
+        self.embedding = embedding
+        self.normed_embedding = embedding
+
+
+class StubFaceApp:
+    def __init__(self, latency_ms: float = 0.0, noise: float = 0.02):
+        self.latency_ms = latency_ms
+        self.noise = noise
+        self.calls = 0
+        self._palette = np.asarray(PALETTE, dtype=np.int16)
+
+    def get(self, img: np.ndarray):
+        self.calls += 1
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+        if img is None or img.size == 0:
+            return []
+        small = img[::2, ::2].astype(np.int16)
+        dist = np.abs(small[:, :, None, :] - self._palette[None, None, :, :]).sum(axis=3)  # (h, w, P)
+        hits = dist < 60
+        counts = hits.reshape(-1, len(PALETTE)).sum(axis=0)
+        index = int(np.argmax(counts))
+        if counts[index] < 12:
+            return []
+        ys, xs = np.nonzero(hits[:, :, index])
+        x1, x2, y1, y2 = 2 * xs.min(), 2 * xs.max(), 2 * ys.min(), 2 * ys.max()
+        # The "face" is the top quarter of the blob, so the torso ROI falls on the body
+        face_bbox = [x1, y1, x2, y1 + max(4, (y2 - y1) // 4)]
+        rng = np.random.RandomState(int(img.shape[0] * 31 + img.shape[1]))
+        emb = identity_embedding(index) + self.noise * rng.randn(EMBED_DIM).astype(np.float32)
+        return [_Face(face_bbox, emb / np.linalg.norm(emb))]
+
+
+def install_stubs(detector_latency_ms: float = 0.0, face_latency_ms: float = 0.0):
+    """Put the stubs into the model registry so get_detector()/get_face_app() return them."""
+    from app.tasks import registry
+    detector, face_app = StubDetector(detector_latency_ms), StubFaceApp(face_latency_ms)
+    registry._models["detector"] = detector
+    registry._models["face_app"] = face_app
+    return detector, face_app
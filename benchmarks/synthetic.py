@@ -0,0 +1,119 @@
+# benchmarks/synthetic.py
+"""Synthetic surf footage for offline benchmarks.
+
+A water-textured background (blue-green noise with drifting swell bands) with "surfers":
+saturated blobs in a fixed palette that ride across the frame. When --faces-dir points
+at a folder of face crops, they are pasted on top of the blobs instead, so a real
+InsightFace pack has something to find. Palette index i is surfer i, which lets the
+stub models in benchmarks/stubs.py map a crop back to an identity.
+
+Usage:
+    python benchmarks/synthetic.py --output /tmp/surf.mp4 --seconds 20 --surfers 4
+"""
+import argparse
+import os
+
+import cv2
+import numpy as np
+
+# Distinct BGR colors, far from the water tones
+PALETTE = [
+    (0, 0, 230), (0, 200, 255), (0, 230, 0), (230, 0, 230), (255, 255, 255),
+    (0, 120, 255), (180, 0, 90), (40, 40, 40), (255, 128, 255), (0, 255, 180),
+]
+WATER_BGR = (140, 105, 35)
+
+
+def water_background(width: int, height: int, t: float, rng: np.random.RandomState) -> np.ndarray:
+    """Blue-green water with moving swell bands and per-frame sparkle noise."""
+    ys = np.arange(height, dtype=np.float32)[:, None]
+    xs = np.arange(width, dtype=np.float32)[None, :]
+    swell = 18.0 * np.sin(ys / 23.0 + 0.15 * xs / 31.0 - 2.2 * t) + 8.0 * np.sin(xs / 47.0 + 1.3 * t)
+    base = np.empty((height, width, 3), dtype=np.float32)
+    for c, v in enumerate(WATER_BGR):
+        base[:, :, c] = v + swell
+    base += rng.normal(0.0, 6.0, size=(height, width, 1)).astype(np.float32)
+    return np.clip(base, 0, 255).astype(np.uint8)
+
+
+def surfer_image(index: int, size: int = 256, face: np.ndarray = None) -> np.ndarray:
+    """A single surfer on plain water, used as a reference photo for enrollment."""
+    rng = np.random.RandomState(1000 + index)
+    img = water_background(size, size, 0.0, rng)
+    _draw_surfer(img, index, size // 2, size // 2, size // 3, face)
+    return img
+
+
+def _draw_surfer(img: np.ndarray, index: int, cx: int, cy: int, height: int, face: np.ndarray = None):
+    color = PALETTE[index % len(PALETTE)]
+    half_w = max(4, height // 4)
+    cv2.ellipse(img, (cx, cy), (half_w, height // 2), 0, 0, 360, color, -1)
+    head_r = max(3, height // 6)
+    cv2.circle(img, (cx, cy - height // 2 - head_r // 2), head_r, color, -1)
+    if face is not None:
+        fh = fw = 2 * head_r
+        x1, y1 = cx - head_r, cy - height // 2 - head_r // 2 - head_r
+        h, w = img.shape[:2]
+        if 0 <= x1 and 0 <= y1 and x1 + fw <= w and y1 + fh <= h:
+            img[y1:y1 + fh, x1:x1 + fw] = cv2.resize(face, (fw, fh))
+
+
+def _load_faces(faces_dir: str) -> list:
+    if not faces_dir:
+        return []
+    faces = []
+    for name in sorted(os.listdir(faces_dir)):
+        im = cv2.imread(os.path.join(faces_dir, name))
+        if im is not None:
+            faces.append(im)
+    return faces
+
+
+def make_surf_video(output: str, seconds: float = 10.0, fps: int = 25, width: int = 1280, height: int = 720,
+                    surfers: int = 4, still_fraction: float = 0.3, faces_dir: str = None, seed: int = 0) -> dict:
+    """
+    Write a synthetic clip. The first still_fraction of the clip has no surfers (empty
+    water), which exercises the motion gate. Returns a small description of the clip.
+    """
+    rng = np.random.RandomState(seed)
+    faces = _load_faces(faces_dir)
+    n_frames = int(seconds * fps)
+    still_until = int(n_frames * still_fraction)
+    writer = cv2.VideoWriter(output, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    if not writer.isOpened():
+        raise RuntimeError(f"Could not open video writer for {output}")
+    lanes = [(int(height * (0.25 + 0.6 * (i + 0.5) / max(surfers, 1))), rng.uniform(0.6, 1.4)) for i in range(surfers)]
+    for i in range(n_frames):
+        t = i / float(fps)
+        frame = water_background(width, height, t, rng)
+        if i >= still_until:
+            ride = (i - still_until) / float(fps)
+            for s, (lane_y, speed) in enumerate(lanes):
+                cx = int((0.1 + 0.12 * s + 0.08 * speed * ride) % 1.0 * width)
+                cy = lane_y + int(12 * np.sin(ride * 2.0 + s))
+                _draw_surfer(frame, s, cx, cy, height // 8, faces[s % len(faces)] if faces else None)
+        writer.write(frame)
+    writer.release()
+    return {"path": output, "frames": n_frames, "fps": fps, "width": width, "height": height,
+            "surfers": surfers, "still_frames": still_until}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", required=True, help="Output .mp4 path")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--fps", type=int, default=25)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--surfers", type=int, default=4)
+    parser.add_argument("--still-fraction", type=float, default=0.3, help="Leading share of the clip with empty water")
+    parser.add_argument("--faces-dir", default=None, help="Folder of face crops to paste on the surfers")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    info = make_surf_video(args.output, args.seconds, args.fps, args.width, args.height, args.surfers,
+                           args.still_fraction, args.faces_dir, args.seed)
+    print(f"[synthetic] Wrote {info['frames']} frames ({info['width']}x{info['height']}) to {info['path']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,7 @@
 # celery_worker.py – Celery app entrypoint (only required task modules included)
 from celery import Celery
+from celery.signals import worker_process_init, worker_process_shutdown, task_prerun, task_postrun
+import time
 import os
 from dotenv import load_dotenv
 
@@ -19,7 +21,10 @@ celery = Celery(
         'app.tasks.detect',
         'app.tasks.embed',
         'app.tasks.match',
-        'app.tasks.process_video'
+        'app.tasks.process_video',
+        'app.tasks.registry',
+        'app.tasks.retro_match',
+        'app.tasks.uploads'
     ]
 )
 
@@ -29,8 +34,108 @@ celery.conf.update(
     enable_utc=True,
 )
 
+# ---------- Queue topology ----------
+# Each queue gets its own worker pool (see docker-compose.yml), so a long process_video
+# cannot hold up enrollment embeddings or matching. Per-queue knobs, read from env with
+# the queue's upper-case key (e.g. CELERY_VIDEO_TIME_LIMIT, CELERY_ENROLL_ACKS_LATE):
+#   CELERY_<Q>_QUEUE            queue name (default: the key in lower case)
+#   CELERY_<Q>_ACKS_LATE        1/0, ack after the task finishes so a killed worker's task is redelivered
+#   CELERY_<Q>_TIME_LIMIT       hard time limit in seconds
+#   CELERY_<Q>_SOFT_TIME_LIMIT  soft time limit in seconds
+# Concurrency and prefetch are worker options; docker-compose passes
+# CELERY_<Q>_CONCURRENCY / CELERY_<Q>_PREFETCH to each pool's command line.
+QUEUE_DEFAULTS = {
+    # key: (tasks, acks_late, time_limit, soft_time_limit)
+    "video": (["process_video", "detect_and_capture"], True, 6 * 3600, 6 * 3600 - 60),
+    "match": (["match_all_frames", "match_frame_chunk", "apply_match_assignments", "retro_match_user"], True, 3600, 3540),
+    "enroll": (["generate_face_embedding"], True, 300, 270),
+    "maintenance": (["requeue_stale_videos", "expire_stale_uploads", "complete_upload"], False, 1800, 1740),
+}
+
+
+def _queue_setting(key: str, name: str, default):
+    raw = os.environ.get(f"CELERY_{key.upper()}_{name}")
+    if raw is None or raw == "":
+        return default
+    if isinstance(default, bool):
+        return raw not in ("0", "false", "False")
+    return type(default)(raw)
+
+
+QUEUE_NAMES = {key: _queue_setting(key, "QUEUE", key) for key in QUEUE_DEFAULTS}
+task_routes, task_annotations = {}, {}
+for key, (tasks, acks_late, time_limit, soft_time_limit) in QUEUE_DEFAULTS.items():
+    annotations = {
+        "acks_late": _queue_setting(key, "ACKS_LATE", acks_late),
+        "time_limit": _queue_setting(key, "TIME_LIMIT", time_limit),
+        "soft_time_limit": _queue_setting(key, "SOFT_TIME_LIMIT", soft_time_limit),
+    }
+    for task_name in tasks:
+        task_routes[task_name] = {"queue": QUEUE_NAMES[key]}
+        task_annotations[task_name] = annotations
+
+celery.conf.update(
+    task_routes=task_routes,
+    task_annotations=task_annotations,
+    # Unrouted tasks (e.g. model_registry_status) land on the maintenance queue
+    task_default_queue=QUEUE_NAMES["maintenance"],
+    # With acks_late a task lost with its worker is redelivered instead of dropped
+    task_reject_on_worker_lost=True,
+    worker_prefetch_multiplier=int(os.environ.get("CELERY_PREFETCH_MULTIPLIER", "1")),
+    # Redis redelivers unacked tasks after the visibility timeout; keep it above the longest time limit
+    broker_transport_options={
+        "visibility_timeout": max(a["time_limit"] for a in task_annotations.values()) + 600,
+    },
+)
+
+# Periodic sweeps (run `celery -A celery_worker beat`): resume videos whose worker died,
+# retry stuck upload completions and delete resumable uploads abandoned by their client
+celery.conf.beat_schedule = {
+    'requeue-stale-videos': {
+        'task': 'requeue_stale_videos',
+        'schedule': float(os.environ.get("STALE_VIDEO_SWEEP_SECONDS", "300")),
+    },
+    'expire-stale-uploads': {
+        'task': 'expire_stale_uploads',
+        'schedule': float(os.environ.get("UPLOAD_EXPIRE_SWEEP_SECONDS", "60")),
+    },
+}
+
 # Tasks are discovered via 'include' list above; no direct imports here to avoid circular imports.
 
+# Load YOLO/InsightFace once per worker child process (see app/tasks/registry.py).
+# Note: worker_process_init only fires for pool processes (prefork), not for --pool=solo.
+@worker_process_init.connect
+def _prewarm_models(**kwargs):
+    from app.tasks.registry import prewarm_on_worker_start
+    prewarm_on_worker_start()
+
+# Per-task run time into seesea_task_seconds; the registry is dumped for scraping after each
+# task (throttled by METRICS_DUMP_INTERVAL, see app/metrics.py).
+_task_started = {}
+
+
+@task_prerun.connect
+def _task_timer_start(task_id=None, **kwargs):
+    _task_started[task_id] = time.perf_counter()
+
+
+@task_postrun.connect
+def _task_timer_stop(task_id=None, task=None, state=None, **kwargs):
+    from app.metrics import TASK_SECONDS, dump_metrics
+    t0 = _task_started.pop(task_id, None)
+    if t0 is not None:
+        TASK_SECONDS.observe(time.perf_counter() - t0, task=getattr(task, "name", "unknown"), state=state or "UNKNOWN")
+    dump_metrics()
+
+
+# A pool process that exits takes its series with it: its textfile and pushgateway group
+# would otherwise be scraped forever as if it were still alive.
+@worker_process_shutdown.connect
+def _remove_metrics_on_exit(**kwargs):
+    from app.metrics import remove_metrics
+    remove_metrics()
+
 # Helper to enqueue process_video without exposing extra Celery tasks
 
 def enqueue_process_video(video_id: int):
@@ -44,4 +149,26 @@ def enqueue_process_video(video_id: int):
         return res
     except Exception as e:
         print(f"[enqueue] Failed to enqueue process_video(video_id={video_id}): {e}")
-        raise
\ No newline at end of file
+        raise
+
+
+def enqueue_retro_match(user_id: int):
+    """Enqueue 'retro_match_user' so a newly enrolled user is matched against old frames."""
+    try:
+        res = celery.send_task('retro_match_user', args=[user_id])
+        print(f"[enqueue] Sent retro_match_user(user_id={user_id}) task_id={getattr(res, 'id', None)}")
+        return res
+    except Exception as e:
+        print(f"[enqueue] Failed to enqueue retro_match_user(user_id={user_id}): {e}")
+        raise
+
+
+def enqueue_complete_upload(upload_id: str):
+    """Enqueue 'complete_upload' for a resumable upload whose last byte has arrived."""
+    try:
+        res = celery.send_task('complete_upload', args=[upload_id])
+        print(f"[enqueue] Sent complete_upload(upload_id={upload_id}) task_id={getattr(res, 'id', None)}")
+        return res
+    except Exception as e:
+        print(f"[enqueue] Failed to enqueue complete_upload(upload_id={upload_id}): {e}")
+        raise
@@ -2,7 +2,7 @@
 
 from app.database import Base, engine
 from app import create_app
-from app.models import User, UserEmbedding, SurferFrame, UserProfile, SurfVideo
+from app.models import User, UserEmbedding, SurferFrame, UserProfile, SurfVideo, FrameEmbedding, GalleryState, VideoUpload
 from dotenv import load_dotenv
 from sqlalchemy import inspect, text
 import os
@@ -68,4 +68,66 @@ with app.app_context():
     except Exception as e:
         print(f"Warning: Could not verify/apply migrations for surfer_frames: {e}")
 
+    def _ensure_columns(table, columns):
+        """Add simple nullable/defaulted columns that are missing from an existing table."""
+        insp = inspect(engine)
+        existing = [c['name'] for c in insp.get_columns(table)]
+        for name, ddl_type in columns:
+            if name in existing:
+                print(f"Column {table}.{name} already present; no migration needed.")
+                continue
+            print(f"Adding column {table}.{name} ({ddl_type})...")
+            with engine.begin() as conn:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl_type}"))
+            print(f"Column {table}.{name} added successfully.")
+
+    # Lightweight migrations for surf_videos
+    try:
+        _ensure_columns('surf_videos', [
+            ('skipped_frames', 'INTEGER DEFAULT 0'),
+            ('checkpoint_frame', 'INTEGER'),
+            ('lease_owner', 'VARCHAR'),
+            ('lease_expires_at', 'TIMESTAMP'),
+        ])
+    except Exception as e:
+        print(f"Warning: Could not verify/apply migrations for surf_videos: {e}")
+
+    # Background completion of resumable uploads
+    try:
+        _ensure_columns('video_uploads', [
+            ('complete_attempts', 'INTEGER DEFAULT 0'),
+            ('error', 'VARCHAR'),
+        ])
+    except Exception as e:
+        print(f"Warning: Could not verify/apply migrations for video_uploads: {e}")
+
+    # Checkpoint/resume keys and match bookkeeping on surfer_frames
+    try:
+        _ensure_columns('surfer_frames', [
+            ('frame_idx', 'INTEGER'),
+            ('detection_idx', 'INTEGER'),
+            ('match_attempts', 'INTEGER DEFAULT 0'),
+            ('last_match_at', 'TIMESTAMP'),
+            ('match_gallery_version', 'INTEGER'),
+            ('embedding_ref', 'VARCHAR'),
+            ('file_status', "VARCHAR(16) NOT NULL DEFAULT 'ok'"),
+            ('derivatives', 'TEXT'),
+        ])
+        with engine.begin() as conn:
+            conn.execute(text(
+                "CREATE UNIQUE INDEX IF NOT EXISTS uq_surfer_frame_video_frame_det "
+                "ON surfer_frames (video_id, frame_idx, detection_idx)"
+            ))
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_surfer_frames_user_status_created "
+                "ON surfer_frames (user_id, file_status, created_at, id)"
+            ))
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_surfer_frames_user_status_score "
+                "ON surfer_frames (user_id, file_status, score, id)"
+            ))
+        print("Unique index and gallery listing indexes on surfer_frames ensured.")
+    except Exception as e:
+        print(f"Warning: Could not verify/apply checkpoint/match migrations for surfer_frames: {e}")
+
     print(f"Database ready ({db_type}).")
\ No newline at end of file
@@ -0,0 +1,13 @@
+#!/bin/sh
+# docker/worker-entrypoint.sh – shared setup for the Celery worker and migrate containers.
+# Installs system/Python deps, then execs the given command (the migrate service runs create_db.py).
+set -e
+
+apt-get update
+apt-get install -y --no-install-recommends ffmpeg libgl1 libglib2.0-0 build-essential python3-dev cmake libopenblas-dev
+rm -rf /var/lib/apt/lists/*
+pip install --upgrade pip setuptools wheel
+pip install --no-cache-dir cython
+pip install --no-cache-dir -r requirements.txt
+
+exec "$@"
@@ -0,0 +1,107 @@
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import types
+import unittest
+from unittest import mock
+
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+class FakeSession:
+    """onnxruntime.InferenceSession stand-in: a static 1x3x64x64 export without "names"
+    metadata that finds one class-0 box in the middle of every input."""
+
+    def __init__(self, path, providers=None):
+        pass
+
+    def get_inputs(self):
+        return [types.SimpleNamespace(name="images", shape=[1, 3, 64, 64])]
+
+    def get_modelmeta(self):
+        return types.SimpleNamespace(custom_metadata_map={})
+
+    def run(self, outputs, feed):
+        n = feed["images"].shape[0]
+        pred = np.zeros((n, 5, 1), np.float32)
+        pred[:, :, 0] = (32, 32, 20, 20, 0.9)  # cx, cy, w, h, class 0 score
+        return [pred]
+
+
+class TestOnnxWithoutNames(unittest.TestCase):
+    """An ONNX export without class names must still label its detections."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.model_path = os.path.join(self.tmp.name, "m.onnx")
+        open(self.model_path, "wb").close()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def make_detector(self):
+        from app.tasks.detector import OnnxDetector
+        with mock.patch.dict(sys.modules, {"onnxruntime": types.SimpleNamespace(InferenceSession=FakeSession)}):
+            return OnnxDetector(self.model_path)
+
+    def test_labels_fall_back_to_class_id(self):
+        from app.tasks.detector import detect_frame, resolve_detect_config
+        detector = self.make_detector()
+        self.assertEqual(detector.names, {})
+        frame = np.zeros((90, 160, 3), np.uint8)
+        for tiled in (False, True):
+            cfg = dict(resolve_detect_config(), imgsz=64, tiled=tiled, tile_size=64)
+            results = detect_frame(detector, frame, cfg)
+            self.assertTrue(results.boxes, tiled)
+            self.assertEqual(results.names[int(results.boxes[0].cls[0])], "0")
+
+    def test_process_video_keeps_detections(self):
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import sessionmaker
+        from app.database import Base
+        from app.models import User, SurfVideo, SurferFrame
+        from app.tasks import registry
+        import app.tasks.process_video as pv
+        import app.tasks.progress as progress
+        sys.path.insert(0, ROOT)
+        from benchmarks.synthetic import make_surf_video
+
+        engine = create_engine("sqlite:///" + os.path.join(self.tmp.name, "t.sqlite"))
+        Base.metadata.create_all(bind=engine)
+        Session = sessionmaker(bind=engine)
+        session = Session()
+        session.add(User(id=1, username="owner", password="x"))
+        video = SurfVideo(user_id=1, video_path="videos/v.mp4", status="pending", location="test")
+        session.add(video)
+        session.commit()
+        video_id = video.id
+        session.close()
+
+        cwd = os.getcwd()
+        os.chdir(self.tmp.name)  # process_video writes under ./app/static
+        try:
+            os.makedirs(os.path.join("app", "static", "videos"))
+            make_surf_video(os.path.join("app", "static", "videos", "v.mp4"), seconds=1, fps=20, width=160,
+                            height=90, surfers=1, still_fraction=0.0)
+            with mock.patch.dict(registry._models, {"detector": self.make_detector()}), \
+                    mock.patch.object(pv, "SessionLocal", Session), \
+                    mock.patch.object(progress, "_down_until", 1e18), \
+                    mock.patch("app.tasks.motion.MOTION_GATING", False), \
+                    mock.patch("app.tasks.match.match_all_frames", return_value=0), \
+                    contextlib.redirect_stdout(io.StringIO()):
+                self.assertTrue(pv.process_video(video_id))
+        finally:
+            os.chdir(cwd)
+        session = Session()
+        self.assertEqual(session.get(SurfVideo, video_id).status, "completed")
+        self.assertGreater(session.query(SurferFrame).filter_by(video_id=video_id).count(), 0)
+        session.close()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,186 @@
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+class LeaseTestCase(unittest.TestCase):
+    def setUp(self):
+        from app.database import Base
+        from app.models import User
+        self.tmp = tempfile.TemporaryDirectory()
+        self.engine = create_engine("sqlite:///" + os.path.join(self.tmp.name, "t.sqlite"))
+        Base.metadata.create_all(bind=self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        session = self.Session()
+        session.add(User(id=1, username="owner", password="x"))
+        session.commit()
+        session.close()
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.tmp.cleanup()
+
+    def add_video(self, status, owner=None, expires_in=None, **fields):
+        from app.models import SurfVideo
+        session = self.Session()
+        expires = datetime.utcnow() + timedelta(seconds=expires_in) if expires_in is not None else None
+        video = SurfVideo(user_id=1, video_path="videos/v.mp4", status=status, lease_owner=owner,
+                          lease_expires_at=expires, **fields)
+        session.add(video)
+        session.commit()
+        video_id = video.id
+        session.close()
+        return video_id
+
+    def get(self, video_id):
+        from app.models import SurfVideo
+        session = self.Session()
+        video = session.get(SurfVideo, video_id)
+        session.expunge(video)
+        session.close()
+        return video
+
+
+class TestVideoLease(LeaseTestCase):
+    """acquire_video_lease only takes videos that nobody is (or should be) working on."""
+
+    def acquire(self, video_id, owner="me:1"):
+        from app.tasks.leases import acquire_video_lease
+        session = self.Session()
+        try:
+            return acquire_video_lease(session, video_id, owner)
+        finally:
+            session.close()
+
+    def test_takes_pending_and_failed(self):
+        for status in ("pending", "failed"):
+            video_id = self.add_video(status)
+            self.assertTrue(self.acquire(video_id), status)
+            video = self.get(video_id)
+            self.assertEqual((video.status, video.lease_owner), ("processing", "me:1"))
+            self.assertGreater(video.lease_expires_at, datetime.utcnow())
+
+    def test_never_takes_completed(self):
+        for status in ("completed", "completed_with_errors"):
+            video_id = self.add_video(status)
+            self.assertFalse(self.acquire(video_id), status)
+            self.assertEqual(self.get(video_id).status, status)
+
+    def test_live_lease_of_another_worker(self):
+        video_id = self.add_video("processing", owner="other:2", expires_in=60)
+        self.assertFalse(self.acquire(video_id))
+        self.assertEqual(self.get(video_id).lease_owner, "other:2")
+
+    def test_expired_handed_over_or_own_lease(self):
+        for owner, expires_in in (("other:2", -1), ("other:2", None), (None, 60), ("me:1", 60)):
+            video_id = self.add_video("processing", owner=owner, expires_in=expires_in)
+            self.assertTrue(self.acquire(video_id), (owner, expires_in))
+            self.assertEqual(self.get(video_id).lease_owner, "me:1")
+
+    def test_stale_and_release(self):
+        from app.tasks.leases import is_lease_stale, release_video_lease, hand_over_for_requeue
+        self.assertTrue(is_lease_stale(self.get(self.add_video("processing", owner="other:2", expires_in=-1))))
+        self.assertTrue(is_lease_stale(self.get(self.add_video("processing", owner="other:2"))))
+        self.assertFalse(is_lease_stale(self.get(self.add_video("processing", owner="other:2", expires_in=60))))
+        self.assertFalse(is_lease_stale(self.get(self.add_video("failed", expires_in=-1))))
+        video = self.get(self.add_video("processing", owner="other:2", expires_in=-1))
+        hand_over_for_requeue(video)
+        self.assertIsNone(video.lease_owner)
+        self.assertFalse(is_lease_stale(video))
+        release_video_lease(video)
+        self.assertEqual((video.lease_owner, video.lease_expires_at), (None, None))
+
+    def test_requeue_pushes_lease_forward(self):
+        import app.tasks.process_video as pv
+        stale_id = self.add_video("processing", owner="dead:9", expires_in=-1, checkpoint_frame=10)
+        live_id = self.add_video("processing", owner="other:2", expires_in=60)
+        with mock.patch.object(pv, "SessionLocal", self.Session), \
+                mock.patch.object(pv.process_video, "delay") as delay, \
+                contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(pv.requeue_stale_videos(), 1)
+            self.assertEqual(pv.requeue_stale_videos(), 0)
+        delay.assert_called_once_with(stale_id)
+        video = self.get(stale_id)
+        self.assertIsNone(video.lease_owner)
+        self.assertGreater(video.lease_expires_at, datetime.utcnow())
+        self.assertEqual(self.get(live_id).lease_owner, "other:2")
+
+
+class TestResumedRun(LeaseTestCase):
+    """A run resumed from a checkpoint samples the same frames as an uninterrupted one."""
+
+    def setUp(self):
+        super().setUp()
+        sys.path.insert(0, ROOT)
+        from benchmarks.stubs import install_stubs
+        from benchmarks.synthetic import make_surf_video
+        self.cwd = os.getcwd()
+        os.chdir(self.tmp.name)  # process_video writes under ./app/static
+        os.makedirs(os.path.join("app", "static", "videos"))
+        make_surf_video(os.path.join("app", "static", "videos", "v.mp4"), seconds=3, fps=20, width=320,
+                        height=180, surfers=2, still_fraction=0.0)
+        self.detector, _ = install_stubs()
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        super().tearDown()
+
+    def run_video(self, video_id):
+        import app.tasks.process_video as pv
+        import app.tasks.progress as progress
+        with mock.patch.object(pv, "SessionLocal", self.Session), \
+                mock.patch.object(progress, "_down_until", 1e18), \
+                mock.patch("app.tasks.motion.MOTION_GATING", False), \
+                mock.patch("app.tasks.match.match_all_frames", return_value=0), \
+                contextlib.redirect_stdout(io.StringIO()):
+            return pv.process_video(video_id)
+
+    def frame_indices(self, video_id):
+        from app.models import SurferFrame
+        session = self.Session()
+        try:
+            return [idx for idx, in session.query(SurferFrame.frame_idx).filter_by(video_id=video_id)
+                    .distinct().order_by(SurferFrame.frame_idx)]
+        finally:
+            session.close()
+
+    def test_resume_stays_on_grid(self):
+        from app.models import SurfVideo, SurferFrame
+        from app.tasks.motion import FRAME_INTERVAL
+        video_id = self.add_video("pending", location="test")
+        self.assertTrue(self.run_video(video_id))
+        full = self.frame_indices(video_id)
+        full_calls = self.detector.calls
+        self.assertGreater(len(full), 2)
+        self.assertTrue(all(idx % FRAME_INTERVAL == 0 for idx in full), full)
+        self.assertFalse(self.run_video(video_id), "a completed video must not be processed again")
+        self.assertEqual(self.detector.calls, full_calls)
+
+        # Simulate a worker that died after committing the checkpoint at a sampled frame
+        checkpoint = full[len(full) // 2]
+        session = self.Session()
+        video = session.get(SurfVideo, video_id)
+        video.status, video.checkpoint_frame = "processing", checkpoint
+        video.lease_owner, video.lease_expires_at = "dead:9", datetime.utcnow() - timedelta(seconds=1)
+        session.query(SurferFrame).filter(SurferFrame.video_id == video_id,
+                                          SurferFrame.frame_idx > checkpoint).delete()
+        session.commit()
+        session.close()
+
+        self.assertTrue(self.run_video(video_id))
+        self.assertEqual(self.frame_indices(video_id), full)
+        self.assertEqual(self.get(video_id).status, "completed")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import os
+import unittest
+
+import numpy as np
+
+
+def sample(gate, frames, interval):
+    """Walk frames the way process_video does; returns the number of detector calls."""
+    calls, idx = 0, 0
+    while idx < len(frames):
+        if gate is None:
+            calls += 1
+            idx += interval
+            continue
+        run, _ = gate.should_detect(frames[idx])
+        calls += run
+        idx += gate.next_interval()
+    return calls
+
+
+class TestMotionGate(unittest.TestCase):
+    """With default settings the gate never runs the detector more often than plain sampling."""
+
+    def setUp(self):
+        rng = np.random.RandomState(3)
+        self.still = [np.full((90, 160, 3), 120, np.uint8)] * 300
+        self.moving = [rng.randint(0, 255, (90, 160, 3), dtype=np.uint8) for _ in range(300)]
+
+    def test_still_input_skips_detections(self):
+        from app.tasks.motion import MotionGate
+        baseline = sample(None, self.still, 10)
+        gated = sample(MotionGate(base_interval=10, dense_interval=10, max_still=6), self.still, 10)
+        self.assertLess(gated, baseline)
+        self.assertGreater(gated, 1)  # MOTION_MAX_STILL still forces periodic detections
+
+    def test_moving_input_costs_no_more_than_baseline(self):
+        from app.tasks.motion import MotionGate
+        baseline = sample(None, self.moving, 10)
+        gated = sample(MotionGate(base_interval=10, dense_interval=10), self.moving, 10)
+        self.assertEqual(gated, baseline)
+
+    def test_default_dense_interval_is_frame_interval(self):
+        from app.tasks.motion import MOTION_DENSE_INTERVAL, FRAME_INTERVAL, MotionGate
+        if os.getenv("MOTION_DENSE_INTERVAL"):
+            self.skipTest("MOTION_DENSE_INTERVAL is set in the environment")
+        self.assertEqual(MOTION_DENSE_INTERVAL, FRAME_INTERVAL)
+        self.assertEqual(MotionGate().next_interval(), FRAME_INTERVAL)
+
+
+if __name__ == "__main__":
+    unittest.main()
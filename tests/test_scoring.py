@@ -0,0 +1,58 @@
+import unittest
+
+import numpy as np
+
+
+class TestVectorizedScoring(unittest.TestCase):
+    """scoring.decide_block must agree with match._decide_match frame by frame."""
+
+    def setUp(self):
+        from app.tasks.match import _l2_normalize
+        rng = np.random.RandomState(7)
+        self.rng = rng
+        self.norm = _l2_normalize
+        self.faces_map, self.colors_map = {}, {}
+        for uid in range(1, 6):
+            base = _l2_normalize(rng.randn(512).astype(np.float32))
+            entry = {"front": [base], "side": []}
+            if uid % 2:
+                entry["side"].append(_l2_normalize(base + 0.5 * rng.randn(512).astype(np.float32)))
+            self.faces_map[uid] = entry
+            if uid != 3:
+                hist = rng.rand(144).astype(np.float32)
+                self.colors_map[uid] = [hist / hist.sum()]
+        self.colors_map[9] = [np.full(144, 1.0 / 144, dtype=np.float32)]  # color-only user
+
+    def _frames(self, n):
+        faces = np.zeros((n, 512), dtype=np.float32)
+        colors = np.zeros((n, 144), dtype=np.float32)
+        has_face = self.rng.rand(n) > 0.3
+        has_color = self.rng.rand(n) > 0.2
+        for i in range(n):
+            uid = 1 + i % 5
+            noise = 0.005 + 0.06 * self.rng.rand()
+            faces[i] = self.norm(self.faces_map[uid]["front"][0] + noise * self.rng.randn(512).astype(np.float32))
+            hist = self.colors_map.get(uid, self.colors_map[9])[0] + 0.01 * self.rng.rand(144).astype(np.float32)
+            colors[i] = hist / hist.sum()
+        return faces, has_face, colors, has_color
+
+    def test_matches_scalar_rules(self):
+        from app.tasks.match import _decide_match
+        from app.tasks.scoring import Gallery, decide_block
+
+        faces, has_face, colors, has_color = self._frames(200)
+        uids, scores = decide_block(Gallery(self.faces_map, self.colors_map), faces, has_face, colors, has_color)
+        accepted = 0
+        for i in range(len(faces)):
+            f_face = faces[i] if has_face[i] else None
+            f_color = colors[i] if has_color[i] else None
+            uid, score, _ = _decide_match(f_face, f_color, self.faces_map, self.colors_map)
+            self.assertEqual(int(uids[i]), uid, msg=f"frame {i}")
+            self.assertAlmostEqual(float(scores[i]), score, places=4)
+            accepted += bool(uid)
+        self.assertGreater(accepted, 0)
+        self.assertLess(accepted, len(faces))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
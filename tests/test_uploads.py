@@ -0,0 +1,137 @@
+import contextlib
+import hashlib
+import io
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+class TestCompleteUpload(unittest.TestCase):
+    """complete_upload registers a fully received upload; the sweep retries or fails stuck ones."""
+
+    def setUp(self):
+        from app.database import Base
+        from app.models import User
+        sys.path.insert(0, ROOT)
+        from benchmarks.synthetic import make_surf_video
+        self.tmp = tempfile.TemporaryDirectory()
+        self.engine = create_engine("sqlite:///" + os.path.join(self.tmp.name, "t.sqlite"))
+        Base.metadata.create_all(bind=self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        session = self.Session()
+        session.add(User(id=1, username="owner", password="x"))
+        session.commit()
+        session.close()
+        self.videos = os.path.join(self.tmp.name, "videos")
+        os.makedirs(os.path.join(self.videos, ".partial"))
+        self.source = os.path.join(self.tmp.name, "v.mp4")
+        make_surf_video(self.source, seconds=1, fps=10, width=160, height=90, surfers=1)
+        with open(self.source, "rb") as fh:
+            self.data = fh.read()
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.tmp.cleanup()
+
+    def add_upload(self, checksum=None, status="completing", idle_seconds=0, attempts=0):
+        from app.models import VideoUpload
+        upload_id = os.urandom(16).hex()
+        part_path = os.path.join(self.videos, ".partial", f"{upload_id}.part")
+        with open(part_path, "wb") as fh:
+            fh.write(self.data)
+        session = self.Session()
+        session.add(VideoUpload(
+            id=upload_id, user_id=1, length=len(self.data), offset=len(self.data), filename="v.mp4",
+            location="test", checksum=checksum, part_path=part_path, status=status,
+            complete_attempts=attempts, updated_at=datetime.utcnow() - timedelta(seconds=idle_seconds),
+        ))
+        session.commit()
+        session.close()
+        return upload_id
+
+    def get(self, upload_id):
+        from app.models import VideoUpload
+        session = self.Session()
+        upload = session.get(VideoUpload, upload_id)
+        session.expunge(upload)
+        session.close()
+        return upload
+
+    @contextlib.contextmanager
+    def patched(self):
+        import app.tasks.uploads as uploads
+        with mock.patch.object(uploads, "SessionLocal", self.Session), \
+                mock.patch.dict(os.environ, {"VIDEO_UPLOAD_FOLDER": self.videos}), \
+                mock.patch("celery_worker.enqueue_process_video") as enqueue, \
+                mock.patch("app.tasks.uploads.invalidate_user_stats"), \
+                contextlib.redirect_stdout(io.StringIO()):
+            yield uploads, enqueue
+
+    def test_completes_once(self):
+        from app.models import SurfVideo
+        upload_id = self.add_upload(checksum="sha256 " + hashlib.sha256(self.data).hexdigest())
+        with self.patched() as (uploads, enqueue):
+            self.assertTrue(uploads.complete_upload(upload_id))
+            self.assertFalse(uploads.complete_upload(upload_id))
+        upload = self.get(upload_id)
+        self.assertEqual(upload.status, "complete")
+        enqueue.assert_called_once_with(upload.video_id)
+        session = self.Session()
+        video = session.get(SurfVideo, upload.video_id)
+        self.assertEqual((video.status, video.location, video.frame_count), ("pending", "test", 10))
+        session.close()
+        self.assertFalse(os.path.exists(upload.part_path))
+        with open(os.path.join(self.videos, os.path.basename(video.video_path)), "rb") as fh:
+            self.assertEqual(fh.read(), self.data)
+
+    def test_checksum_mismatch_fails(self):
+        upload_id = self.add_upload(checksum="sha256 " + "00" * 32)
+        with self.patched() as (uploads, enqueue):
+            self.assertFalse(uploads.complete_upload(upload_id))
+        upload = self.get(upload_id)
+        self.assertEqual(upload.status, "failed")
+        self.assertIn("checksum", upload.error)
+        self.assertIsNone(upload.video_id)
+        self.assertFalse(os.path.exists(upload.part_path))
+        enqueue.assert_not_called()
+
+    def test_retry_after_broker_failure(self):
+        upload_id = self.add_upload()
+        with self.patched() as (uploads, enqueue):
+            enqueue.side_effect = ConnectionError("broker down")
+            self.assertFalse(uploads.complete_upload(upload_id))
+            first = self.get(upload_id)
+            self.assertEqual(first.status, "completing")
+            self.assertIsNotNone(first.video_id)  # registered and moved; only the enqueue is left
+            enqueue.side_effect = None
+            self.assertTrue(uploads.complete_upload(upload_id))
+        upload = self.get(upload_id)
+        self.assertEqual((upload.status, upload.video_id, upload.complete_attempts), ("complete", first.video_id, 2))
+
+    def test_sweep_retries_then_fails_stuck_completions(self):
+        timeout = 300
+        stuck = self.add_upload(idle_seconds=timeout + 1, attempts=1)
+        exhausted = self.add_upload(idle_seconds=timeout + 1, attempts=3)
+        running = self.add_upload(idle_seconds=timeout - 60, attempts=1)
+        with self.patched() as (uploads, _), \
+                mock.patch.object(uploads, "UPLOAD_COMPLETE_TIMEOUT", timeout), \
+                mock.patch.object(uploads, "UPLOAD_COMPLETE_ATTEMPTS", 3), \
+                mock.patch.object(uploads.complete_upload, "delay") as delay:
+            self.assertEqual(uploads.expire_stale_uploads(), 0)
+            self.assertEqual(uploads.expire_stale_uploads(), 0)
+        delay.assert_called_once_with(stuck)
+        self.assertEqual(self.get(stuck).status, "completing")
+        self.assertEqual(self.get(exhausted).status, "failed")
+        self.assertEqual(self.get(running).status, "completing")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import os
+import struct
+import tempfile
+import unittest
+
+
+def box(kind, payload=b""):
+    return struct.pack(">I4s", 8 + len(payload), kind) + payload
+
+
+def full_box(kind, payload, version=0):
+    return box(kind, bytes([version, 0, 0, 0]) + payload)
+
+
+def video_trak(track_id, samples, timescale=90000, duration=270000):
+    tkhd = full_box(b"tkhd", struct.pack(">IIIII", 0, 0, track_id, 0, duration) + b"\0" * 52
+                    + struct.pack(">II", 1280 << 16, 720 << 16))
+    mdhd = full_box(b"mdhd", struct.pack(">IIII", 0, 0, timescale, duration) + b"\0" * 4)
+    hdlr = full_box(b"hdlr", struct.pack(">I4s", 0, b"vide") + b"\0" * 13)
+    stsd = full_box(b"stsd", struct.pack(">I", 1) + box(b"avc1", b"\0" * 78))
+    stsz = full_box(b"stsz", struct.pack(">II", 0, samples) + b"\0\0\0\x10" * samples)
+    stbl = box(b"stbl", stsd + stsz)
+    return box(b"trak", tkhd + box(b"mdia", mdhd + hdlr + box(b"minf", stbl)))
+
+
+def moof(*trafs):
+    body = b""
+    for track_id, count in trafs:
+        tfhd = full_box(b"tfhd", struct.pack(">I", track_id))
+        trun = full_box(b"trun", struct.pack(">I", count))
+        body += box(b"traf", tfhd + trun)
+    return box(b"moof", body)
+
+
+class TestVideoProbe(unittest.TestCase):
+    """probe_video reads container headers only; compare against known layouts and OpenCV."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _write(self, name, data):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, "wb") as fh:
+            fh.write(data)
+        return path
+
+    def test_mp4_moov_after_mdat(self):
+        from app.video_probe import probe_video
+        mvhd = full_box(b"mvhd", struct.pack(">IIII", 0, 0, 1000, 3000) + b"\0" * 80)
+        data = (box(b"ftyp", b"isom\0\0\0\0isom") + box(b"mdat", b"\0" * 4096)
+                + box(b"moov", mvhd + video_trak(1, 75)))
+        info = probe_video(self._write("a.mp4", data))
+        self.assertEqual(info.container, "mp4")
+        self.assertEqual((info.codec, info.width, info.height), ("avc1", 1280, 720))
+        self.assertEqual(info.frame_count, 75)
+        self.assertAlmostEqual(info.duration, 3.0)
+        self.assertAlmostEqual(info.fps, 25.0)
+
+    def test_fragmented_mp4_counts_video_track_runs(self):
+        from app.video_probe import probe_video
+        mvhd = full_box(b"mvhd", struct.pack(">IIII", 0, 0, 1000, 0) + b"\0" * 80)
+        mvex = box(b"mvex", full_box(b"mehd", struct.pack(">I", 2000)))
+        data = (box(b"ftyp", b"iso5\0\0\0\0iso5") + box(b"moov", mvhd + video_trak(1, 0, duration=0) + mvex)
+                + moof((1, 30), (2, 90)) + box(b"mdat", b"\0" * 64) + moof((1, 20)) + box(b"mdat", b"\0" * 64))
+        info = probe_video(self._write("frag.mp4", data))
+        self.assertEqual(info.frame_count, 50)
+        self.assertAlmostEqual(info.duration, 2.0)
+        self.assertAlmostEqual(info.fps, 25.0)
+
+    def test_rejects_other_files(self):
+        from app.video_probe import probe_video
+        with self.assertRaises(ValueError):
+            probe_video(self._write("x.mp4", b"<html>not a video</html>"))
+        with self.assertRaises(ValueError):
+            probe_video(self._write("y.mp4", box(b"ftyp", b"isom\0\0\0\0") + box(b"mdat", b"\0" * 16)))
+
+    def test_agrees_with_opencv(self):
+        import cv2
+        import numpy as np
+        from app.video_probe import probe_video
+        for name, fourcc in (("c.mp4", "mp4v"), ("c.avi", "MJPG")):
+            path = os.path.join(self.tmp.name, name)
+            writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*fourcc), 20, (160, 96))
+            if not writer.isOpened():
+                self.skipTest(f"OpenCV cannot write {fourcc}")
+            for i in range(23):
+                writer.write(np.full((96, 160, 3), i * 10, np.uint8))
+            writer.release()
+            info = probe_video(path)
+            self.assertEqual((info.width, info.height, info.frame_count), (160, 96, 23), name)
+            self.assertAlmostEqual(info.fps, 20.0, places=3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,28 @@
+import os
+import subprocess
+import sys
+import unittest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+class TestWebImports(unittest.TestCase):
+    """The Flask app (and so every CLI command) must start without the ML / worker stack."""
+
+    def test_create_app_skips_ml_modules(self):
+        sys.path.insert(0, ROOT)
+        from benchmarks.import_time import WEB_FORBIDDEN
+        code = (
+            "import sys\n"
+            "from app import create_app\n"
+            "create_app()\n"
+            f"print(','.join(m for m in {WEB_FORBIDDEN!r} if m in sys.modules))\n"
+        )
+        proc = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True)
+        self.assertEqual(proc.returncode, 0, proc.stderr[-2000:])
+        loaded = proc.stdout.strip().splitlines()[-1] if proc.stdout.strip() else ""
+        self.assertEqual(loaded, "", f"imported at startup: {loaded} (run benchmarks/import_time.py for the chain)")
+
+
+if __name__ == "__main__":
+    unittest.main()